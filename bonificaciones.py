@@ -4,12 +4,14 @@ import pandas as pd
 import streamlit as st
 
 from common import (
-    inject_css, euro_input, eur, fmt_number_es,
-    amortization_schedule,
-    prima_orientativa_bilineal, PRIMA_ING_DF,
-    get_nn_dfs,
+    inject_css, euro_input, eur, fmt_table_es,
+    amortization_schedule, annuity_payment,
+    get_ing_df,
+    tae_batch, insurance_premium_schedule,
     render_footer
 )
+from metricas import timed
+from primas import premium_table, rank_quotes
 
 inject_css()
 
@@ -194,213 +196,302 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-st.divider()
-
-st.markdown(
-    """
-    <div class="param-header">
-      <span class="param-chip">Prima orientativa</span>
-      <span class="param-subtle">
-        Cálculo orientativo de prima en base a capital y edad (referencias a <strong>03/12/2025</strong>)
-      </span>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
-
-# ✅ Primas usan los datos del primer bloque
-edad_primas = int(edad_hipoteca)
-capital_primas = float(principal_b)
-
-col_left, col_right = st.columns(2, gap="large")
+# ---- Primas, resumen y TAE: dependen de la cobertura elegida, que se cambia sin formulario.
+# Van en un fragmento para que cambiar la cobertura solo vuelva a ejecutar este bloque; los cuadros
+# de amortización que necesita llegan ya calculados en 'datos'.
+annual_rate_only_vida = max(float(annual_rate_pct_b - float(bon_vida)), 0.0)
+monthly_payment_only_vida = float(annuity_payment(principal_b, annual_rate_only_vida / 1200.0, n_months_b))
+annual_rate_sin_vida = max(float(annual_rate_pct_b - bon_hogar - bon_otras), 0.0)
+df_sin_vida = amortization_schedule(principal_b, annual_rate_sin_vida / 1200.0, n_months_b)
+datos_primas = {
+    "principal": float(principal_b),
+    "edad": int(edad_hipoteca),
+    "n_meses": int(n_months_b),
+    "tin": float(annual_rate_pct_b),
+    "tin_bonificado": annual_rate_bonif,
+    "tin_sin_vida": annual_rate_sin_vida,
+    "saldo_bonificado": df_bon["Saldo final"].to_numpy(),
+    "saldo_sin_vida": df_sin_vida["Saldo final"].to_numpy(),
+    "ahorro_vida_mes": monthly_payment_base - monthly_payment_only_vida,
+}
+
+@st.fragment
+@timed
+def seccion_primas(datos: dict):
+    """Prima orientativa (banco y aseguradora), resumen de ahorros y TAE con seguro de vida."""
+    st.divider()
 
-# ===== IZQUIERDA: BANCO (ING) =====
-with col_left:
     st.markdown(
         """
-        <div class="prime-block">
-          <div class="prime-title">🏦 Ejemplo primas — Seguro Entidad Bancaria</div>
-          <div class="prime-sub">
-            Prima orientativa calculada en base a <strong>capital</strong> y <strong>edad</strong>.
-            Referencia: <strong>ING</strong> (03/12/2025).
-          </div>
+        <div class="param-header">
+          <span class="param-chip">Prima orientativa</span>
+          <span class="param-subtle">
+            Cálculo orientativo de prima en base a capital y edad (referencias a <strong>03/12/2025</strong>)
+          </span>
         </div>
         """,
         unsafe_allow_html=True
     )
 
-    st.markdown(
-        f"""
-        <div class="soft-box" style="margin-top:.5rem;">
-          <div class="prime-note"><strong>Edad:</strong> {edad_primas} años</div>
-          <div class="prime-note"><strong>Capital:</strong> {eur(capital_primas)}</div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
-
-    prima_ing = None
-    if capital_primas > 400000 or edad_primas > 65:
-        st.warning("⚠️ Nota: cálculos orientativos; pueden no ser acordes a partir de 400.000 € y edades > 65.")
+    # ✅ Primas usan los datos del primer bloque
+    edad_primas = int(datos["edad"])
+    capital_primas = float(datos["principal"])
 
-    if edad_primas <= 0 or capital_primas <= 0:
-        st.info("Introduce una edad y un capital válidos para obtener la prima orientativa.")
-    else:
-        prima_ing = prima_orientativa_bilineal(float(edad_primas), float(capital_primas), PRIMA_ING_DF)
-        st.metric("🧾 Prima orientativa (mensual) — Banco", eur(prima_ing))
+    # Todas las aseguradoras y coberturas cotizadas de una vez (ordenadas de más barata a más cara)
+    cotizaciones = None
+    if edad_primas > 0 and capital_primas > 0:
+        cotizaciones = rank_quotes(float(edad_primas), float(capital_primas))
 
-    st.caption(
-        "Primas orientativas calculadas a 03/12/2025, como ejemplo real de primas de hipotecas con el seguro de ING."
-    )
+    col_left, col_right = st.columns(2, gap="large")
 
-# ===== DERECHA: ASEGURADORA (NN) =====
-with col_right:
-    st.markdown(
-        """
-        <div class="prime-block">
-          <div class="prime-title">🛡️ Ejemplo primas — Aseguradora</div>
-          <div class="prime-sub">
-            Cálculo orientativo (mismo esquema capital/edad) directamente en aseguradora.
-          </div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    # ===== IZQUIERDA: BANCO (ING) =====
+    with col_left:
+        st.markdown(
+            """
+            <div class="prime-block">
+              <div class="prime-title">🏦 Ejemplo primas — Seguro Entidad Bancaria</div>
+              <div class="prime-sub">
+                Prima orientativa calculada en base a <strong>capital</strong> y <strong>edad</strong>.
+                Referencia: <strong>ING</strong> (03/12/2025).
+              </div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
-    st.markdown(
-        f"""
-        <div class="soft-box" style="margin-top:.5rem;">
-          <div class="prime-note"><strong>Edad:</strong> {edad_primas} años</div>
-          <div class="prime-note"><strong>Capital:</strong> {eur(capital_primas)}</div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+        st.markdown(
+            f"""
+            <div class="soft-box" style="margin-top:.5rem;">
+              <div class="prime-note"><strong>Edad:</strong> {edad_primas} años</div>
+              <div class="prime-note"><strong>Capital:</strong> {eur(capital_primas)}</div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
-    # ✅ El input "Cobertura" vive SOLO en el cuadrante derecho
-    cobertura = st.radio(
-        "Cobertura (Aseguradora)",
-        options=["Fallecimiento", "Fallecimiento + Invalidez Absoluta"],
-        horizontal=True,
-        key="cobertura_nn"
-    )
+        prima_ing = None
+        if capital_primas > 400000 or edad_primas > 65:
+            st.warning("⚠️ Nota: cálculos orientativos; pueden no ser acordes a partir de 400.000 € y edades > 65.")
 
-    prima_nn = None
-    if edad_primas <= 0 or capital_primas <= 0:
-        st.info("Introduce una edad y un capital válidos para obtener la prima orientativa.")
-    else:
-        if cobertura == "Fallecimiento + Invalidez Absoluta" and edad_primas >= 60:
-            st.warning("⚠️ Algunas aseguradoras no permiten Invalidez Absoluta a partir de 60 años.")
-            st.info("Selecciona 'Fallecimiento' o reduce la edad para ver una prima orientativa con IA.")
+        if cotizaciones is None:
+            st.info("Introduce una edad y un capital válidos para obtener la prima orientativa.")
         else:
-            NN_FALLEC_DF, NN_FALL_IA_DF = get_nn_dfs()
-            tabla_df = NN_FALL_IA_DF if cobertura == "Fallecimiento + Invalidez Absoluta" else NN_FALLEC_DF
-            prima_nn = prima_orientativa_bilineal(float(edad_primas), float(capital_primas), tabla_df)
-            st.metric("🧾 Prima orientativa (mensual) — Aseguradora", eur(prima_nn))
-
-    st.caption(
-        "Primas orientativas con cálculo del mismo seguro pero directamente en la aseguradora (Nationale Nederlanden). "
-        "Ejemplo para una persona no fumadora, que no usa moto, no practica deporte de riesgo ni tiene trabajo de riesgo."
-    )
-
-st.divider()
-
-# ---- Resumen (3 ahorros)
-annual_rate_only_vida = max(float(annual_rate_pct_b - float(bon_vida)), 0.0)
-r_only_vida_m = (annual_rate_only_vida / 100.0) / 12.0
-df_only_vida = amortization_schedule(principal_b, r_only_vida_m, n_months_b)
-monthly_payment_only_vida = float(df_only_vida["Cuota"].iloc[0]) if not df_only_vida.empty else monthly_payment_base
-
-ahorro_vida_mes = monthly_payment_base - monthly_payment_only_vida
-ahorro_vida_anual = ahorro_vida_mes * 12
-
-ahorro_cambio_aseg_mes = None
-ahorro_cambio_aseg_anual = None
-if (prima_ing is not None) and (prima_nn is not None):
-    ahorro_cambio_aseg_mes = float(prima_ing - prima_nn)
-    ahorro_cambio_aseg_anual = ahorro_cambio_aseg_mes * 12
+            prima_ing = float(cotizaciones.at["ing", "prima"])
+            st.metric("🧾 Prima orientativa (mensual) — Banco", eur(prima_ing))
 
-ahorro_neto_mes = None
-ahorro_neto_anual = None
-if ahorro_cambio_aseg_mes is not None:
-    ahorro_neto_mes = float(ahorro_cambio_aseg_mes - ahorro_vida_mes)
-    ahorro_neto_anual = ahorro_neto_mes * 12
-
-st.markdown(
-    """
-    <div class="param-header">
-      <span class="param-chip">Resumen</span>
-      <span class="param-subtle">Impacto orientativo (bonificación vs precio del seguro).</span>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
-
-s1, s2, s3 = st.columns([1, 1, 1])
-
-with s1:
-    st.markdown(
-        f"""
-        <div class="soft-box">
-          <div class="value-title">💚 Ahorro por bonificación del seguro de vida (solo TIN)</div>
-          <div class="value-big">{eur(ahorro_vida_mes)}/mes</div>
-          <div class="prime-note">{eur(ahorro_vida_anual)}/año</div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+        st.caption(
+            "Primas orientativas calculadas a 03/12/2025, como ejemplo real de primas de hipotecas con el seguro de ING."
+        )
 
-with s2:
-    if ahorro_cambio_aseg_mes is None:
+    # ===== DERECHA: ASEGURADORA (NN) =====
+    with col_right:
         st.markdown(
             """
-            <div class="soft-box">
-              <div class="value-title">🔁 Ahorro por cambio de aseguradora (prima)</div>
-              <div class="value-big">—</div>
-              <div class="prime-note">No hay prima válida en Aseguradora (p.ej. IA con edad ≥ 60).</div>
+            <div class="prime-block">
+              <div class="prime-title">🛡️ Ejemplo primas — Aseguradora</div>
+              <div class="prime-sub">
+                Cálculo orientativo (mismo esquema capital/edad) directamente en aseguradora.
+              </div>
             </div>
             """,
             unsafe_allow_html=True
         )
-    else:
+
         st.markdown(
             f"""
-            <div class="soft-box">
-              <div class="value-title">🔁 Ahorro por cambio de aseguradora (prima)</div>
-              <div class="value-big">{eur(ahorro_cambio_aseg_mes)}/mes</div>
-              <div class="prime-note">{eur(ahorro_cambio_aseg_anual)}/año</div>
+            <div class="soft-box" style="margin-top:.5rem;">
+              <div class="prime-note"><strong>Edad:</strong> {edad_primas} años</div>
+              <div class="prime-note"><strong>Capital:</strong> {eur(capital_primas)}</div>
             </div>
             """,
             unsafe_allow_html=True
         )
 
-with s3:
-    if ahorro_neto_mes is None:
-        st.markdown(
-            """
-            <div class="highlight-total">
-              <div class="k">✨ Ahorro con cambio de aseguradora (restando bonificaciones)</div>
-              <div class="v">—</div>
-              <div class="prime-note">Pendiente de una prima válida en el bloque de Aseguradora.</div>
-            </div>
-            """,
-            unsafe_allow_html=True
+        # ✅ El input "Cobertura" vive SOLO en el cuadrante derecho
+        cobertura = st.radio(
+            "Cobertura (Aseguradora)",
+            options=["Fallecimiento", "Fallecimiento + Invalidez Absoluta"],
+            horizontal=True,
+            key="cobertura_nn"
+        )
+
+        prima_nn = None
+        tabla_nn = "nn_fallecimiento_ia" if cobertura == "Fallecimiento + Invalidez Absoluta" else "nn_fallecimiento"
+        if cotizaciones is None:
+            st.info("Introduce una edad y un capital válidos para obtener la prima orientativa.")
+        else:
+            if not cotizaciones.at[tabla_nn, "admitida"]:
+                st.warning("⚠️ Algunas aseguradoras no permiten Invalidez Absoluta a partir de 60 años.")
+                st.info("Selecciona 'Fallecimiento' o reduce la edad para ver una prima orientativa con IA.")
+            else:
+                prima_nn = float(cotizaciones.at[tabla_nn, "prima"])
+                st.metric("🧾 Prima orientativa (mensual) — Aseguradora", eur(prima_nn))
+
+        st.caption(
+            "Primas orientativas con cálculo del mismo seguro pero directamente en la aseguradora (Nationale Nederlanden). "
+            "Ejemplo para una persona no fumadora, que no usa moto, no practica deporte de riesgo ni tiene trabajo de riesgo."
         )
-    else:
+
+    if cotizaciones is not None:
+        with st.expander(f"📋 Todas las aseguradoras y coberturas ({len(cotizaciones)})"):
+            ranking = pd.DataFrame({
+                "Aseguradora": cotizaciones["aseguradora"].to_numpy(),
+                "Cobertura": cotizaciones["cobertura"].to_numpy(),
+                "Prima mensual": cotizaciones["prima"].to_numpy(),
+                "Prima anual": cotizaciones["prima_anual"].to_numpy(),
+                "Referencia": pd.to_datetime(cotizaciones["fecha"]).to_numpy(),
+                "Nota": np.where(
+                    ~cotizaciones["admitida"], "No admite esta edad",
+                    np.where(cotizaciones["extrapolada"], "Fuera de tabla (extrapolada)", ""),
+                ),
+            })
+            st.dataframe(
+                fmt_table_es(ranking, {"Prima mensual": "eur", "Prima anual": "eur", "Referencia": "fecha"}),
+                use_container_width=True,
+                hide_index=True
+            )
+            st.caption("Ordenadas de más barata a más cara para la edad y el capital del primer bloque.")
+
+    st.divider()
+
+    # ---- Resumen (3 ahorros)
+    ahorro_vida_mes = datos["ahorro_vida_mes"]
+    ahorro_vida_anual = ahorro_vida_mes * 12
+
+    ahorro_cambio_aseg_mes = None
+    ahorro_cambio_aseg_anual = None
+    if (prima_ing is not None) and (prima_nn is not None):
+        ahorro_cambio_aseg_mes = float(prima_ing - prima_nn)
+        ahorro_cambio_aseg_anual = ahorro_cambio_aseg_mes * 12
+
+    ahorro_neto_mes = None
+    ahorro_neto_anual = None
+    if ahorro_cambio_aseg_mes is not None:
+        ahorro_neto_mes = float(ahorro_cambio_aseg_mes - ahorro_vida_mes)
+        ahorro_neto_anual = ahorro_neto_mes * 12
+
+    st.markdown(
+        """
+        <div class="param-header">
+          <span class="param-chip">Resumen</span>
+          <span class="param-subtle">Impacto orientativo (bonificación vs precio del seguro).</span>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+
+    s1, s2, s3 = st.columns([1, 1, 1])
+
+    with s1:
         st.markdown(
             f"""
-            <div class="highlight-total">
-              <div class="k">✨ Ahorro con cambio de aseguradora (restando bonificaciones)</div>
-              <div class="v">{eur(ahorro_neto_anual)}/año</div>
-              <div class="prime-note">{eur(ahorro_neto_mes)}/mes — <strong>este es el dato clave (colofón)</strong>.</div>
+            <div class="soft-box">
+              <div class="value-title">💚 Ahorro por bonificación del seguro de vida (solo TIN)</div>
+              <div class="value-big">{eur(ahorro_vida_mes)}/mes</div>
+              <div class="prime-note">{eur(ahorro_vida_anual)}/año</div>
             </div>
             """,
             unsafe_allow_html=True
         )
 
-st.caption(
-    "Lectura del resumen: el 'Ahorro neto' asume que si cambias el seguro de vida fuera del banco podrías perder "
-    "la bonificación por vida (por eso se resta el ahorro del TIN atribuible a esa bonificación)."
-)
+    with s2:
+        if ahorro_cambio_aseg_mes is None:
+            st.markdown(
+                """
+                <div class="soft-box">
+                  <div class="value-title">🔁 Ahorro por cambio de aseguradora (prima)</div>
+                  <div class="value-big">—</div>
+                  <div class="prime-note">No hay prima válida en Aseguradora (p.ej. IA con edad ≥ 60).</div>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+        else:
+            st.markdown(
+                f"""
+                <div class="soft-box">
+                  <div class="value-title">🔁 Ahorro por cambio de aseguradora (prima)</div>
+                  <div class="value-big">{eur(ahorro_cambio_aseg_mes)}/mes</div>
+                  <div class="prime-note">{eur(ahorro_cambio_aseg_anual)}/año</div>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+
+    with s3:
+        if ahorro_neto_mes is None:
+            st.markdown(
+                """
+                <div class="highlight-total">
+                  <div class="k">✨ Ahorro con cambio de aseguradora (restando bonificaciones)</div>
+                  <div class="v">—</div>
+                  <div class="prime-note">Pendiente de una prima válida en el bloque de Aseguradora.</div>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+        else:
+            st.markdown(
+                f"""
+                <div class="highlight-total">
+                  <div class="k">✨ Ahorro con cambio de aseguradora (restando bonificaciones)</div>
+                  <div class="v">{eur(ahorro_neto_anual)}/año</div>
+                  <div class="prime-note">{eur(ahorro_neto_mes)}/mes — <strong>este es el dato clave (colofón)</strong>.</div>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+
+    st.caption(
+        "Lectura del resumen: el 'Ahorro neto' asume que si cambias el seguro de vida fuera del banco podrías perder "
+        "la bonificación por vida (por eso se resta el ahorro del TIN atribuible a esa bonificación)."
+    )
+
+    # ---- TAE de las dos alternativas (una sola llamada batch)
+    st.markdown("### 📈 TAE con seguro de vida incluido")
+
+    n_meses = datos["n_meses"]
+    # (alternativa, TIN, tabla de primas, saldo pendiente con ese TIN)
+    ofertas_tae = [
+        ("Sin bonificar (sin seguro de vida)", datos["tin"], None, None),
+        ("Bonificada + seguro de vida del banco (ING)", datos["tin_bonificado"], get_ing_df(), datos["saldo_bonificado"]),
+    ]
+    if prima_nn is not None:
+        ofertas_tae.append(
+            ("Sin bonif. de vida + seguro en aseguradora (NN)", datos["tin_sin_vida"], premium_table(tabla_nn), datos["saldo_sin_vida"])
+        )
+
+    primas_tae = np.zeros((len(ofertas_tae), n_meses))
+    for i, (_, _, tabla, saldo_oferta) in enumerate(ofertas_tae):
+        if tabla is not None and edad_primas > 0:
+            primas_tae[i] = insurance_premium_schedule(saldo_oferta, capital_primas, edad_primas, tabla)
+
+    taes = tae_batch(
+        np.full(len(ofertas_tae), capital_primas),
+        np.array([o[1] for o in ofertas_tae]) / 1200.0,
+        np.full(len(ofertas_tae), n_meses),
+        primas_mensuales=primas_tae,
+    )
+    tae_df = pd.DataFrame({
+        "Alternativa": [o[0] for o in ofertas_tae],
+        "TIN": [o[1] / 100.0 for o in ofertas_tae],
+        "TAE (incl. prima de vida)": taes,
+        "Primas totales del seguro": primas_tae.sum(axis=1),
+    })
+    st.dataframe(
+        fmt_table_es(tae_df, {
+            "TIN": "pct",
+            "TAE (incl. prima de vida)": "pct",
+            "Primas totales del seguro": "eur",
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.caption(
+        "La prima del seguro se recalcula cada año con la edad alcanzada y el capital pendiente (tablas orientativas; "
+        "fuera de rango se extrapola). No incluye comisiones ni otros gastos."
+    )
+
+seccion_primas(datos_primas)
 
 render_footer()
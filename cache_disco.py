@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+# Caché de resultados compartida entre procesos del mismo host: SQLite en disco con arrays en binario (sin Streamlit).
+import atexit
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Configuración por variables de entorno (todas opcionales):
+# - SIMULADOR_CACHE: "0" desactiva la caché (se calcula siempre).
+# - SIMULADOR_CACHE_PATH: fichero SQLite; por defecto fuera del directorio de la app para que sobreviva a los despliegues.
+# - SIMULADOR_CACHE_MAX_MB: tamaño máximo de los resultados guardados (se expulsan los menos usados recientemente).
+# - SIMULADOR_CACHE_WARM_FROM: caché de un despliegue anterior para arrancar en caliente si la actual está vacía.
+CACHE_ENABLED = os.environ.get("SIMULADOR_CACHE", "1") != "0"
+CACHE_PATH = os.environ.get(
+    "SIMULADOR_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "simulador_hipoteca", "resultados.sqlite")
+)
+CACHE_MAX_BYTES = int(float(os.environ.get("SIMULADOR_CACHE_MAX_MB", "256")) * 1024 * 1024)
+CACHE_WARM_FROM = os.environ.get("SIMULADOR_CACHE_WARM_FROM", "")
+# Espera máxima por el bloqueo de escritura al guardar un resultado nuevo
+CONNECT_TIMEOUT_S = 5.0
+# Al superar el máximo se expulsa hasta quedar en esta fracción (evita expulsar en cada escritura)
+EVICT_TARGET = 0.9
+# Versión del formato del payload: cambiarla invalida todas las entradas
+PAYLOAD_VERSION = "1"
+# Aciertos pendientes de anotar (uso y contador): se escriben en lote como mucho cada HIT_FLUSH_S segundos,
+# esperando como mucho HIT_BUSY_TIMEOUT_MS si otro proceso tiene el bloqueo (si no, se reintenta en el siguiente)
+HIT_FLUSH_S = 5.0
+HIT_BUSY_TIMEOUT_MS = 20
+MAX_PENDING_HITS = 10000
+# Cada proceso suma lo que escribe y recuenta el tamaño real en la base cada SIZE_RECOUNT_WRITES escrituras
+SIZE_RECOUNT_WRITES = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resultados (
+    clave TEXT PRIMARY KEY,
+    funcion TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    bytes INTEGER NOT NULL,
+    usado REAL NOT NULL,
+    aciertos INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS resultados_usado ON resultados (usado);
+"""
+
+class _Unsupported(TypeError):
+    """Argumento o resultado que no sabemos serializar: se calcula sin caché."""
+
+# ============================
+# Conexión (una por hilo; WAL para lectores y escritores de varios procesos a la vez)
+# ============================
+_local = threading.local()
+_disabled_paths = set()
+
+def _connect(path: str = None):
+    path = path or CACHE_PATH
+    if path in _disabled_paths:
+        return None
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is not None:
+        return conn
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=CONNECT_TIMEOUT_S, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        if CACHE_WARM_FROM and path == CACHE_PATH:
+            _warm_start(conn, CACHE_WARM_FROM)
+    except (sqlite3.Error, OSError):
+        # Disco de solo lectura, fichero corrupto...: la app sigue funcionando sin caché
+        _disabled_paths.add(path)
+        return None
+    conns[path] = conn
+    return conn
+
+def _warm_start(conn, previous: str):
+    """Si la caché está vacía, copia las entradas más recientes de la caché anterior (hasta el tamaño máximo)."""
+    if not os.path.exists(previous) or os.path.abspath(previous) == os.path.abspath(CACHE_PATH):
+        return
+    if conn.execute("SELECT COUNT(*) FROM resultados").fetchone()[0]:
+        return
+    conn.execute("ATTACH DATABASE ? AS anterior", (previous,))
+    try:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO resultados (clave, funcion, payload, bytes, usado, aciertos)
+            SELECT clave, funcion, payload, bytes, usado, 0 FROM (
+                SELECT *, SUM(bytes) OVER (ORDER BY usado DESC) AS acumulado FROM anterior.resultados
+            ) WHERE acumulado <= ?
+            """,
+            (int(CACHE_MAX_BYTES * EVICT_TARGET),),
+        )
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.execute("DETACH DATABASE anterior")
+
+# ============================
+# Claves: función + versión declarada + argumentos
+# ============================
+def _feed_key(h, obj):
+    """Añade obj al hash de forma estable (tipo + contenido)."""
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        h.update(f"{type(obj).__name__}:{obj!r};".encode())
+    elif isinstance(obj, (np.generic,)):
+        _feed_key(h, obj.item())
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "O":
+            raise _Unsupported("array de objetos")
+        h.update(f"nd:{obj.dtype.str}:{obj.shape};".encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(f"pd:{type(obj).__name__}:{obj.shape};".encode())
+        _feed_key(h, [str(c) for c in getattr(obj, "columns", [obj.name])])
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, (date, datetime)):
+        h.update(f"{type(obj).__name__}:{obj.isoformat()};".encode())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}[{len(obj)}](".encode())
+        for v in obj:
+            _feed_key(h, v)
+        h.update(b")")
+    elif isinstance(obj, dict):
+        h.update(f"dict[{len(obj)}](".encode())
+        for k in sorted(obj, key=str):
+            _feed_key(h, k)
+            _feed_key(h, obj[k])
+        h.update(b")")
+    else:
+        raise _Unsupported(type(obj).__name__)
+
+def _cache_key(name: str, version: str, args, kwargs) -> str:
+    h = hashlib.sha256(f"{PAYLOAD_VERSION}:{name}:{version};".encode())
+    _feed_key(h, list(args))
+    _feed_key(h, dict(kwargs))
+    return h.hexdigest()
+
+# ============================
+# Payload: cabecera JSON + buffers crudos de los arrays (sin pickle)
+# ============================
+def _encode(obj, buffers: list, offset: list):
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return {"t": "v", "v": obj}
+    if isinstance(obj, np.generic):
+        return _encode(np.asarray(obj), buffers, offset) | {"t": "s"}
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "O":
+            raise _Unsupported("array de objetos")
+        data = np.ascontiguousarray(obj).tobytes()
+        pad = (-offset[0]) % 8  # alineado a 8 bytes para leer sin copias intermedias
+        buffers.append(b"\0" * pad + data)
+        offset[0] += pad
+        spec = {"t": "a", "d": obj.dtype.str, "s": list(obj.shape), "o": offset[0], "n": len(data)}
+        offset[0] += len(data)
+        return spec
+    if isinstance(obj, pd.DataFrame):
+        return {
+            "t": "df",
+            "c": [_encode(c, buffers, offset) for c in obj.columns],
+            "v": [_encode(obj.iloc[:, i].to_numpy(), buffers, offset) for i in range(obj.shape[1])],
+            "i": _encode_index(obj.index, buffers, offset),
+            "in": obj.index.name,
+        }
+    if isinstance(obj, (list, tuple)):
+        return {"t": "l" if isinstance(obj, list) else "u", "v": [_encode(v, buffers, offset) for v in obj]}
+    if isinstance(obj, dict):
+        if not all(isinstance(k, str) for k in obj):
+            raise _Unsupported("dict con claves no str")
+        return {"t": "d", "k": list(obj), "v": [_encode(v, buffers, offset) for v in obj.values()]}
+    raise _Unsupported(type(obj).__name__)
+
+def _encode_index(index: pd.Index, buffers: list, offset: list):
+    if isinstance(index, pd.RangeIndex):
+        return {"t": "r", "v": [index.start, index.stop, index.step]}
+    return _encode(index.to_numpy(), buffers, offset)
+
+def _decode(spec, blob: memoryview):
+    t = spec["t"]
+    if t == "v":
+        return spec["v"]
+    if t in ("a", "s"):
+        dtype = np.dtype(spec["d"])
+        arr = np.frombuffer(blob, dtype=dtype, count=spec["n"] // dtype.itemsize if dtype.itemsize else 0,
+                            offset=spec["o"]).reshape(spec["s"]).copy()
+        return arr[()] if t == "s" else arr
+    if t == "df":
+        if spec["i"]["t"] == "r":
+            index = pd.RangeIndex(*spec["i"]["v"])
+        else:
+            index = pd.Index(_decode(spec["i"], blob))
+        index.name = spec["in"]
+        columns = [_decode(c, blob) for c in spec["c"]]
+        df = pd.DataFrame({i: _decode(v, blob) for i, v in enumerate(spec["v"])}, index=index)
+        df.columns = columns
+        return df
+    if t == "l":
+        return [_decode(v, blob) for v in spec["v"]]
+    if t == "u":
+        return tuple(_decode(v, blob) for v in spec["v"])
+    if t == "d":
+        return {k: _decode(v, blob) for k, v in zip(spec["k"], spec["v"])}
+    raise ValueError(f"Tipo de payload desconocido: {t}")
+
+def pack(obj) -> bytes:
+    """Serializa un resultado: 4 bytes con la longitud de la cabecera, cabecera JSON y arrays en crudo."""
+    buffers, offset = [], [0]
+    header = json.dumps(_encode(obj, buffers, offset), separators=(",", ":")).encode()
+    head = len(header).to_bytes(4, "little") + header
+    pad = (-len(head)) % 8
+    return head + b"\0" * pad + b"".join(buffers)
+
+def unpack(payload: bytes):
+    n = int.from_bytes(payload[:4], "little")
+    spec = json.loads(payload[4:4 + n])
+    start = 4 + n + (-(4 + n)) % 8
+    return _decode(spec, memoryview(payload)[start:])
+
+# ============================
+# Lectura / escritura / expulsión
+# ============================
+_pending_hits = {}  # clave -> (último uso, aciertos)
+_hits_lock = threading.Lock()
+_last_flush = [time.monotonic()]
+
+def _get(conn, key: str):
+    row = conn.execute("SELECT payload FROM resultados WHERE clave = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    with _hits_lock:
+        _, n = _pending_hits.get(key, (0.0, 0))
+        _pending_hits[key] = (time.time(), n + 1)
+    if time.monotonic() - _last_flush[0] >= HIT_FLUSH_S:
+        flush_hits(conn)
+    return row[0]
+
+def flush_hits(conn=None):
+    """
+    Anota en la base los aciertos pendientes en una sola transacción. Es orientativo (solo decide qué se expulsa):
+    si la base está ocupada por otro proceso no se espera, se deja para el siguiente intento.
+    """
+    with _hits_lock:
+        _last_flush[0] = time.monotonic()
+        pendientes = list(_pending_hits.items())
+        _pending_hits.clear()
+    if not pendientes:
+        return
+    conn = conn or _connect()
+    if conn is None:
+        return
+    try:
+        conn.execute(f"PRAGMA busy_timeout = {HIT_BUSY_TIMEOUT_MS}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE resultados SET usado = MAX(usado, ?), aciertos = aciertos + ? WHERE clave = ?",
+                [(usado, n, key) for key, (usado, n) in pendientes],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.OperationalError:
+        # Ocupada: se devuelven a la cola (sin crecer sin límite si la base sigue bloqueada)
+        with _hits_lock:
+            for key, (usado, n) in pendientes:
+                if len(_pending_hits) >= MAX_PENDING_HITS:
+                    break
+                u0, n0 = _pending_hits.get(key, (0.0, 0))
+                _pending_hits[key] = (max(u0, usado), n0 + n)
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {int(CONNECT_TIMEOUT_S * 1000)}")
+
+atexit.register(flush_hits)
+
+_size = {"bytes": None, "escrituras": 0}
+_size_lock = threading.Lock()
+
+def _stored_bytes(conn) -> int:
+    return conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM resultados").fetchone()[0]
+
+def _put(conn, key: str, name: str, payload: bytes):
+    conn.execute(
+        "INSERT OR REPLACE INTO resultados (clave, funcion, payload, bytes, usado) VALUES (?, ?, ?, ?, ?)",
+        (key, name, sqlite3.Binary(payload), len(payload), time.time()),
+    )
+    # Tamaño total estimado: lo que este proceso ha escrito desde el último recuento (otros procesos también
+    # escriben, por eso se recuenta cada SIZE_RECOUNT_WRITES escrituras y antes de expulsar)
+    with _size_lock:
+        _size["escrituras"] += 1
+        recount = _size["bytes"] is None or _size["escrituras"] % SIZE_RECOUNT_WRITES == 0
+        total = None if recount else _size["bytes"] + len(payload)
+    if total is None or total > CACHE_MAX_BYTES:
+        total = _stored_bytes(conn)
+        if total > CACHE_MAX_BYTES:
+            evict(conn, int(CACHE_MAX_BYTES * EVICT_TARGET))
+            total = _stored_bytes(conn)
+    with _size_lock:
+        _size["bytes"] = total
+
+def evict(conn=None, target_bytes: int = None) -> int:
+    """Expulsa las entradas usadas hace más tiempo hasta quedar en target_bytes. Devuelve cuántas se borraron."""
+    conn = conn or _connect()
+    if conn is None:
+        return 0
+    target_bytes = int(CACHE_MAX_BYTES * EVICT_TARGET) if target_bytes is None else target_bytes
+    cur = conn.execute(
+        """
+        DELETE FROM resultados WHERE clave IN (
+            SELECT clave FROM (
+                SELECT clave, SUM(bytes) OVER (ORDER BY usado DESC) AS acumulado FROM resultados
+            ) WHERE acumulado > ?
+        )
+        """,
+        (target_bytes,),
+    )
+    return cur.rowcount
+
+def cache_stats(path: str = None) -> dict:
+    """Entradas, bytes y aciertos por función (para diagnóstico)."""
+    conn = _connect(path)
+    if conn is None:
+        return {}
+    rows = conn.execute(
+        "SELECT funcion, COUNT(*), SUM(bytes), SUM(aciertos) FROM resultados GROUP BY funcion ORDER BY 3 DESC"
+    ).fetchall()
+    return {f: {"entradas": n, "bytes": b, "aciertos": a} for f, n, b, a in rows}
+
+def clear_cache(path: str = None):
+    conn = _connect(path)
+    if conn is not None:
+        conn.execute("DELETE FROM resultados")
+
+def disk_cache(fn=None, *, version: str = "1", when=None):
+    """
+    Decorador: guarda el resultado de fn en la caché compartida, con clave (función, version, argumentos).
+    - version: versión del cálculo de fn; súbela cuando cambie lo que devuelve. La clave no depende del código
+      fuente, así que un despliegue que no la toque reutiliza (y arranca en caliente con) los resultados del anterior.
+    - when(argumentos) -> bool, con los argumentos por nombre y sus valores por defecto: si esta llamada merece
+      caché. Las variantes de fórmula cerrada cuestan lo mismo que leerlas de SQLite: se calculan directamente.
+    Admite escalares, fechas, arrays numéricos, DataFrames y dicts/listas/tuplas de ellos; con cualquier otra
+    cosa (o si la caché no está disponible) simplemente calcula. Admite @disk_cache y @disk_cache(version=...).
+    Cada llamada devuelve objetos nuevos: el llamador puede modificarlos sin afectar a la caché.
+    """
+    if fn is None:
+        return functools.partial(disk_cache, version=version, when=when)
+    if not CACHE_ENABLED:
+        return fn
+    name = f"{fn.__module__}.{fn.__qualname__}"
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            # Argumentos por nombre y con sus valores por defecto: f(1, 2) y f(1, b=2) comparten entrada
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+        except TypeError:
+            return fn(*args, **kwargs)
+        if when is not None and not when(bound.arguments):
+            return fn(*args, **kwargs)
+        conn = _connect()
+        if conn is None:
+            return fn(*args, **kwargs)
+        try:
+            key = _cache_key(name, str(version), (), bound.arguments)
+        except _Unsupported:
+            return fn(*args, **kwargs)
+        try:
+            payload = _get(conn, key)
+        except sqlite3.Error:
+            payload = None
+        if payload is not None:
+            return unpack(payload)
+        result = fn(*args, **kwargs)
+        try:
+            _put(conn, key, name, pack(result))
+        except (_Unsupported, sqlite3.Error):
+            pass
+        return result
+
+    wrapper.uncached = fn
+    return wrapper
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Calentamiento del proceso servidor: imports pesados, tablas de primas y escenario por defecto de cada página,
+# registrando cuánto tarda cada paso. Lo que se calienta vive en la memoria del proceso (módulos, tablas, rutas de
+# NumPy/pandas ya ejecutadas); en la caché en disco compartida (cache_disco) solo quedan los pocos cálculos que
+# guarda disk_cache. Por eso se calienta el mismo proceso que sirve, antes de aceptar conexiones:
+#     python calentamiento.py [opciones de "streamlit run"]
+# calienta y arranca streamlit_app.py en este proceso. Con "streamlit run streamlit_app.py" a secas, la app
+# lanza warm_process() en segundo plano la primera vez que se ejecuta, sin hacer esperar a esa sesión.
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+# Páginas con cálculo (la de publicidad es estática)
+WARMUP_PAGES = [
+    "simulador.py",
+    "trae_tu_fija.py",
+    "simulador_mixta.py",
+    "trae_tu_mixta.py",
+    "bonificaciones.py",
+    "comparador.py",
+    "inversion.py",
+    "cartera.py",
+]
+# Tiempo máximo del calentamiento de páginas: si se supera, las restantes se dejan para el primer usuario
+WARMUP_BUDGET_S = float(os.environ.get("SIMULADOR_WARMUP_BUDGET_S", "60"))
+
+logger = logging.getLogger("calentamiento")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+@contextmanager
+def _step(nombre: str, tiempos: dict):
+    """Cronometra un paso, lo registra y guarda su duración (s) en tiempos; un fallo no para el calentamiento."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        logger.exception("%s: falló", nombre)
+    finally:
+        tiempos[nombre] = time.perf_counter() - t0
+        logger.info("%s: %.0f ms", nombre, tiempos[nombre] * 1000)
+
+_warm_lock = threading.Lock()
+_warm_done = False
+
+def warm_process() -> dict:
+    """
+    Lo que cada proceso necesita en memoria: imports pesados y tablas de primas. Devuelve {paso: segundos}.
+    Solo trabaja la primera vez en cada proceso (las siguientes devuelven {} al instante).
+    """
+    global _warm_done
+    with _warm_lock:
+        if _warm_done:
+            return {}
+        _warm_done = True
+    tiempos = {}
+    with _step("import plotly", tiempos):
+        import plotly.graph_objects  # noqa: F401
+    with _step("import motores (common, inversion_calc, exportacion, importacion)", tiempos):
+        import common  # noqa: F401
+        import exportacion  # noqa: F401
+        import importacion  # noqa: F401
+        import inversion_calc  # noqa: F401
+    with _step("tablas de primas (compilar y mapear)", tiempos):
+        import primas
+        primas.compile_all()
+        primas.premium_index()
+    return tiempos
+
+def start_warm_process() -> threading.Thread:
+    """Lanza warm_process() en un hilo de fondo (para llamarlo una vez por proceso desde streamlit_app)."""
+    hilo = threading.Thread(target=warm_process, name="calentamiento", daemon=True)
+    hilo.start()
+    return hilo
+
+def warm_pages(pages=WARMUP_PAGES, budget_s: float = WARMUP_BUDGET_S, timeout: float = 60) -> dict:
+    """
+    Ejecuta cada página sin navegador (streamlit.testing) con sus valores por defecto, en este proceso: hace las
+    llamadas de un usuario nuevo (imports de cada página, tablas, primeras ejecuciones de los motores y las
+    entradas de disk_cache que correspondan). Usar antes de arrancar el servidor, no con sesiones en curso.
+    Devuelve {paso: segundos}.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    tiempos = {}
+    inicio = time.perf_counter()
+    for page in pages:
+        if time.perf_counter() - inicio > budget_s:
+            logger.warning("Presupuesto de %.0f s agotado: sin calentar %s", budget_s, ", ".join(pages[pages.index(page):]))
+            break
+        with _step(f"página {page}", tiempos):
+            at = AppTest.from_file(str(APP_DIR / page), default_timeout=timeout).run()
+            if at.exception:
+                logger.warning("%s: excepción en la página: %s", page, at.exception[0].value)
+    return tiempos
+
+def warm_up(pages=WARMUP_PAGES, budget_s: float = WARMUP_BUDGET_S) -> dict:
+    """Calentamiento completo (proceso + páginas) con el total al final."""
+    t0 = time.perf_counter()
+    tiempos = {**warm_process(), **warm_pages(pages, budget_s)}
+    logger.info("Calentamiento completo: %.2f s en %d pasos", time.perf_counter() - t0, len(tiempos))
+    return tiempos
+
+def serve(args=()):
+    """Calienta este proceso y arranca en él streamlit_app.py (args: opciones de "streamlit run")."""
+    warm_up()
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", str(APP_DIR / "streamlit_app.py"), *args]
+    sys.exit(cli.main())
+
+if __name__ == "__main__":
+    serve(sys.argv[1:])
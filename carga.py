@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+# Prueba de carga sin navegador: N sesiones simuladas recorren a la vez las páginas de streamlit_app.py repitiendo
+# secuencias de uso reales (arrastrar el slider de plazo, enviar formularios, cambiar la cobertura) y se mide cada
+# ejecución de la página. Informe: latencia por ejecución (p50/p95/p99, total y por página), ejecuciones por
+# segundo y CPU y memoria de cada sesión. Uso:
+#     python carga.py --sesiones 8 --rondas 3 [--pausa 0.5] [--paginas simulador.py comparador.py] [--json informe.json]
+# Cada sesión corre en su propio proceso: streamlit.testing sustituye el Runtime global mientras ejecuta una página,
+# así que no admite dos sesiones a la vez en el mismo proceso. Cada proceso se calienta antes de empezar (como un
+# servidor recién arrancado) y las sesiones arrancan juntas; las cachés en memoria no se comparten entre sesiones
+# (en el servidor sí), así que las latencias son algo pesimistas. Los fragmentos se ejecutan como página completa.
+import argparse
+import ast
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: sin CPU ni pico de memoria por sesión
+    resource = None
+
+APP_DIR = Path(__file__).resolve().parent
+APP_SCRIPT = APP_DIR / "streamlit_app.py"
+PERCENTILES = (50, 95, 99)
+
+logger = logging.getLogger("carga")
+
+# ============================
+# Escenarios por página
+# ============================
+# Acción = (descripción, [(tipo de widget, clave, valor)], formulario a enviar o None). Cada acción es una ejecución
+# de la página: los widgets de un formulario no la provocan hasta pulsar su botón de envío.
+def _drag(tipo: str, clave: str, valores, formulario: str = None) -> list:
+    """Una acción por valor: arrastrar un slider, teclear en un campo o alternar un radio/selectbox."""
+    return [(f"{clave}={v}", [(tipo, clave, v)], formulario) for v in valores]
+
+SCENARIOS = {
+    "simulador.py": _drag("slider", "y_sim", (26, 28, 30, 35, 20), "params_form_sim"),
+    "trae_tu_fija.py": _drag("number_input", "ttf_r_new", (2.30, 2.10, 1.95), "form_new_offer"),
+    "simulador_mixta.py": _drag("slider", "change_year_mix", (3, 7, 10), "params_form_mixta"),
+    "trae_tu_mixta.py": _drag("number_input", "ttm_euribor_new", (2.80, 2.50, 3.20), "form_new_mixed"),
+    "bonificaciones.py": _drag(
+        "radio", "cobertura_nn", ("Fallecimiento + Invalidez Absoluta", "Fallecimiento") * 2
+    ),
+    "comparador.py": [
+        (f"y_change={y}, r1_mixed={r}", [("slider", "y_change", y), ("number_input", "r1_mixed", r)],
+         "params_form_cmp_mixed")
+        for y, r in ((3, 2.20), (7, 2.60), (10, 2.90))
+    ],
+    "inversion.py": _drag("selectbox", "comunidad_inv", ("Comunidad de Madrid", "Cataluña", "Andalucía")),
+    "cartera.py": _drag("number_input", "horizonte_cartera", (10, 25, 15), "params_form_cartera"),
+}
+
+def app_pages(path: Path = APP_SCRIPT) -> list[str]:
+    """Scripts de las páginas registradas con st.Page en streamlit_app.py, en el orden del menú."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    pages = []
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "Page"
+            and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)
+        ):
+            pages.append(node.args[0].value)
+    return sorted(set(pages), key=pages.index)
+
+# ============================
+# Una sesión (en su proceso)
+# ============================
+def _rss_bytes() -> int | None:
+    """Memoria residente actual del proceso (Linux); None si no se puede leer."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _cpu_seconds() -> float:
+    """CPU (usuario + sistema) de todos los hilos del proceso."""
+    if resource is None:
+        return time.process_time()
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+def _apply(at, cambios, formulario):
+    """Asigna los valores en la sesión y, si van en un formulario, pulsa su botón de envío (sin ejecutar)."""
+    for tipo, clave, valor in cambios:
+        getattr(at, tipo)(key=clave).set_value(valor)
+    if formulario is None:
+        return
+    envios = [b for b in at.button if b.proto.form_id == formulario]
+    if not envios:
+        raise LookupError(f"Sin botón de envío para el formulario {formulario!r}")
+    envios[0].click()
+
+def _run_session(sesion: int, pages: list, rondas: int, pausa: float, semilla: int, timeout: float, barrera, cola):
+    """Calienta el proceso, espera a las demás sesiones y recorre las páginas; manda el resultado por la cola."""
+    from streamlit.testing.v1 import AppTest
+
+    import calentamiento
+
+    logging.getLogger("calentamiento").setLevel(logging.WARNING)
+    calentamiento.warm_process()
+    rng = random.Random(semilla + sesion)
+    ejecuciones = []
+
+    def ejecutar(at, pagina, accion):
+        t0 = time.perf_counter()
+        at.run()
+        ejecuciones.append({
+            "sesion": sesion,
+            "pagina": pagina,
+            "accion": accion,
+            "segundos": time.perf_counter() - t0,
+            "excepciones": [e.message for e in at.exception],
+        })
+        if pausa:
+            time.sleep(rng.uniform(0.5, 1.5) * pausa)
+
+    at = AppTest.from_file(str(APP_SCRIPT), default_timeout=timeout)
+    barrera.wait()
+    rss0, cpu0 = _rss_bytes(), _cpu_seconds()
+    for _ in range(rondas):
+        for pagina in pages:
+            at.switch_page(pagina)
+            ejecutar(at, pagina, "apertura")
+            for accion, cambios, formulario in SCENARIOS.get(pagina, []):
+                try:
+                    _apply(at, cambios, formulario)
+                except (KeyError, LookupError) as exc:
+                    # Widget o formulario que la página ya no tiene: se anota y se sigue con el resto
+                    ejecuciones.append({
+                        "sesion": sesion, "pagina": pagina, "accion": accion, "segundos": None,
+                        "excepciones": [f"escenario: {exc}"],
+                    })
+                    continue
+                ejecutar(at, pagina, accion)
+    cola.put({
+        "sesion": sesion,
+        "ejecuciones": ejecuciones,
+        "cpu_s": _cpu_seconds() - cpu0,
+        "rss_inicial": rss0,
+        "rss_final": _rss_bytes(),
+        # ru_maxrss: KiB en Linux
+        "rss_pico": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None,
+        "fin": time.perf_counter(),
+    })
+
+# ============================
+# Orquestación e informe
+# ============================
+def run_load(sesiones: int = 4, rondas: int = 1, pages: list = None, pausa: float = 0.0, semilla: int = 0,
+             timeout: float = 120) -> dict:
+    """
+    Lanza las sesiones a la vez y devuelve {'sesiones': [...], 'segundos': duración desde que arrancan todas}.
+    Cada sesión: {'sesion', 'ejecuciones' [{pagina, accion, segundos, excepciones}], 'cpu_s', 'rss_*' (bytes)}.
+    """
+    pages = list(pages or app_pages())
+    ctx = mp.get_context("spawn")
+    barrera, cola = ctx.Barrier(sesiones + 1), ctx.Queue()
+    procesos = [
+        ctx.Process(
+            target=_run_session, args=(i, pages, rondas, pausa, semilla, timeout, barrera, cola),
+            name=f"carga-{i}", daemon=True,
+        )
+        for i in range(sesiones)
+    ]
+    for p in procesos:
+        p.start()
+    barrera.wait()
+    t0 = time.perf_counter()
+    resultados = []
+    while len(resultados) < sesiones:
+        if not any(p.is_alive() for p in procesos) and cola.empty():
+            logger.error("Han terminado %d de %d sesiones sin resultado", sesiones - len(resultados), sesiones)
+            break
+        try:
+            resultados.append(cola.get(timeout=1))
+        except queue.Empty:
+            continue
+    for p in procesos:
+        p.join()
+    fin = max((r["fin"] for r in resultados), default=t0)
+    return {"sesiones": sorted(resultados, key=lambda r: r["sesion"]), "segundos": fin - t0}
+
+def _latency_stats(segundos) -> dict:
+    s = np.asarray([x for x in segundos if x is not None], dtype=float) * 1000
+    if not s.size:
+        return {"ejecuciones": 0}
+    out = {"ejecuciones": int(s.size), "media_ms": round(float(s.mean()), 1)}
+    out.update({f"p{q}_ms": round(float(v), 1) for q, v in zip(PERCENTILES, np.percentile(s, PERCENTILES))})
+    out["max_ms"] = round(float(s.max()), 1)
+    return out
+
+def summarize(resultado: dict) -> dict:
+    """Informe: 'global', 'paginas' {página: latencias}, 'sesiones' [CPU y memoria] y 'errores'."""
+    ejecuciones = [e for r in resultado["sesiones"] for e in r["ejecuciones"]]
+    medidas = [e for e in ejecuciones if e["segundos"] is not None]
+    mb = 1024 * 1024
+    sesiones = []
+    for r in resultado["sesiones"]:
+        n = sum(e["segundos"] is not None for e in r["ejecuciones"])
+        sesiones.append({
+            "sesion": r["sesion"],
+            "ejecuciones": n,
+            "cpu_s": round(r["cpu_s"], 2),
+            "cpu_ms_por_ejecucion": round(r["cpu_s"] / n * 1000, 1) if n else None,
+            "rss_inicial_mb": round(r["rss_inicial"] / mb, 1) if r["rss_inicial"] else None,
+            "rss_final_mb": round(r["rss_final"] / mb, 1) if r["rss_final"] else None,
+            "rss_incremento_mb": (
+                round((r["rss_final"] - r["rss_inicial"]) / mb, 1) if r["rss_inicial"] and r["rss_final"] else None
+            ),
+            "rss_pico_mb": round(r["rss_pico"] / mb, 1) if r["rss_pico"] else None,
+        })
+    paginas = {}
+    for e in medidas:
+        paginas.setdefault(e["pagina"], []).append(e["segundos"])
+    segundos = resultado["segundos"]
+    return {
+        "global": {
+            "sesiones": len(resultado["sesiones"]),
+            "duracion_s": round(segundos, 2),
+            "ejecuciones_por_s": round(len(medidas) / segundos, 2) if segundos > 0 else None,
+            **_latency_stats(e["segundos"] for e in medidas),
+            "cpu_s": round(sum(s["cpu_s"] for s in sesiones), 2),
+        },
+        "paginas": {p: _latency_stats(v) for p, v in paginas.items()},
+        "sesiones": sesiones,
+        "errores": [
+            {"sesion": e["sesion"], "pagina": e["pagina"], "accion": e["accion"], "mensaje": m}
+            for e in ejecuciones for m in e["excepciones"]
+        ],
+    }
+
+def format_report(informe: dict) -> str:
+    g = informe["global"]
+    if not g["ejecuciones"]:
+        return "Ninguna sesión terminó: revisa los errores de los procesos más arriba."
+    lineas = [
+        f"{g['sesiones']} sesiones, {g['ejecuciones']} ejecuciones en {g['duracion_s']:.1f} s "
+        f"({g['ejecuciones_por_s']} ejecuciones/s, CPU total {g['cpu_s']:.1f} s)",
+        "Latencia (ms): " + ", ".join(f"p{q} {g[f'p{q}_ms']:.0f}" for q in PERCENTILES) + f", máx. {g['max_ms']:.0f}",
+        "",
+        "Por página:",
+        pd.DataFrame.from_dict(informe["paginas"], orient="index").to_string(),
+        "",
+        "Por sesión:",
+        pd.DataFrame(informe["sesiones"]).set_index("sesion").to_string(),
+    ]
+    if informe["errores"]:
+        lineas += ["", f"Errores ({len(informe['errores'])}):"]
+        lineas += [f"- sesión {e['sesion']}, {e['pagina']} [{e['accion']}]: {e['mensaje']}" for e in informe["errores"][:20]]
+    return "\n".join(lineas)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga sin navegador de las páginas del simulador.")
+    parser.add_argument("--sesiones", type=int, default=4, help="sesiones simultáneas (un proceso cada una)")
+    parser.add_argument("--rondas", type=int, default=1, help="vueltas de cada sesión por todas las páginas")
+    parser.add_argument("--paginas", nargs="+", help="páginas a recorrer (por defecto, todas las del menú)")
+    parser.add_argument("--pausa", type=float, default=0.0, help="tiempo medio de reflexión entre acciones (s)")
+    parser.add_argument("--semilla", type=int, default=0, help="semilla de las pausas aleatorias")
+    parser.add_argument("--timeout", type=float, default=120, help="tiempo máximo de una ejecución (s)")
+    parser.add_argument("--json", help="guarda también el informe completo en este fichero")
+    args = parser.parse_args(argv)
+
+    pages = app_pages()
+    if args.paginas:
+        desconocidas = sorted(set(args.paginas) - set(pages))
+        if desconocidas:
+            parser.error(f"páginas no registradas en streamlit_app.py: {', '.join(desconocidas)}")
+        pages = args.paginas
+    informe = summarize(run_load(args.sesiones, args.rondas, pages, args.pausa, args.semilla, args.timeout))
+    print(format_report(informe))
+    if args.json:
+        Path(args.json).write_text(json.dumps(informe, ensure_ascii=False, indent=1), encoding="utf-8")
+    return 1 if informe["errores"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
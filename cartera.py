@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+from common import (
+    inject_css, eur, fmt_number_es, fmt_table_es, parse_number_es_array, render_footer, download_on_demand
+)
+from exportacion import export_bytes, iter_batch_schedules
+from inversion_calc import PORTFOLIO_COLUMNS, get_regions, portfolio_projection, region_index
+from metricas import timer
+
+inject_css()
+
+# Tabla de impuestos vigente, la misma en toda la ejecución (se recarga sola si cambia el fichero)
+regiones = get_regions()
+comunidades = list(regiones["nombre"])
+
+st.title("🏘️ Cartera de Inversión")
+st.caption(
+    "Analiza varios inmuebles a la vez: aportación inicial (ITP/AJD de cada comunidad), hipoteca y cashflow "
+    "de cada uno, y el agregado de la cartera (cashflow mensual, deuda, patrimonio, apalancamiento y TIR)."
+)
+
+def fmt_pct(x: float) -> str:
+    if x is None or (isinstance(x, float) and np.isnan(x)):
+        return "—"
+    return f"{fmt_number_es(x * 100, 2)} %"
+
+CARTERA_EJEMPLO = pd.DataFrame(
+    [
+        ["Piso centro", "Comunidad de Madrid", 200000.0, 80, 2.7, 30, 1000.0, 1350.0, 0.0],
+        ["Estudio playa", "Comunidad Valenciana", 120000.0, 70, 3.0, 25, 700.0, 900.0, 5000.0],
+        ["Dúplex", "Andalucía", 260000.0, 90, 2.9, 30, 1300.0, 1800.0, 0.0],
+    ],
+    columns=PORTFOLIO_COLUMNS,
+)
+
+# -----------------------------
+# 1) Inmuebles
+# -----------------------------
+st.markdown(
+    """
+    <div class="param-header">
+      <span class="param-chip">1) Inmuebles</span>
+      <span class="param-subtle">Edita la tabla o carga un CSV/XLSX con las mismas columnas.</span>
+    </div>
+    """,
+    unsafe_allow_html=True
+)
+
+subida = st.file_uploader(
+    "Cargar cartera (CSV con ';' y decimales con coma, o XLSX)",
+    type=["csv", "xlsx"],
+    key="cartera_file"
+)
+if subida is not None:
+    if subida.name.lower().endswith(".xlsx"):
+        cartera_base = pd.read_excel(subida, dtype=object)
+    else:
+        cartera_base = pd.read_csv(subida, sep=";", dtype=str, keep_default_na=False)
+    faltan = [c for c in PORTFOLIO_COLUMNS if c not in cartera_base.columns]
+    if faltan:
+        st.error(f"Faltan columnas en el fichero: {', '.join(faltan)}. Se usa la cartera de ejemplo.")
+        cartera_base = CARTERA_EJEMPLO
+    else:
+        cartera_base = cartera_base[PORTFOLIO_COLUMNS].copy()
+        # Columnas numéricas en formato ES ("150.000,50 €") de una vez; las celdas ilegibles se avisan por fila
+        ilegibles = {}
+        for col in PORTFOLIO_COLUMNS[2:]:
+            valores, validos = parse_number_es_array(cartera_base[col])
+            vacias = cartera_base[col].isna().to_numpy() | (cartera_base[col].astype(str).str.strip() == "").to_numpy()
+            for fila in np.flatnonzero(~validos & ~vacias):
+                ilegibles.setdefault(fila + 2, []).append(col)  # +2: cabecera y numeración desde 1
+            cartera_base[col] = valores
+        if ilegibles:
+            st.warning(
+                "Valores no numéricos (se dejan vacíos): "
+                + "; ".join(f"fila {fila}: {', '.join(cols)}" for fila, cols in sorted(ilegibles.items())[:20])
+                + (" …" if len(ilegibles) > 20 else "")
+            )
+else:
+    cartera_base = CARTERA_EJEMPLO
+
+cartera_df = st.data_editor(
+    cartera_base,
+    num_rows="dynamic",
+    use_container_width=True,
+    hide_index=True,
+    key="cartera_editor",
+    column_config={
+        "Comunidad": st.column_config.SelectboxColumn("Comunidad", options=list(comunidades), required=True),
+        "Precio": st.column_config.NumberColumn("Precio (€)", min_value=0.0, format="%.2f"),
+        "Financiación (%)": st.column_config.NumberColumn("Financiación (%)", min_value=0, max_value=100),
+        "TIN (%)": st.column_config.NumberColumn("TIN (%)", min_value=0.0, max_value=30.0, format="%.2f"),
+        "Plazo (años)": st.column_config.NumberColumn("Plazo (años)", min_value=1, max_value=40),
+        "Alquiler mensual": st.column_config.NumberColumn("Alquiler mensual (€)", min_value=0.0, format="%.2f"),
+        "Gastos anuales": st.column_config.NumberColumn("Gastos anuales (€)", min_value=0.0, format="%.2f"),
+        "Aportación extra": st.column_config.NumberColumn("Aportación extra (€)", min_value=0.0, format="%.2f"),
+    },
+)
+
+# -----------------------------
+# 2) Supuestos comunes
+# -----------------------------
+st.markdown(
+    """
+    <div class="param-header">
+      <span class="param-chip">2) Supuestos de la cartera</span>
+      <span class="param-subtle">Se aplican a todos los inmuebles.</span>
+    </div>
+    """,
+    unsafe_allow_html=True
+)
+
+with st.form("params_form_cartera", clear_on_submit=False):
+    c1, c2, c3, c4, c5 = st.columns(5)
+    with c1:
+        horizonte_cartera = st.number_input(
+            "Horizonte (años)", min_value=1, max_value=40, value=20, step=1, key="horizonte_cartera"
+        )
+    with c2:
+        subida_alq_cartera = st.number_input(
+            "Subida anual del alquiler (%)", min_value=-10.0, max_value=20.0, value=2.0, step=0.1,
+            format="%.2f", key="subida_alq_cartera"
+        )
+    with c3:
+        inflacion_cartera = st.number_input(
+            "Inflación anual de gastos (%)", min_value=-10.0, max_value=20.0, value=2.0, step=0.1,
+            format="%.2f", key="inflacion_cartera"
+        )
+    with c4:
+        reval_cartera = st.number_input(
+            "Revalorización anual (%)", min_value=-20.0, max_value=20.0, value=2.0, step=0.1,
+            format="%.2f", key="reval_cartera"
+        )
+    with c5:
+        gastos_venta_cartera = st.number_input(
+            "Gastos de venta (%)", min_value=0.0, max_value=20.0, value=5.0, step=0.5,
+            format="%.2f", key="gastos_venta_cartera"
+        )
+    _ = st.form_submit_button("✅ Calcular cartera")
+
+# Filas válidas (sin nulos y con comunidad conocida)
+datos = cartera_df.dropna(subset=PORTFOLIO_COLUMNS[1:8]).copy()
+datos["Aportación extra"] = datos["Aportación extra"].fillna(0.0)
+datos = datos[datos["Comunidad"].isin(comunidades) & (datos["Precio"] > 0) & (datos["Plazo (años)"] >= 1)]
+descartadas = len(cartera_df) - len(datos)
+if descartadas > 0:
+    st.warning(f"{descartadas} fila(s) incompletas o con comunidad desconocida se han ignorado.")
+if datos.empty:
+    st.info("Añade al menos un inmueble válido para ver el análisis de la cartera.")
+    render_footer()
+    st.stop()
+
+idx_region = region_index(datos["Comunidad"].to_numpy(), regiones)
+res = portfolio_projection(
+    precio=datos["Precio"].to_numpy(dtype=float),
+    pct_financiacion=datos["Financiación (%)"].to_numpy(dtype=float),
+    tin_pct=datos["TIN (%)"].to_numpy(dtype=float),
+    plazo_anios=datos["Plazo (años)"].to_numpy(dtype=int),
+    alquiler_mensual=datos["Alquiler mensual"].to_numpy(dtype=float),
+    gastos_anuales=datos["Gastos anuales"].to_numpy(dtype=float),
+    itp=regiones["itp"][idx_region],
+    ajd=regiones["ajd"][idx_region],
+    aportacion_extra=datos["Aportación extra"].to_numpy(dtype=float),
+    horizonte_anios=int(horizonte_cartera),
+    subida_alquiler=subida_alq_cartera / 100.0,
+    inflacion_gastos=inflacion_cartera / 100.0,
+    revalorizacion=reval_cartera / 100.0,
+    gastos_venta=gastos_venta_cartera / 100.0,
+)
+
+st.divider()
+
+# -----------------------------
+# 3) Resultados de la cartera
+# -----------------------------
+st.markdown("## 📊 Cartera")
+
+valor_inicial = float(datos["Precio"].sum())
+apalancamiento_inicial = float(
+    (datos["Precio"] * datos["Financiación (%)"] / 100.0).sum() / valor_inicial
+) if valor_inicial > 0 else np.nan
+
+k1, k2, k3, k4, k5 = st.columns(5)
+k1.metric("🏠 Inmuebles", f"{len(datos)}")
+k2.metric("💰 Aportación inicial total", eur(res["cartera_aportacion"]))
+k3.metric("🏦 Apalancamiento inicial (deuda / valor)", fmt_pct(apalancamiento_inicial))
+k4.metric("💧 Cashflow cartera (año 1)", eur(float(res["cartera_cashflow"][:12].sum())))
+k5.metric("📌 TIR cartera (con venta)", fmt_pct(res["cartera_tir"]))
+
+n_years = int(horizonte_cartera)
+anual = pd.DataFrame({
+    "Año": np.arange(1, n_years + 1),
+    "Cashflow": res["cartera_cashflow"].reshape(n_years, 12).sum(axis=1),
+    "Deuda": res["cartera_deuda"].reshape(n_years, 12)[:, -1],
+    "Valor inmuebles": res["cartera_valor"].reshape(n_years, 12)[:, -1],
+    "Patrimonio neto": res["cartera_patrimonio"].reshape(n_years, 12)[:, -1],
+    "Apalancamiento": res["cartera_apalancamiento"].reshape(n_years, 12)[:, -1],
+})
+
+with timer("cartera.graficos"):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=anual["Año"], y=anual["Cashflow"], name="Cashflow anual"))
+    fig.add_trace(go.Scatter(x=anual["Año"], y=anual["Patrimonio neto"], name="Patrimonio neto"))
+    fig.add_trace(go.Scatter(x=anual["Año"], y=anual["Deuda"], name="Deuda viva"))
+    fig.add_trace(go.Scatter(
+        x=anual["Año"], y=anual["Apalancamiento"] * 100, name="Apalancamiento (%)", yaxis="y2", line=dict(dash="dot")
+    ))
+    fig.update_layout(
+        title="Cartera por año: cashflow, patrimonio neto, deuda y apalancamiento",
+        xaxis_title="Año",
+        yaxis=dict(title="€"),
+        yaxis2=dict(title="%", overlaying="y", side="right", showgrid=False),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+with st.expander("🔍 Cartera por año (detalle)", expanded=False):
+    st.dataframe(
+        fmt_table_es(anual, {
+            "Cashflow": "eur", "Deuda": "eur", "Valor inmuebles": "eur", "Patrimonio neto": "eur", "Apalancamiento": "pct"
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
+
+st.markdown("### 🏘️ Detalle por inmueble")
+detalle = pd.DataFrame({
+    "Inmueble": datos["Inmueble"].to_numpy(),
+    "Comunidad": datos["Comunidad"].to_numpy(),
+    "Aportación inicial": res["Aportación total"],
+    "Cuota mensual": res["Cuota"],
+    "Cashflow año 1": res["Cashflow anual (año 1)"],
+    "TIR (con venta)": res["TIR"],
+})
+st.dataframe(
+    fmt_table_es(detalle, {
+        "Aportación inicial": "eur", "Cuota mensual": "eur", "Cashflow año 1": "eur", "TIR (con venta)": "pct"
+    }),
+    use_container_width=True,
+    hide_index=True
+)
+
+cuadros = datos[["Inmueble", "Precio", "Financiación (%)", "TIN (%)", "Plazo (años)"]]
+download_on_demand(
+    "Cuadros de amortización de todos los inmuebles",
+    lambda fmt: export_bytes(iter_batch_schedules(
+        cuadros["Precio"].to_numpy(dtype=float) * cuadros["Financiación (%)"].to_numpy(dtype=float) / 100.0,
+        cuadros["TIN (%)"].to_numpy(dtype=float) / 1200.0,
+        cuadros["Plazo (años)"].to_numpy(dtype=int) * 12,
+        ids=cuadros["Inmueble"].astype(str).to_numpy(),
+    ), fmt),
+    "cartera_cuadros_amortizacion",
+    key="exp_cartera",
+    firma=int(pd.util.hash_pandas_object(cuadros, index=False).sum()),
+    formats=("csv",),
+)
+
+st.caption(
+    "Supuestos: compra de todos los inmuebles en el mes 0 y venta al final del horizonte. Gastos fijos de compra "
+    "y comisión de apertura como en «Analiza Inversión». No incluye vacancias, IRPF ni otros ajustes."
+)
+
+render_footer()
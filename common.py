@@ -4,6 +4,10 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 
+from cache_disco import disk_cache
+from metricas import timed
+from primas import premium_table
+
 # ----------------------------
 # ESTILOS (Tabs + Parámetros sticky + caja gris + valores grandes + footer)
 # ----------------------------
@@ -213,6 +217,94 @@ def fmt_number_es(x: float, decimals: int = 2) -> str:
 def eur(x: float) -> str:
     return f"{fmt_number_es(x, 2)} €"
 
+def fmt_number_es_array(x, decimals: int = 2, nan: str = "—") -> np.ndarray:
+    """
+    fmt_number_es para un array completo, sin bucle por celda:
+    - se redondea a enteros en la unidad del último decimal (int64) y se separan parte entera y decimales
+      (las mitades exactas se resuelven como f"{x:.2f}");
+    - la parte entera se agrupa de 3 en 3 rellenando a 18 dígitos y quitando los ceros/puntos iniciales;
+    - NaN/inf -> 'nan' ("—" por defecto). Devuelve un array de str con la misma forma.
+    - Valores con 18 dígitos o más en la unidad del último decimal (no caben en la plantilla ni en int64)
+      se formatean uno a uno con fmt_number_es.
+    """
+    x = np.asarray(x, dtype=float)
+    finite = np.isfinite(x).ravel()
+    scale = 10 ** decimals
+    scaled = np.abs(np.where(finite, x.ravel(), 0.0)) * scale
+    big = np.flatnonzero(scaled >= 1e18)
+    scaled[big] = 0.0
+    units = np.rint(scaled).astype(np.int64)
+    # Mitades exactas tras multiplicar (p. ej. 0,005 * 100): se decide con el valor decimal real
+    ties = np.flatnonzero(scaled - np.floor(scaled) == 0.5)
+    if ties.size:
+        units[ties] = [round(float(f"{abs(v):.{decimals}f}") * scale) for v in x.ravel()[ties]]
+    int_part = (units // scale).astype("U18")
+    digits = np.char.zfill(int_part, 18).astype("U18").view("U1").reshape(-1, 6, 3)
+    dots = np.full(digits.shape[:2] + (1,), ".", dtype="U1")
+    grouped = np.ascontiguousarray(np.concatenate([digits, dots], axis=2).reshape(-1, 24)[:, :-1])
+    out = np.char.lstrip(grouped.view("U23")[:, 0], "0.")
+    out = np.where(out == "", "0", out)
+    if decimals > 0:
+        frac = np.char.zfill((units % scale).astype(f"U{decimals}"), decimals)
+        out = np.char.add(np.char.add(out, ","), frac)
+    # Signo solo si el valor redondeado no es cero (nunca "-0,00")
+    out = np.where((x.ravel() < 0) & (units > 0), np.char.add("-", out), out)
+    out = np.where(finite, out, nan)
+    if big.size:
+        out = out.astype(object)
+        out[big] = [fmt_number_es(v, decimals) for v in x.ravel()[big]]
+        out = out.astype(str)
+    return out.reshape(x.shape)
+
+def fmt_date_es_array(dates, nan: str = "—") -> np.ndarray:
+    """Fechas (datetime64 o similares) -> 'DD/MM/AAAA', reordenando los caracteres de la fecha ISO."""
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    iso = np.ascontiguousarray(np.datetime_as_string(dates.ravel()).astype("U10"))
+    chars = iso.view("U1").reshape(-1, 10)[:, [8, 9, 7, 5, 6, 4, 0, 1, 2, 3]].copy()
+    chars[:, [2, 5]] = "/"
+    out = np.ascontiguousarray(chars).view("U10")[:, 0]
+    return np.where(np.isnat(dates.ravel()), nan, out).reshape(dates.shape)
+
+def fmt_column_es(values, kind: str = "eur", decimals: int = 2, nan: str = "—", trim_zeros: bool = False) -> np.ndarray:
+    """
+    Columna completa (array o Series) a texto ES de una vez, sin callbacks por celda:
+    - "eur": 1.234,56 € · "num": 1.234,56 · "pct": fracción -> 12,34 % · "fecha": DD/MM/AAAA;
+    - NaN -> nan ("—"); los textos que no son números se dejan tal cual;
+    - trim_zeros: quita ceros decimales sobrantes ("6,00 %" -> "6 %").
+    """
+    if kind == "fecha":
+        return fmt_date_es_array(values, nan)
+    raw = np.asarray(values, dtype=object if isinstance(values, pd.Series) else None)
+    numbers = pd.to_numeric(pd.Series(raw.ravel()), errors="coerce").to_numpy(dtype=float)
+    is_text = np.isnan(numbers) & ~pd.isna(pd.Series(raw.ravel())).to_numpy()
+    if kind == "pct":
+        numbers = numbers * 100.0
+    out = fmt_number_es_array(numbers, decimals, nan="")
+    if trim_zeros and decimals > 0:
+        out = np.char.rstrip(np.char.rstrip(out, "0"), ",")
+    suffix = {"eur": " €", "pct": " %"}.get(kind, "")
+    out = np.where(np.isfinite(numbers), np.char.add(out, suffix), nan)
+    out = np.where(is_text, raw.ravel().astype(str), out)
+    return out.reshape(raw.shape)
+
+# Formato de las columnas de un cuadro de amortización
+SCHEDULE_FORMATS = {"Fecha": "fecha", "Cuota": "eur", "Intereses": "eur", "Amortización": "eur", "Saldo final": "eur"}
+
+@timed
+def fmt_table_es(df: pd.DataFrame, formats: dict) -> pd.DataFrame:
+    """
+    Copia de df con las columnas indicadas ya formateadas como texto ES (para st.dataframe).
+    formats: {columna: tipo de fmt_column_es} o {columna: dict de argumentos de fmt_column_es};
+    las columnas que no estén en df se ignoran.
+    """
+    out = df.copy()
+    for col, spec in formats.items():
+        if col not in out.columns:
+            continue
+        kwargs = spec if isinstance(spec, dict) else {"kind": spec}
+        out[col] = fmt_column_es(df[col], **kwargs)
+    return out
+
 def parse_number_es(s: str):
     """Acepta '150.000', '150000', '150.000,50', '150000,50', '150000.50', etc."""
     if s is None:
@@ -239,6 +331,73 @@ def parse_number_es(s: str):
     except Exception:
         return None
 
+_POW10_INT = 10 ** np.arange(19, dtype=np.int64)
+
+def parse_number_es_array(values):
+    """
+    parse_number_es para columnas completas (array, lista o Series) sin bucle por celda: los textos se
+    tratan como una matriz de códigos de carácter y se aplican las mismas reglas ('€', espacios y demás
+    caracteres fuera; con ',' -> decimal ES y '.' de miles; solo '.' y último grupo de 3 dígitos -> miles).
+    El número se monta con los dígitos como entero (int64) / 10^decimales, igual que float().
+    Los valores ya numéricos se respetan.
+    Devuelve (valores float64 con NaN donde no se pudo leer, máscara de válidos).
+    """
+    raw = np.asarray(values)
+    if raw.dtype.kind != "U":
+        raw = raw.astype(object)
+    flat = raw.ravel()
+    if raw.dtype.kind == "U" or pd.api.types.infer_dtype(flat, skipna=False) == "string":
+        is_text = np.ones(flat.size, dtype=bool)
+    else:
+        is_text = np.fromiter((isinstance(v, str) for v in flat), dtype=bool, count=flat.size)
+    out = np.full(flat.size, np.nan)
+    out[~is_text] = pd.to_numeric(pd.Series(flat[~is_text], dtype=object), errors="coerce").to_numpy(dtype=float)
+
+    texts = flat[is_text].astype(str)
+    if texts.size and texts.dtype.itemsize:
+        width = texts.dtype.itemsize // 4
+        codes = np.ascontiguousarray(texts).view(np.uint32).reshape(-1, width)
+        codes = np.where(codes < 128, codes, 0).astype(np.uint8)  # solo interesan caracteres ASCII
+        digit = (codes >= 48) & (codes <= 57)
+        keep = digit | (codes == 44) | (codes == 46) | (codes == 45)
+        # Compacta cada fila quitando los caracteres no permitidos (orden estable)
+        order = np.argsort(~keep, axis=1, kind="stable")
+        codes = np.where(np.take_along_axis(keep, order, axis=1), np.take_along_axis(codes, order, axis=1), 0)
+        digit = (codes >= 48) & (codes <= 57)
+        comma, dot, minus = codes == 44, codes == 46, codes == 45
+        length = (codes > 0).sum(axis=1)
+
+        has_dot = dot.any(axis=1)
+        last_dot = width - 1 - np.argmax(dot[:, ::-1], axis=1)
+        es_mode = comma.any(axis=1) | (has_dot & (length - last_dot - 1 == 3))
+        sep = np.where(es_mode[:, None], comma, dot)
+        dropped = es_mode[:, None] & dot
+
+        # Validez como float(): un separador decimal como mucho, '-' solo al principio y algún dígito
+        pos = np.arange(width)[None, :] - np.cumsum(dropped, axis=1, dtype=np.int16)
+        ok = (sep.sum(axis=1) <= 1) & (minus.sum(axis=1) <= 1) & ~(minus & (pos > 0)).any(axis=1)
+        n_digits = digit.sum(axis=1)
+        ok &= n_digits > 0
+
+        digits_after = n_digits[:, None] - np.cumsum(digit, axis=1, dtype=np.int16)
+        exact = n_digits <= 15
+        powers = _POW10_INT[np.clip(digits_after, 0, 18)]
+        mantissa = (np.where(digit, codes - 48, 0).astype(np.int64) * powers).sum(axis=1)
+        after_sep = np.cumsum(sep, axis=1, dtype=np.int16) > 0
+        decimals = (digit & after_sep).sum(axis=1)
+        value = mantissa / 10.0 ** decimals
+        value = np.where(minus.any(axis=1), -value, value)
+        parsed = np.where(ok, value, np.nan)
+
+        # Más de 15 dígitos: se delega en el parser escalar (casos raros)
+        for i in np.flatnonzero(ok & ~exact):
+            v = parse_number_es(texts[i])
+            parsed[i] = np.nan if v is None else v
+        out[is_text] = parsed
+
+    valid = np.isfinite(out)
+    return out.reshape(raw.shape), valid.reshape(raw.shape)
+
 def euro_input(
     label: str,
     key: str,
@@ -271,6 +430,40 @@ def euro_input(
         val = min(val, float(max_value))
     return float(val)
 
+EXPORT_FORMATS = {
+    "csv": ("CSV", "text/csv"),
+    "xlsx": ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+def download_on_demand(label: str, build, file_stem: str, key: str, firma, formats=tuple(EXPORT_FORMATS)):
+    """
+    Descarga generada solo cuando se pide: selector de formato + botón "Preparar".
+    - build(fmt) -> bytes se llama al pulsar "Preparar", no en cada ejecución de la página;
+    - el fichero se guarda en la sesión junto a firma (entradas de las que depende) y el formato: si cambian,
+      se vuelve a pedir "Preparar" en vez de descargar un fichero desactualizado.
+    """
+    c1, c2 = st.columns([1, 2])
+    with c1:
+        fmt = st.selectbox(
+            "Formato", formats, format_func=lambda f: EXPORT_FORMATS[f][0], key=f"{key}_fmt",
+            label_visibility="collapsed"
+        ) if len(formats) > 1 else formats[0]
+    with c2:
+        slot = st.empty()
+    preparado = st.session_state.get(f"{key}_fichero")
+    if preparado is None or preparado[0] != (firma, fmt):
+        if not slot.button(f"📦 Preparar {label} ({EXPORT_FORMATS[fmt][0]})", key=f"{key}_preparar"):
+            return
+        preparado = ((firma, fmt), build(fmt))
+        st.session_state[f"{key}_fichero"] = preparado
+    slot.download_button(
+        f"⬇️ {label} ({EXPORT_FORMATS[fmt][0]})",
+        data=preparado[1],
+        file_name=f"{file_stem}.{fmt}",
+        mime=EXPORT_FORMATS[fmt][1],
+        key=f"{key}_{fmt}"
+    )
+
 def render_footer():
     st.markdown(
         """
@@ -285,87 +478,448 @@ def render_footer():
         unsafe_allow_html=True
     )
 
+# ============================
+# Núcleo de anualidades (log1p/expm1: estable cerca de r = 0 y válido con tipos negativos)
+# ============================
+def _expm1_ratio(x):
+    """(e^x - 1) / x, con valor exacto 1 en x = 0."""
+    x = np.asarray(x, dtype=float)
+    safe = np.where(x == 0, 1.0, x)
+    return np.where(x == 0, 1.0, np.expm1(safe) / safe)
+
+def _log1p_ratio(r):
+    """log(1 + r) / r, con valor exacto 1 en r = 0."""
+    r = np.asarray(r, dtype=float)
+    safe = np.where(r == 0, 1.0, r)
+    return np.where(r == 0, 1.0, np.log1p(safe) / safe)
+
+def annuity_factors(r_m, k):
+    """
+    Factores de la renta francesa a tipo mensual r_m tras k meses (escalares o arrays, por broadcasting):
+    - crecimiento: (1 + r)^k
+    - acumulación: ((1 + r)^k - 1) / r   (vale k en r = 0)
+    - descuento:   (1 - (1 + r)^-k) / r  (vale k en r = 0; valor actual de una cuota de 1 €)
+    Sin ramas por r == 0 y sin cancelación cerca de cero; admite tipos negativos (r > -1).
+    """
+    r = np.asarray(r_m, dtype=float)
+    k = np.asarray(k, dtype=float)
+    with np.errstate(over="ignore", invalid="ignore"):
+        x = k * np.log1p(r)
+        ratio = _log1p_ratio(r)
+        growth = np.exp(x)
+        accum = k * _expm1_ratio(x) * ratio
+        disc = k * _expm1_ratio(-x) * ratio
+    return growth, accum, disc
+
 # ============================
 # Utilidades amortización
 # ============================
-def amortization_schedule(P: float, r_m: float, n: int) -> pd.DataFrame:
-    """Cuadro de amortización con tipo mensual constante r_m durante n meses."""
+GRACE_TYPES = {
+    "interest_only": "Carencia de capital (solo intereses)",
+    "full": "Carencia total (intereses capitalizados)",
+}
+
+def _segment_balances(P, r, n, months, grace_months, grace_type, balloon):
+    """
+    Saldo al final de cada mes (fórmula cerrada por tramos) y cuota del tramo de amortización:
+    - carencia (meses <= grace_months): saldo P ("interest_only") o P·(1 + r)^k ("full");
+    - amortización: cuota francesa sobre el saldo tras la carencia y n - grace_months meses,
+      dejando 'balloon' pendiente para la última cuota.
+    """
+    if grace_type not in GRACE_TYPES:
+        raise ValueError(f"Tipo de carencia desconocido: {grace_type!r}")
+    full = grace_type == "full"
+    g = np.minimum(np.asarray(grace_months, dtype=float), np.asarray(n, dtype=float) - 1.0)
+    g = np.maximum(g, 0.0)
+    growth_g, _, _ = annuity_factors(r, g)
+    P2 = P * growth_g if full else P * np.ones_like(growth_g)
+    payment = annuity_payment(P2, r, n - g, balloon)
+
+    growth_k, _, _ = annuity_factors(r, months)
+    grace_balance = P * growth_k if full else P * np.ones_like(growth_k)
+    growth_j, accum_j, _ = annuity_factors(r, np.maximum(months - g, 0.0))
+    with np.errstate(invalid="ignore", over="ignore"):
+        balance = np.where(months <= g, grace_balance, P2 * growth_j - payment * accum_j)
+    return balance, payment, g
+
+def amortization_arrays(
+    P: float,
+    r_m: float,
+    n: int,
+    rounding: str | None = None,
+    grace_months: int = 0,
+    grace_type: str = "interest_only",
+    balloon: float = 0.0,
+) -> dict:
+    """
+    Columnas del cuadro de amortización como arrays NumPy (mismas claves que amortization_schedule).
+    Usa la fórmula cerrada del saldo, sin bucle por mes; el último mes liquida el saldo residual.
+    - rounding: None (euros sin redondear) o un modo de ROUNDING_MODES para cuadrar al céntimo con el banco.
+    - grace_months / grace_type: carencia inicial (ver GRACE_TYPES); en la total la cuota es 0 y la
+      amortización negativa (los intereses se suman al saldo).
+    - balloon: importe que queda por pagar en la última cuota (pago final).
+    """
     if P <= 0 or n <= 0:
-        return pd.DataFrame()
-    if r_m == 0:
-        payment = P / n
-    else:
-        payment = P * r_m / (1 - (1 + r_m) ** (-n))
-
-    balance = P
-    rows = []
-    for m in range(1, n + 1):
-        interest = balance * r_m if r_m != 0 else 0.0
-        principal_pay = payment - interest if r_m != 0 else payment
-
-        if m == n:
-            principal_pay = balance
-            payment_eff = principal_pay + interest
-            balance_end = 0.0
-        else:
-            payment_eff = payment
-            balance_end = balance - principal_pay
-
-        rows.append(
-            {
-                "Mes": m,
-                "Cuota": payment_eff,
-                "Intereses": interest,
-                "Amortización": principal_pay,
-                "Saldo final": max(balance_end, 0.0),
-            }
+        return {}
+    months = np.arange(1, n + 1)
+    if rounding is not None:
+        cents = amortization_batch_cents(
+            P, r_m, n, rounding=rounding, grace_months=grace_months, grace_type=grace_type, balloon=balloon
         )
-        balance = balance_end
+        return {"Mes": months, **{k: v[0] / 100.0 for k, v in cents.items()}}
+    balance, payment, g = _segment_balances(P, r_m, n, months, grace_months, grace_type, balloon)
+    balance_prev = np.concatenate(([P], balance[:-1]))
+    interest = balance_prev * r_m
 
-    return pd.DataFrame(rows)
+    principal_pay = balance_prev - balance
+    principal_pay[-1] = balance_prev[-1]
+    cuota = np.full(n, float(payment), dtype=float)
+    in_grace = months <= g
+    principal_pay[in_grace] = -interest[in_grace] if grace_type == "full" else 0.0
+    cuota[in_grace] = 0.0 if grace_type == "full" else interest[in_grace]
+    cuota[-1] = principal_pay[-1] + interest[-1]
+    balance[-1] = 0.0
+
+    return {
+        "Mes": months,
+        "Cuota": cuota,
+        "Intereses": interest,
+        "Amortización": principal_pay,
+        "Saldo final": np.maximum(balance, 0.0),
+    }
+
+# Sin redondeo el cuadro es de fórmula cerrada (tan rápido como leerlo de la caché): solo se cachea en céntimos
+@timed
+@disk_cache(when=lambda a: a["rounding"] is not None)
+def amortization_schedule(
+    P: float,
+    r_m: float,
+    n: int,
+    rounding: str | None = None,
+    grace_months: int = 0,
+    grace_type: str = "interest_only",
+    balloon: float = 0.0,
+) -> pd.DataFrame:
+    """Cuadro de amortización con tipo mensual constante r_m durante n meses (ver amortization_arrays)."""
+    return pd.DataFrame(amortization_arrays(P, r_m, n, rounding, grace_months, grace_type, balloon))
+
+def annuity_payment(P, r_m, n, balloon=0.0):
+    """
+    Cuota mensual francesa para escalares o arrays (P, r_m, n, balloon se combinan por broadcasting).
+    balloon: importe pendiente tras la última cuota ordinaria (se descuenta su valor actual de P).
+    """
+    growth, _, disc = annuity_factors(r_m, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.asarray(P, dtype=float) - np.asarray(balloon, dtype=float) / growth) / disc
+
+@timed
+def amortization_batch(
+    P,
+    r_m,
+    n,
+    horizon: int | None = None,
+    grace_months=0,
+    grace_type: str = "interest_only",
+    balloon=0.0,
+) -> dict:
+    """
+    Cuadros de amortización de muchos préstamos a la vez (una fila por préstamo, una columna por mes).
+    P, r_m, n (y grace_months, balloon si son arrays): arrays 1D de igual longitud.
+    horizon: nº de columnas (por defecto el plazo máximo). Carencia y pago final como en amortization_arrays.
+    Tras el vencimiento de cada préstamo, todas sus columnas valen 0.
+    """
+    P = np.atleast_1d(np.asarray(P, dtype=float))
+    r = np.atleast_1d(np.asarray(r_m, dtype=float))
+    n = np.atleast_1d(np.asarray(n, dtype=int))
+    H = int(horizon if horizon is not None else (n.max() if n.size else 0))
+    months = np.arange(1, H + 1)[None, :]
+
+    r2 = r[:, None]
+    grace = np.broadcast_to(np.asarray(grace_months, dtype=float), P.shape)[:, None]
+    balloon = np.broadcast_to(np.asarray(balloon, dtype=float), P.shape)[:, None]
+    balance, _, _ = _segment_balances(
+        P[:, None], r2, np.maximum(n, 1)[:, None], months, grace, grace_type, balloon
+    )
+
+    active = (months <= n[:, None]) & (P[:, None] > 0)
+    balance = np.where(active & (months < n[:, None]), np.maximum(balance, 0.0), 0.0)
+    balance_prev = np.concatenate([P[:, None], balance[:, :-1]], axis=1) * active
+    interest = balance_prev * r2
+    principal_pay = balance_prev - balance
+    in_grace = (months <= grace) & (months < n[:, None])
+    principal_pay = np.where(in_grace, -interest if grace_type == "full" else 0.0, principal_pay)
+    return {
+        "Cuota": principal_pay + interest,
+        "Intereses": interest,
+        "Amortización": principal_pay,
+        "Saldo final": balance,
+    }
+
+def yearly_payments(P, r_m, n, years: int, grace_months=0, grace_type: str = "interest_only", balloon=0.0) -> np.ndarray:
+    """
+    Suma por año (bloques de 12 meses desde el primero) de la columna "Cuota" de amortization_batch,
+    sin construir la matriz préstamos x meses: la cuota es constante en la carencia y en la amortización,
+    y la última incluye el pago final. 0 tras el vencimiento.
+    P, r_m, n, grace_months y balloon: escalares o arrays (broadcasting). Devuelve forma (..., years).
+    """
+    P, r, n, grace, balloon = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (P, r_m, n, grace_months, balloon))
+    )
+    _, cuota, g = _segment_balances(P, r, np.maximum(n, 1.0), 0.0, grace, grace_type, balloon)
+    cuota_carencia = np.zeros_like(P) if grace_type == "full" else P * r
+
+    inicio = 12.0 * np.arange(int(years))
+    fin = inicio + 12.0
+    n_, g_ = n[..., None], g[..., None]
+    meses_carencia = np.clip(np.minimum(g_, fin) - inicio, 0.0, 12.0)
+    meses_amort = np.clip(np.minimum(n_, fin) - np.maximum(g_, inicio), 0.0, 12.0)
+    total = (
+        meses_carencia * cuota_carencia[..., None]
+        + meses_amort * cuota[..., None]
+        + ((n_ > inicio) & (n_ <= fin)) * balloon[..., None]
+    )
+    return np.where(((P > 0) & (n > 0))[..., None], total, 0.0)
+
+# Redondeo al céntimo como en los cuadros de los bancos
+ROUNDING_MODES = {
+    "half_even": "Bancario (mitad al par)",
+    "half_up": "Mitad hacia arriba",
+}
+
+def round_cents(x, rounding: str = "half_even") -> np.ndarray:
+    """
+    Redondea importes expresados en céntimos (float) a enteros int64:
+    - "half_even": las mitades van al par (redondeo bancario);
+    - "half_up": las mitades se alejan de cero.
+    Antes se ajusta a 1e-6 céntimos para que 12,4999999 (error de coma flotante) cuente como mitad.
+    """
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f"Modo de redondeo desconocido: {rounding!r}")
+    x = np.round(np.asarray(x, dtype=float), 6)
+    if rounding == "half_even":
+        return np.rint(x).astype(np.int64)
+    return (np.sign(x) * np.floor(np.abs(x) + 0.5)).astype(np.int64)
+
+@timed
+def amortization_batch_cents(
+    P,
+    r_m,
+    n,
+    horizon: int | None = None,
+    rounding: str = "half_even",
+    payment_rate=None,
+    grace_months=0,
+    grace_type: str = "interest_only",
+    balloon=0.0,
+) -> dict:
+    """
+    Como amortization_batch, pero con importes en céntimos int64 redondeados mes a mes:
+    cuota fija redondeada, intereses de cada mes redondeados sobre el saldo en céntimos y el resto a capital.
+    La última cuota de cada préstamo liquida el saldo residual (absorbe la deriva del redondeo).
+    El bucle recorre meses; cada paso opera sobre todos los préstamos a la vez.
+    - r_m: tipo mensual por préstamo (1D) o tipo de cada periodo (préstamos x meses, ver dated_amortization_batch).
+    - payment_rate: tipo mensual con el que se fija la cuota (por defecto, el del primer periodo).
+    - grace_months / grace_type / balloon: carencia inicial y pago final, como en amortization_arrays;
+      la cuota se fija (y redondea) al empezar el tramo de amortización.
+    """
+    if grace_type not in GRACE_TYPES:
+        raise ValueError(f"Tipo de carencia desconocido: {grace_type!r}")
+    P = np.atleast_1d(np.asarray(P, dtype=float))
+    n = np.atleast_1d(np.asarray(n, dtype=int))
+    H = int(horizon if horizon is not None else (n.max() if n.size else 0))
+    N = P.size
+    r = np.asarray(r_m, dtype=float)
+    if r.ndim < 2:
+        r = np.broadcast_to(np.atleast_1d(r)[:, None], (N, max(H, 1)))
+    pay_r = r[:, 0] if payment_rate is None else np.asarray(payment_rate, dtype=float)
+
+    grace = np.clip(np.broadcast_to(np.asarray(grace_months, dtype=int), P.shape), 0, np.maximum(n - 1, 0))
+    balloon_c = np.broadcast_to(np.asarray(balloon, dtype=float), P.shape) * 100.0
+
+    bal = np.where(P > 0, round_cents(P * 100.0, rounding), 0)
+    pay = np.zeros(N, dtype=np.int64)
+    cols = {k: np.zeros((N, H), dtype=np.int64) for k in ("Cuota", "Intereses", "Amortización", "Saldo final")}
+    for m in range(min(H, int(n.max()) if N else 0)):
+        active = m < n
+        starts = m == grace
+        if starts.any():
+            new_pay = annuity_payment(bal, pay_r, np.maximum(n - grace, 1), balloon_c)
+            pay = np.where(starts, round_cents(np.nan_to_num(new_pay), rounding), pay)
+        interest = np.where(active, round_cents(bal * r[:, m], rounding), 0)
+        principal_pay = np.where(m == n - 1, bal, np.minimum(pay - interest, bal))
+        if grace_type == "full":
+            principal_pay = np.where(m < grace, -interest, principal_pay)
+        else:
+            principal_pay = np.where(m < grace, 0, principal_pay)
+        principal_pay = np.where(active, principal_pay, 0)
+        bal = bal - principal_pay
+        cols["Cuota"][:, m] = principal_pay + interest
+        cols["Intereses"][:, m] = interest
+        cols["Amortización"][:, m] = principal_pay
+        cols["Saldo final"][:, m] = bal
+    return cols
+
+# ============================
+# Calendario: fechas de pago reales y base de cálculo de intereses
+# ============================
+DAY_COUNTS = {
+    "1/12": "Mensual (TIN / 12)",
+    "30/360": "30/360",
+    "act/360": "Días reales / 360",
+    "act/365": "Días reales / 365",
+}
+
+def payment_dates(start, n: int) -> np.ndarray:
+    """
+    Fechas de las n cuotas mensuales (datetime64[D]) a partir de la fecha de inicio 'start'
+    (escalar o array de fechas -> forma (..., n)). La primera cuota vence un mes después; si el día
+    no existe en el mes (p. ej. 31), se usa el último día de ese mes.
+    """
+    start = np.asarray(start, dtype="datetime64[D]")
+    month0 = start.astype("datetime64[M]")
+    day = (start - month0.astype("datetime64[D]"))[..., None]
+    months = month0[..., None] + np.arange(1, n + 1)
+    first = months.astype("datetime64[D]")
+    month_len = (months + 1).astype("datetime64[D]") - first
+    return first + np.minimum(day, month_len - np.timedelta64(1, "D"))
+
+def _ymd(dates: np.ndarray):
+    """Año, mes y día (arrays de enteros) de fechas datetime64[D]."""
+    months = dates.astype("datetime64[M]")
+    year = dates.astype("datetime64[Y]").astype(int) + 1970
+    month = months.astype(int) % 12 + 1
+    day = (dates - months.astype("datetime64[D]")).astype(int) + 1
+    return year, month, day
+
+def accrual_fractions(start, dates: np.ndarray, day_count: str = "1/12") -> np.ndarray:
+    """
+    Fracción de año de cada periodo de devengo (de la cuota anterior, o de 'start', a cada fecha):
+    - "1/12": siempre 1/12;
+    - "30/360": 30E/360 (días 31 cuentan como 30);
+    - "act/360" / "act/365": días reales entre fechas / 360 o / 365.
+    """
+    if day_count not in DAY_COUNTS:
+        raise ValueError(f"Base de cálculo desconocida: {day_count!r}")
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    if day_count == "1/12":
+        return np.full(dates.shape, 1.0 / 12.0)
+    start = np.asarray(start, dtype="datetime64[D]")[..., None]
+    prev = np.concatenate([start, dates[..., :-1]], axis=-1)
+    if day_count == "30/360":
+        y1, m1, d1 = _ymd(prev)
+        y2, m2, d2 = _ymd(dates)
+        days = 360 * (y2 - y1) + 30 * (m2 - m1) + (np.minimum(d2, 30) - np.minimum(d1, 30))
+        return days / 360.0
+    days = (dates - prev).astype(int)
+    return days / (360.0 if day_count == "act/360" else 365.0)
+
+def dated_amortization_batch(
+    P, annual_rate, n, start, day_count: str = "1/12", horizon: int | None = None, rounding: str | None = None
+) -> dict:
+    """
+    Cuadros de amortización con fechas reales (una fila por préstamo, una columna por cuota):
+    - la cuota se fija con el TIN / 12 (como hacen los bancos) y los intereses de cada periodo se devengan
+      con la base 'day_count' entre fechas de pago; la última cuota liquida el residuo;
+    - saldo cerrado sin bucle: B_k = G_k · (P - cuota · Σ 1/G_j), con G_k = Π (1 + r_j) (cumsum de log1p);
+    - rounding: None o un modo de ROUNDING_MODES (motor en céntimos).
+    Devuelve "Fecha", "Días" y las columnas de amortization_batch; tras el vencimiento los importes valen 0.
+    """
+    P = np.atleast_1d(np.asarray(P, dtype=float))
+    annual_rate = np.broadcast_to(np.asarray(annual_rate, dtype=float), P.shape)
+    n = np.broadcast_to(np.asarray(n, dtype=int), P.shape)
+    start = np.broadcast_to(np.asarray(start, dtype="datetime64[D]"), P.shape)
+    H = int(horizon if horizon is not None else (n.max() if n.size else 0))
+
+    fechas = payment_dates(start, H)
+    prev = np.concatenate([start[:, None], fechas[:, :-1]], axis=1)
+    rates = annual_rate[:, None] * accrual_fractions(start, fechas, day_count)
+    base = {"Fecha": fechas, "Días": (fechas - prev).astype(int)}
+    if rounding is not None:
+        cents = amortization_batch_cents(P, rates, n, horizon=H, rounding=rounding, payment_rate=annual_rate / 12.0)
+        return {**base, **{k: v / 100.0 for k, v in cents.items()}}
+
+    pay = annuity_payment(P, annual_rate / 12.0, np.maximum(n, 1))[:, None]
+    growth = np.exp(np.cumsum(np.log1p(rates), axis=1))
+    balance = growth * (P[:, None] - pay * np.cumsum(1.0 / growth, axis=1))
+
+    months = np.arange(1, H + 1)[None, :]
+    active = (months <= n[:, None]) & (P[:, None] > 0)
+    balance = np.where(active & (months < n[:, None]), np.maximum(balance, 0.0), 0.0)
+    balance_prev = np.concatenate([P[:, None], balance[:, :-1]], axis=1) * active
+    interest = balance_prev * rates
+    principal_pay = balance_prev - balance
+    return {
+        **base,
+        "Cuota": principal_pay + interest,
+        "Intereses": interest,
+        "Amortización": principal_pay,
+        "Saldo final": balance,
+    }
+
+@timed
+@disk_cache(when=lambda a: a["rounding"] is not None)
+def dated_amortization_schedule(
+    P: float, annual_rate: float, n: int, start, day_count: str = "1/12", rounding: str | None = None
+) -> pd.DataFrame:
+    """Cuadro de amortización con fechas de pago reales (ver dated_amortization_batch)."""
+    if P <= 0 or n <= 0:
+        return pd.DataFrame()
+    cols = dated_amortization_batch(P, annual_rate, n, start, day_count, rounding=rounding)
+    return pd.DataFrame({"Mes": np.arange(1, n + 1), **{k: v[0] for k, v in cols.items()}})
+
+def yearly_rollup(fechas, cols: dict) -> dict:
+    """
+    Suma las columnas por año natural de la fecha de pago, sin agrupar fila a fila (np.bincount).
+    fechas y columnas: 1D (un préstamo) o 2D (préstamos x meses -> préstamos x años).
+    Devuelve {"Año": años, columna: sumas}.
+    """
+    fechas = np.asarray(fechas, dtype="datetime64[D]")
+    years = fechas.astype("datetime64[Y]").astype(int) + 1970
+    y0 = int(years.min())
+    ny = int(years.max()) - y0 + 1
+    idx = years - y0
+    if fechas.ndim == 2:
+        idx = idx + ny * np.arange(fechas.shape[0])[:, None]
+    size = ny * (fechas.shape[0] if fechas.ndim == 2 else 1)
+    out = {"Año": np.arange(y0, y0 + ny)}
+    for k, v in cols.items():
+        sums = np.bincount(idx.ravel(), weights=np.asarray(v, dtype=float).ravel(), minlength=size)
+        out[k] = sums.reshape(-1, ny) if fechas.ndim == 2 else sums
+    return out
 
 def mixed_total_interest(P: float, n: int, r1_m: float, m1: int, r2_m: float):
     """
-    Intereses totales de una hipoteca mixta:
+    Intereses totales de una hipoteca mixta (escalares o arrays, por broadcasting):
     - Periodo 1: r1_m, cuota calculada con r1_m para TODO el plazo (n), se pagan m1 meses.
     - Periodo 2: r2_m, cuota recalculada con r2_m sobre saldo restante y n-m1 meses.
+    Los intereses de cada periodo salen de forma cerrada: cuotas pagadas - capital amortizado.
     Devuelve (intereses_totales, intereses_periodo1, intereses_periodo2, saldo_tras_p1).
     """
-    if P <= 0 or n <= 0 or m1 < 0 or m1 > n:
-        return 0.0, 0.0, 0.0, P
+    P, n, r1, m1, r2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (P, n, r1_m, m1, r2_m)))
+    valid = (P > 0) & (n > 0) & (m1 >= 0) & (m1 <= n)
 
-    if r1_m == 0:
-        payment1 = P / n
-    else:
-        payment1 = P * r1_m / (1 - (1 + r1_m) ** (-n))
-
-    balance = P
-    interest_p1 = 0.0
-    for _ in range(m1):
-        interest = balance * r1_m if r1_m != 0 else 0.0
-        principal_pay = payment1 - interest if r1_m != 0 else payment1
-        balance -= principal_pay
-        interest_p1 += interest
+    payment1 = annuity_payment(P, r1, n)
+    growth1, accum1, _ = annuity_factors(r1, m1)
+    balance = P * growth1 - payment1 * accum1
+    interest_p1 = payment1 * m1 - (P - balance)
 
     n2 = n - m1
-    if n2 <= 0:
-        return interest_p1, interest_p1, 0.0, 0.0
-
-    if r2_m == 0:
-        payment2 = balance / n2
-    else:
-        payment2 = balance * r2_m / (1 - (1 + r2_m) ** (-n2))
-
-    interest_p2 = 0.0
-    bal = balance
-    for _ in range(n2):
-        interest = bal * r2_m if r2_m != 0 else 0.0
-        principal_pay = payment2 - interest if r2_m != 0 else payment2
-        bal -= principal_pay
-        interest_p2 += interest
+    _, _, disc2 = annuity_factors(r2, n2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        payment2 = balance / disc2
+        interest_p2 = np.where(n2 > 0, payment2 * n2 - balance, 0.0)
+    balance = np.where(n2 > 0, balance, 0.0)
 
-    return interest_p1 + interest_p2, interest_p1, interest_p2, balance
+    total = np.where(valid, interest_p1 + interest_p2, 0.0)
+    interest_p1 = np.where(valid, interest_p1, 0.0)
+    interest_p2 = np.where(valid, interest_p2, 0.0)
+    balance = np.where(valid, balance, P)
+    if total.ndim == 0:
+        return float(total), float(interest_p1), float(interest_p2), float(balance)
+    return total, interest_p1, interest_p2, balance
 
+@timed
+@disk_cache
 def solve_r2_for_equal_interest(P: float, n: int, r_fixed_m: float, r1_m: float, m1: int):
     """
     Encuentra r2_m (tipo mensual periodo 2) tal que:
@@ -415,220 +969,342 @@ def solve_r2_for_equal_interest(P: float, n: int, r_fixed_m: float, r1_m: float,
     return r2_m_solution, target, total_mixed, ip1, ip2
 
 # ============================
-# Matrices de primas + interpolación (edad x capital)
+# Tipo implícito (TIN a partir de la cuota)
+# ============================
+def balance_after(P, r_m, payment, k):
+    """Saldo tras k cuotas de importe 'payment' a tipo mensual r_m (escalares o arrays)."""
+    P = np.asarray(P, dtype=float)
+    r_m = np.asarray(r_m, dtype=float)
+    payment = np.asarray(payment, dtype=float)
+    growth, accum, _ = annuity_factors(r_m, k)
+    with np.errstate(invalid="ignore", over="ignore"):
+        return P * growth - payment * accum
+
+@timed
+@disk_cache
+def implied_rate(P, n, payment, months_paid=None, saldo=None, tol: float = 1e-12, max_iter: int = 100):
+    """
+    Tipo mensual r_m implícito (vectorizado: escalares o arrays):
+    - con (P, n, cuota): r_m tal que la cuota francesa de P a n meses sea 'payment';
+    - si además se conocen meses pagados y saldo pendiente: r_m tal que el saldo tras esos meses
+      con esa cuota sea 'saldo' (más preciso cuando la cuota del banco viene redondeada).
+    Newton con salvaguarda de bisección dentro de [0 %, 10 %] mensual. Sin solución -> np.nan (incluida una
+    cuota que no llega a devolver el capital, que exigiría un tipo negativo: casi siempre un error de datos).
+    """
+    P, n, payment = np.broadcast_arrays(
+        np.asarray(P, dtype=float), np.asarray(n, dtype=float), np.asarray(payment, dtype=float)
+    )
+    use_balance = months_paid is not None and saldo is not None
+    if use_balance:
+        k = np.broadcast_to(np.asarray(months_paid, dtype=float), P.shape)
+        B = np.broadcast_to(np.asarray(saldo, dtype=float), P.shape)
+        use_balance = np.broadcast_to(k > 0, P.shape) & np.isfinite(B)
+    else:
+        use_balance = np.zeros(P.shape, dtype=bool)
+        k = np.zeros(P.shape)
+        B = np.zeros(P.shape)
+
+    def f(r):
+        # Creciente en r en ambos casos
+        by_payment = annuity_payment(P, r, n) - payment
+        by_balance = balance_after(P, r, payment, k) - B
+        return np.where(use_balance, by_balance, by_payment)
+
+    lo = np.zeros(P.shape)
+    hi = np.full(P.shape, 0.10)
+    f_lo, f_hi = f(lo), f(hi)
+    ok = (P > 0) & (n > 0) & (payment > 0) & (f_lo <= 0) & (f_hi >= 0)
+    r = np.where(ok, 0.003, np.nan)
+    h = 1e-7
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(max_iter):
+            fr = f(r)
+            lo = np.where(fr < 0, r, lo)
+            hi = np.where(fr >= 0, r, hi)
+            d = (f(r + h) - f(r - h)) / (2 * h)
+            r_new = r - fr / d
+            outside = ~np.isfinite(r_new) | (r_new <= lo) | (r_new >= hi)
+            r_new = np.where(outside, (lo + hi) / 2.0, r_new)
+            if np.all(~ok | (np.abs(r_new - r) < tol)):
+                r = r_new
+                break
+            r = r_new
+    r = np.where(ok, r, np.nan)
+    return float(r) if r.ndim == 0 else r
+
+# ============================
+# Capacidad de endeudamiento (cuota -> importe máximo / plazo mínimo)
+# ============================
+def max_payment_from_dti(ingresos_mensuales, dti, otras_deudas_mensuales=0.0):
+    """Cuota máxima asumible: ingresos * ratio de endeudamiento - otras deudas (mínimo 0)."""
+    return np.maximum(
+        np.asarray(ingresos_mensuales, dtype=float) * np.asarray(dti, dtype=float)
+        - np.asarray(otras_deudas_mensuales, dtype=float),
+        0.0,
+    )
+
+def max_principal(payment, r_m, n):
+    """Importe máximo financiable con una cuota 'payment' a tipo r_m y n meses (valor actual de la renta)."""
+    _, _, disc = annuity_factors(r_m, n)
+    out = np.asarray(payment, dtype=float) * disc
+    return float(out) if out.ndim == 0 else out
+
+def min_term(P, r_m, payment):
+    """
+    Plazo mínimo (meses, redondeado hacia arriba) para amortizar P con cuota como máximo 'payment'.
+    np.nan si la cuota no cubre ni los intereses del primer mes.
+    """
+    P = np.asarray(P, dtype=float)
+    r_m = np.asarray(r_m, dtype=float)
+    payment = np.asarray(payment, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # n = -log(1 - y) / log(1 + r), con y = P·r / cuota, escrito con cocientes que valen 1 en 0
+        y = P * r_m / payment
+        n = (P / payment) * _log1p_ratio(-np.where(y < 1.0, y, 0.0)) / _log1p_ratio(r_m)
+        # Tolerancia para no sumar un mes por errores de redondeo
+        n = np.ceil(n - 1e-9)
+    out = np.where((payment > 0) & (y < 1.0), np.maximum(n, 1.0), np.nan)
+    return float(out) if out.ndim == 0 else out
+
+def affordability_table(payment, annual_rates_pct, years=range(1, 41)):
+    """
+    Importe máximo financiable para cada plazo (filas, en años) y cada TIN anual en % (columnas),
+    calculado de una sola vez por broadcasting.
+    """
+    years = np.asarray(list(years), dtype=float)
+    rates_m = np.asarray(annual_rates_pct, dtype=float) / 1200.0
+    return max_principal(payment, rates_m[None, :], years[:, None] * 12)
+
+# ============================
+# TIR vectorizada (muchas series de flujos a la vez)
 # ============================
-CAPITALS_STD = [50000, 75000, 100000, 125000, 150000, 175000, 200000, 225000, 250000, 275000, 300000, 325000, 350000, 375000, 400000]
+def _npv_same_sign(cf: np.ndarray, r: np.ndarray) -> np.ndarray:
+    """
+    NPV reescalado que conserva el signo del NPV real y no desborda:
+    - r >= 0: sum cf_k / (1+r)^k
+    - r < 0:  sum cf_k * (1+r)^(T-k)   (NPV multiplicado por (1+r)^T > 0)
+    """
+    T = cf.shape[-1] - 1
+    k = np.arange(T + 1)
+    pos = r >= 0
+    base = np.where(pos, 1.0 / (1.0 + r), 1.0 + r)
+    expo = np.where(pos[..., None], k, T - k)
+    return (cf * base[..., None] ** expo).sum(axis=-1)
+
+def _irr_newton_1d(cf: np.ndarray, guess: float, tol: float, max_iter: int):
+    """Newton para una única serie con productos escalares (camino rápido). None si no converge."""
+    if not ((cf < 0).any() and (cf > 0).any()):
+        return np.nan
+    k = np.arange(cf.size, dtype=float)
+    cf_k = cf * k
+    r = float(guess)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(max_iter):
+            v = 1.0 / (1.0 + r)
+            disc = np.power(v, k)
+            step = (cf @ disc) / (-(cf_k @ disc) * v)
+            r_new = r - step
+            if not np.isfinite(r_new) or r_new <= -1.0:
+                return None
+            if abs(r_new - r) < tol:
+                return float(r_new)
+            r = r_new
+    return None
+
+@timed
+def irr_batch(cashflows, guess: float = 0.1, tol: float = 1e-10, max_iter: int = 50):
+    """
+    TIR por periodo de una o muchas series de flujos (última dimensión = periodos).
+    - Newton vectorizado sobre todas las series a la vez (solo sigue iterando las no convergidas).
+    - Las series que no convergen pasan a bisección vectorizada (mismo esquema que tir_excel).
+    Sin cambio de signo en los flujos -> np.nan (como Excel).
+    Devuelve float si entra una única serie; array con la forma cashflows.shape[:-1] si no.
+    """
+    cf_all = np.asarray(cashflows, dtype=float)
+    single = cf_all.ndim == 1
+    if single:
+        r = _irr_newton_1d(cf_all, guess, tol, max_iter)
+        if r is not None:
+            return r
+    batch_shape = cf_all.shape[:-1]
+    cf_all = cf_all.reshape(-1, cf_all.shape[-1])
+    k = np.arange(cf_all.shape[-1])
+
+    result = np.full(cf_all.shape[0], np.nan)
+    valid = (cf_all < 0).any(axis=-1) & (cf_all > 0).any(axis=-1)
+
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        # Newton: 'active' son los índices aún sin converger
+        active = np.flatnonzero(valid)
+        r = np.full(active.size, float(guess))
+        for _ in range(max_iter):
+            if active.size == 0:
+                break
+            cf = cf_all[active]
+            v = 1.0 / (1.0 + r)
+            disc = v[:, None] ** k
+            npv = (cf * disc).sum(axis=-1)
+            dnpv = -(cf * k * disc).sum(axis=-1) * v
+            r_new = r - npv / dnpv
+            ok = np.isfinite(r_new) & (r_new > -1.0)
+            converged = ok & (np.abs(r_new - r) < tol)
+            result[active[converged]] = r_new[converged]
+            keep = ok & ~converged
+            active, r = active[keep], r_new[keep]
+
+        # Bisección para lo que Newton no resolvió (divergencia o sin converger)
+        pending = np.flatnonzero(valid & np.isnan(result))
+        if pending.size:
+            cf = cf_all[pending]
+            lo = np.full(pending.size, -0.999999)
+            hi = np.full(pending.size, 0.10)
+            f_lo = _npv_same_sign(cf, lo)
+            f_hi = _npv_same_sign(cf, hi)
+            for _ in range(60):
+                expand = f_lo * f_hi > 0
+                if not expand.any():
+                    break
+                hi = np.where(expand, hi * 2 + 0.05, hi)
+                f_hi = _npv_same_sign(cf, hi)
+            bracketed = f_lo * f_hi <= 0
+            for _ in range(200):
+                mid = (lo + hi) / 2.0
+                f_mid = _npv_same_sign(cf, mid)
+                left = f_lo * f_mid <= 0
+                hi = np.where(left, mid, hi)
+                lo = np.where(left, lo, mid)
+                f_lo = np.where(left, f_lo, f_mid)
+                if np.all(~bracketed | (hi - lo < tol)):
+                    break
+            result[pending] = np.where(bracketed, (lo + hi) / 2.0, np.nan)
 
-def _lerp(x0, x1, y0, y1, x):
-    if x0 == x1:
-        return float(y0)
-    return float(y0 + (y1 - y0) * (x - x0) / (x1 - x0))
+    result = result.reshape(batch_shape)
+    return float(result) if single else result
+
+def monthly_to_annual(r_m):
+    """Tasa mensual efectiva -> tasa anual efectiva."""
+    return (1.0 + np.asarray(r_m, dtype=float)) ** 12 - 1.0
+
+# ============================
+# TAE (tasa anual equivalente) a partir de flujos mensuales
+# ============================
+def loan_cashflows(
+    P: float,
+    r_m: float,
+    n: int,
+    comision_apertura: float = 0.0,
+    gastos_iniciales: float = 0.0,
+    primas_mensuales=None,
+    cuotas=None,
+) -> np.ndarray:
+    """
+    Flujos mensuales del préstamo desde el punto de vista del cliente:
+    [P - comisión - gastos iniciales, -(cuota_1 + prima_1), ..., -(cuota_n + prima_n)].
+    primas_mensuales: escalar o array de n primas de seguros vinculados (None = sin seguros).
+    cuotas: cuotas del cuadro que se muestra (base de cálculo, redondeo...); sin ellas, cuadro francés de r_m y n.
+    """
+    if cuotas is not None:
+        pagos = np.asarray(cuotas, dtype=float).copy()
+        if pagos.size == 0:
+            return np.array([])
+    else:
+        cols = amortization_arrays(P, r_m, n)
+        if not cols:
+            return np.array([])
+        pagos = cols["Cuota"].copy()
+    if primas_mensuales is not None:
+        pagos = pagos + np.broadcast_to(np.asarray(primas_mensuales, dtype=float), pagos.shape)
+    return np.concatenate(([float(P) - comision_apertura - gastos_iniciales], -pagos))
+
+@timed
+def tae_from_cashflows(cashflows):
+    """
+    TAE = (1 + i)^12 - 1, con i la tasa mensual que anula el valor actual de los flujos mensuales.
+    Acepta una serie (devuelve float) o una matriz (una oferta por fila, devuelve array).
+    """
+    i_m = irr_batch(cashflows, guess=0.003)
+    with np.errstate(invalid="ignore"):
+        tae = monthly_to_annual(i_m)
+    return float(tae) if np.ndim(tae) == 0 else tae
 
+@timed
+def tae_batch(
+    P,
+    r_m,
+    n,
+    comision_apertura=0.0,
+    gastos_iniciales=0.0,
+    primas_mensuales=0.0,
+) -> np.ndarray:
+    """
+    TAE de muchas ofertas a la vez (arrays 1D: una oferta por posición).
+    primas_mensuales: escalar/array por oferta (prima constante) o matriz ofertas x meses.
+    Los plazos distintos se rellenan con ceros hasta el plazo máximo.
+    """
+    P = np.atleast_1d(np.asarray(P, dtype=float))
+    n = np.broadcast_to(np.asarray(n, dtype=int), P.shape)
+    amort = amortization_batch(P, np.broadcast_to(r_m, P.shape), n)
+    H = amort["Cuota"].shape[1]
+    activo = np.arange(1, H + 1)[None, :] <= n[:, None]
+    primas = np.asarray(primas_mensuales, dtype=float)
+    if primas.ndim < 2:
+        primas = np.broadcast_to(primas, P.shape)[:, None]
+    pagos = amort["Cuota"] + np.where(activo, primas[:, :H], 0.0)
+    neto = P - np.asarray(comision_apertura, dtype=float) - np.asarray(gastos_iniciales, dtype=float)
+    flujos = np.concatenate([np.broadcast_to(neto, P.shape)[:, None], -pagos], axis=1)
+    return tae_from_cashflows(flujos)
+
+@timed
+def insurance_premium_schedule(saldo_final: np.ndarray, P: float, edad: float, df: pd.DataFrame) -> np.ndarray:
+    """
+    Primas mensuales de un seguro de vida vinculado durante el préstamo:
+    cada año se tarifica con la edad alcanzada y el capital pendiente al inicio de ese año.
+    """
+    n = len(saldo_final)
+    if n == 0:
+        return np.array([])
+    saldo_inicio = np.concatenate(([float(P)], np.asarray(saldo_final, dtype=float)[:-1]))
+    anio = np.arange(n) // 12
+    capital_anual = saldo_inicio[::12]
+    primas_anuales = prima_bilineal_array(edad + np.arange(len(capital_anual)), capital_anual, df)
+    return primas_anuales[anio]
+
+# ============================
+# Matrices de primas + interpolación (edad x capital)
+# ============================
 def prima_orientativa_bilineal(edad: float, capital: float, df: pd.DataFrame) -> float:
     """Interpolación bilineal (edad x capital). Extrapola por el último tramo si se sale del rango."""
+    return float(prima_bilineal_array(edad, capital, df))
+
+def prima_bilineal_array(edad, capital, df: pd.DataFrame) -> np.ndarray:
+    """
+    Interpolación bilineal (edad x capital) para arrays de edades y capitales (broadcasting).
+    Extrapola por el primer/último tramo si se sale del rango, como prima_orientativa_bilineal.
+    """
     ages = df.index.to_numpy(dtype=float)
     caps = np.array(df.columns, dtype=float)
+    vals = df.to_numpy(dtype=float)
+    edad, capital = np.broadcast_arrays(np.asarray(edad, dtype=float), np.asarray(capital, dtype=float))
 
     if len(ages) < 2 or len(caps) < 2:
-        return float(df.iloc[0, 0])
+        return np.full(edad.shape, float(vals[0, 0]))
 
-    if edad <= ages.min():
-        a0, a1 = ages[0], ages[1]
-    elif edad >= ages.max():
-        a0, a1 = ages[-2], ages[-1]
-    else:
-        a1 = ages[ages >= edad].min()
-        a0 = ages[ages <= edad].max()
-
-    if capital <= caps.min():
-        c0, c1 = caps[0], caps[1]
-    elif capital >= caps.max():
-        c0, c1 = caps[-2], caps[-1]
-    else:
-        c1 = caps[caps >= capital].min()
-        c0 = caps[caps <= capital].max()
-
-    v_a0c0 = float(df.loc[int(a0), int(c0)])
-    v_a0c1 = float(df.loc[int(a0), int(c1)])
-    v_a1c0 = float(df.loc[int(a1), int(c0)])
-    v_a1c1 = float(df.loc[int(a1), int(c1)])
-
-    v0 = _lerp(c0, c1, v_a0c0, v_a0c1, capital)
-    v1 = _lerp(c0, c1, v_a1c0, v_a1c1, capital)
-    v = _lerp(a0, a1, v0, v1, edad)
-    return float(v)
-
-def _build_df_from_table(table_str: str, capitals: list[int]) -> pd.DataFrame:
-    """Parsea tabla (Edad + 15 valores) con coma decimal. Ignora cabecera 'Edad ...'."""
-    rows = []
-    for line in table_str.strip().splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        if line.lower().startswith("edad"):
-            continue
-        parts = re.split(r"\s+", line)
-        age = int(parts[0])
-        vals = []
-        for p in parts[1:1+len(capitals)]:
-            vals.append(float(p.replace(".", "").replace(",", ".")))
-        if len(vals) != len(capitals):
-            raise ValueError(f"Fila edad {age}: esperaba {len(capitals)} valores y recibí {len(vals)}")
-        rows.append((age, vals))
-    df = pd.DataFrame({age: vals for age, vals in rows}).T
-    df.columns = capitals
-    df.index.name = "Edad"
-    return df.sort_index()
-
-# ---- Bloque IZQ: ejemplo entidad bancaria (ING) ----
-PREMIAS_ING = {
-    18: [9.41, 13.81, 18.64, 22.88, 27.43, 31.96, 36.50, 41.25, 45.83, 50.42, 54.56, 59.19, 63.74, 68.27, 72.81],
-    19: [9.25, 13.88, 18.60, 23.13, 27.75, 32.38, 37.00, 41.63, 46.26, 50.88, 55.39, 60.13, 64.76, 69.39, 73.79],
-    20: [9.16, 13.73, 18.31, 22.89, 27.69, 32.05, 36.70, 41.20, 45.78, 50.36, 54.74, 59.51, 64.09, 68.67, 72.77],
-    21: [9.20, 13.78, 18.38, 22.98, 27.75, 32.17, 36.83, 41.36, 45.96, 50.56, 54.99, 59.74, 64.34, 68.94, 73.15],
-    22: [9.23, 13.84, 18.45, 23.07, 27.82, 32.30, 36.96, 41.52, 46.14, 50.75, 55.25, 59.98, 64.58, 69.21, 73.53],
-    23: [9.27, 13.89, 18.52, 23.16, 27.88, 32.42, 37.08, 41.69, 46.32, 50.95, 55.50, 60.21, 64.83, 69.47, 73.91],
-    24: [9.30, 13.95, 18.60, 23.25, 27.95, 32.55, 37.21, 41.85, 46.49, 51.14, 55.76, 60.45, 65.09, 69.74, 74.29],
-    25: [9.34, 14.00, 18.67, 23.34, 28.01, 32.67, 37.34, 42.01, 46.67, 51.34, 56.01, 60.68, 65.35, 70.01, 74.68],
-    26: [9.27, 13.90, 18.60, 23.18, 27.83, 32.46, 37.04, 41.68, 46.34, 51.00, 55.47, 60.04, 64.75, 69.38, 74.11],
-    27: [9.21, 13.81, 18.54, 23.01, 27.64, 32.25, 36.74, 41.36, 46.00, 50.67, 54.94, 59.41, 64.15, 68.74, 73.53],
-    28: [9.14, 13.71, 18.47, 22.85, 27.46, 32.04, 36.44, 41.04, 45.67, 50.34, 54.40, 58.88, 63.55, 68.11, 72.96],
-    29: [9.08, 13.62, 18.41, 22.69, 27.27, 31.82, 36.13, 40.72, 45.33, 50.00, 53.87, 58.36, 62.95, 67.48, 71.89],
-    30: [9.01, 13.52, 18.34, 22.53, 27.09, 31.60, 35.83, 40.36, 45.00, 49.50, 53.33, 57.84, 62.34, 66.85, 70.82],
-    31: [9.29, 13.95, 19.03, 23.24, 27.81, 32.59, 37.04, 41.71, 46.43, 50.93, 55.11, 59.77, 64.42, 69.08, 73.18],
-    32: [9.58, 14.39, 19.71, 23.94, 28.54, 33.57, 38.26, 43.07, 47.86, 52.37, 56.89, 61.71, 66.50, 71.32, 75.55],
-    33: [9.86, 14.82, 20.40, 24.64, 29.28, 34.56, 39.48, 44.43, 49.29, 53.80, 58.68, 63.64, 68.59, 73.56, 77.91],
-    34: [10.15, 15.26, 21.09, 25.34, 30.01, 35.54, 40.69, 45.77, 50.72, 55.23, 60.46, 65.57, 70.67, 75.79, 80.26],
-    35: [10.43, 15.65, 21.80, 26.09, 31.69, 36.52, 41.87, 47.11, 52.17, 57.42, 62.25, 67.50, 72.76, 78.01, 82.62],
-    36: [11.01, 16.51, 23.01, 27.52, 33.55, 38.81, 44.32, 49.84, 55.03, 60.56, 65.87, 71.38, 76.81, 82.34, 87.42],
-    37: [11.58, 17.37, 24.22, 28.95, 35.40, 41.09, 46.76, 52.56, 57.90, 63.71, 69.48, 75.27, 80.86, 86.66, 92.23],
-    38: [12.16, 18.23, 25.44, 30.38, 37.26, 43.38, 49.21, 55.29, 60.77, 66.55, 73.10, 79.15, 84.90, 90.97, 97.04],
-    39: [12.73, 19.09, 26.65, 31.81, 39.12, 45.67, 51.65, 58.01, 63.64, 69.84, 76.73, 83.02, 88.94, 95.32, 101.83],
-    40: [13.30, 19.95, 27.85, 33.24, 40.98, 47.96, 54.10, 60.74, 66.48, 73.13, 80.36, 86.89, 93.03, 99.66, 106.61],
-    41: [15.04, 22.57, 31.45, 37.60, 46.16, 54.00, 60.91, 68.41, 74.40, 82.72, 90.44, 97.14, 104.46, 112.76, 120.96],
-    42: [16.79, 25.20, 35.05, 41.95, 51.34, 60.05, 67.72, 76.09, 82.32, 92.31, 100.51, 107.38, 115.89, 125.86, 135.31],
-    43: [18.53, 27.83, 38.66, 46.32, 56.51, 66.09, 74.54, 83.76, 90.24, 101.90, 110.59, 117.63, 127.33, 138.96, 149.65],
-    44: [20.27, 30.45, 42.27, 50.68, 61.69, 72.14, 81.35, 91.43, 98.16, 111.51, 120.68, 127.88, 138.76, 152.06, 163.00],
-    45: [22.02, 33.03, 45.88, 55.04, 66.87, 78.18, 88.17, 99.09, 110.10, 121.11, 130.76, 143.13, 154.14, 165.16, 173.35],
-    46: [23.70, 35.55, 49.42, 59.25, 71.99, 83.28, 94.93, 106.68, 118.52, 130.26, 140.74, 153.71, 165.55, 177.40, 186.56],
-    47: [25.37, 38.07, 52.95, 63.46, 77.12, 88.38, 101.68, 114.27, 126.95, 139.42, 150.73, 164.30, 176.97, 189.63, 199.77],
-    48: [27.04, 40.60, 56.49, 67.67, 82.25, 93.47, 108.44, 121.86, 135.63, 148.58, 160.71, 174.89, 188.39, 201.87, 212.99],
-    49: [28.72, 43.12, 60.03, 71.88, 87.38, 98.57, 115.21, 129.45, 144.31, 157.85, 170.70, 185.47, 199.78, 214.10, 226.20],
-    50: [30.44, 45.65, 63.57, 76.09, 93.07, 108.67, 121.98, 137.04, 152.19, 167.13, 180.69, 196.03, 211.18, 226.34, 239.41],
-    51: [35.69, 53.52, 73.56, 89.21, 107.55, 126.61, 141.14, 160.64, 178.43, 196.25, 209.98, 230.64, 248.33, 266.13, 272.85],
-    52: [40.94, 61.39, 83.55, 102.33, 122.04, 144.54, 160.30, 184.24, 204.66, 225.36, 239.26, 265.26, 285.48, 305.92, 306.28],
-    53: [46.18, 69.27, 93.54, 115.44, 136.52, 162.48, 179.46, 207.83, 230.90, 254.48, 268.55, 299.88, 322.64, 345.71, 339.70],
-    54: [51.43, 77.14, 103.53, 128.56, 151.01, 180.42, 198.62, 231.43, 257.13, 283.09, 297.84, 334.50, 359.79, 385.49, 373.15],
-    55: [56.67, 85.01, 113.53, 141.68, 165.45, 198.35, 217.78, 255.03, 283.37, 311.70, 322.13, 369.07, 396.93, 425.27, 426.60],
-    56: [59.65, 89.47, 120.36, 149.12, 175.45, 208.76, 231.85, 268.81, 298.24, 328.06, 341.41, 387.87, 417.71, 447.53, 455.75],
-    57: [62.62, 93.94, 127.18, 156.56, 185.45, 219.17, 245.92, 282.60, 313.12, 344.41, 360.68, 406.67, 438.50, 469.79, 484.91],
-    58: [65.60, 98.40, 134.01, 164.00, 195.44, 229.59, 259.99, 296.38, 327.99, 360.75, 379.95, 425.47, 459.29, 492.05, 514.06],
-    59: [68.57, 102.86, 140.83, 171.43, 205.44, 240.00, 272.56, 310.17, 342.86, 377.10, 399.22, 444.27, 480.07, 514.32, 543.21],
-    60: [71.55, 107.32, 147.65, 178.86, 215.44, 250.41, 283.14, 321.95, 357.73, 393.50, 418.54, 465.04, 500.82, 536.59, 572.36],
-}
+    ia = np.clip(np.searchsorted(ages, edad, side="right") - 1, 0, len(ages) - 2)
+    ic = np.clip(np.searchsorted(caps, capital, side="right") - 1, 0, len(caps) - 2)
+    ta = (edad - ages[ia]) / (ages[ia + 1] - ages[ia])
+    tc = (capital - caps[ic]) / (caps[ic + 1] - caps[ic])
 
-PRIMA_ING_DF = pd.DataFrame.from_dict(PREMIAS_ING, orient="index", columns=CAPITALS_STD).sort_index()
-PRIMA_ING_DF.index.name = "Edad"
-
-# ---- Bloque DCHA: aseguradora (Nationale Nederlanden) ----
-TABLA_NN_FALLEC = """
-Edad 50.000,00 75.000,00 100.000,00 125.000,00 150.000,00 175.000,00 200.000,00 225.000,00 250.000,00 275.000,00 300.000,00 325.000,00 350.000,00 375.000,00 400.000,00
-18 6,16 6,74 7,32 7,91 8,5 9,08 9,67 10,26 10,84 11,42 12,01 12,6 13,18 13,76 14,35
-19 6,17 6,76 7,36 7,95 8,55 9,15 9,74 10,34 10,93 11,53 12,12 12,72 13,31 13,91 14,5
-20 6,19 6,79 7,39 8 8,6 9,21 9,82 10,42 11,03 11,63 12,24 12,84 13,45 14,05 14,66
-21 6,2 6,81 7,43 8,04 8,66 9,28 9,89 10,51 11,12 11,73 12,35 12,96 13,58 14,19 14,81
-22 6,21 6,84 7,46 8,09 8,72 9,34 9,97 10,59 11,21 11,84 12,46 13,09 13,71 14,34 14,96
-23 6,22 6,86 7,5 8,13 8,77 9,41 10,04 10,67 11,31 11,94 12,57 13,21 13,84 14,48 15,11
-24 6,24 6,89 7,53 8,18 8,82 9,47 10,12 10,76 11,4 12,04 12,69 13,33 13,98 14,62 15,27
-25 6,25 6,91 7,57 8,22 8,88 9,54 10,19 10,84 11,5 12,15 12,8 13,46 14,11 14,76 15,42
-26 6,28 6,96 7,64 8,32 8,99 9,67 10,35 11,02 11,7 12,37 13,04 13,72 14,4 15,07 15,75
-27 6,32 7,02 7,71 8,41 9,11 9,81 10,51 11,2 11,9 12,59 13,29 13,98 14,68 15,38 16,08
-28 6,35 7,07 7,79 8,51 9,22 9,94 10,66 11,38 12,1 12,82 13,53 14,25 14,97 15,69 16,4
-29 6,39 7,12 7,86 8,6 9,34 10,08 10,82 11,56 12,3 13,04 13,78 14,51 15,25 15,99 16,73
-30 6,42 7,18 7,93 8,69 9,46 10,22 10,98 11,74 12,5 13,26 14,02 14,78 15,54 16,3 17,06
-31 6,57 7,4 8,24 9,08 9,92 10,76 11,6 12,44 13,28 14,12 14,96 15,8 16,64 17,48 18,32
-32 6,71 7,63 8,54 9,46 10,38 11,3 12,22 13,14 14,06 14,98 15,9 16,82 17,74 18,65 19,57
-33 6,86 7,85 8,85 9,85 10,85 11,85 12,85 13,84 14,84 15,84 16,84 17,84 18,83 19,83 20,83
-34 7 8,08 9,15 10,23 11,31 12,39 13,47 14,55 15,62 16,7 17,78 18,86 19,93 21,01 22,08
-35 7,15 8,3 9,46 10,62 11,78 12,93 14,09 15,25 16,4 17,56 18,72 19,88 21,03 22,18 23,34
-36 7,49 8,86 10,22 11,49 12,76 14,02 15,29 16,76 18,23 19,69 21,16 22,53 23,89 25,26 26,62
-37 7,83 9,41 10,98 12,36 13,74 15,11 16,49 18,27 20,05 21,83 23,6 25,18 26,76 28,33 29,91
-38 8,18 9,96 11,75 13,23 14,72 16,2 17,69 19,78 21,87 23,96 26,05 27,83 29,62 31,41 33,19
-39 8,52 10,51 12,51 14,1 15,7 17,29 18,89 21,29 23,69 26,09 28,49 30,49 32,48 34,48 36,48
-40 8,86 11,06 13,27 14,98 16,68 18,38 20,09 22,8 25,51 28,22 30,93 33,14 35,34 37,55 39,76
-41 9,67 12,27 14,87 17,07 19,26 21,46 23,66 26,66 29,66 32,66 35,67 38,27 40,87 43,47 46,07
-42 10,49 13,48 16,47 19,16 21,85 24,54 27,23 30,52 33,82 37,11 40,4 43,39 46,39 49,38 52,37
-43 11,3 14,68 18,06 21,25 24,43 27,62 30,8 34,38 37,97 41,55 45,14 48,52 51,91 55,29 58,68
-44 12,12 15,89 19,66 23,34 27,02 30,69 34,37 38,25 42,12 46 49,87 53,65 57,43 61,21 64,98
-45 12,93 17,1 21,26 25,43 29,6 33,77 37,94 42,11 46,28 50,44 54,61 58,78 62,95 67,12 71,29
-46 13,98 18,72 23,46 28,2 32,94 37,69 42,43 47,17 51,91 56,65 61,39 66,13 70,88 75,62 80,36
-47 15,04 20,35 25,66 30,98 36,29 41,6 46,92 52,23 57,54 62,86 68,17 73,48 78,8 84,12 89,43
-48 16,09 21,98 27,86 33,75 39,64 45,52 51,41 57,3 63,18 69,06 74,95 80,84 86,72 92,61 98,5
-49 17,15 23,6 30,06 36,52 42,98 49,44 55,9 62,36 68,82 75,27 81,73 88,19 94,65 101,11 107,57
-50 18,2 25,23 32,26 39,29 46,32 53,36 60,39 67,42 74,45 81,48 88,51 95,54 102,58 109,61 116,64
-51 19,8 27,55 35,3 43,04 50,77 58,51 66,25 73,99 81,72 89,46 97,2 104,95 112,69 120,43 128,17
-52 21,4 29,87 38,34 46,78 55,22 63,66 72,1 80,55 89 97,45 105,9 114,35 122,8 131,25 139,7
-53 23 32,19 41,37 50,52 59,67 68,81 77,96 87,12 96,28 105,43 114,59 123,75 132,91 142,07 151,23
-54 24,6 34,51 44,41 54,26 64,11 73,96 83,81 93,68 103,55 113,42 123,29 133,15 143,02 152,89 162,76
-55 26,2 36,83 47,45 58 68,56 79,11 89,67 100,25 110,82 121,4 131,98 142,56 153,14 163,71 174,29
-56 27,51 38,79 50,06 61,29 72,51 83,74 94,96 106,2 117,44 128,69 139,93 151,17 162,41 173,65 184,89
-57 28,82 40,75 52,68 64,57 76,46 88,36 100,25 112,16 124,06 135,97 147,88 159,78 171,68 183,59 195,49
-58 30,14 42,72 55,3 67,86 80,42 92,98 105,54 118,11 130,68 143,25 155,82 168,39 180,96 193,52 206,09
-59 31,45 44,68 57,91 71,14 84,37 97,6 110,83 124,06 137,3 150,54 163,77 177 190,23 203,46 216,69
-"""
+    v0 = vals[ia, ic] + (vals[ia, ic + 1] - vals[ia, ic]) * tc
+    v1 = vals[ia + 1, ic] + (vals[ia + 1, ic + 1] - vals[ia + 1, ic]) * tc
+    return v0 + (v1 - v0) * ta
 
-TABLA_NN_FALL_IA = """
-Edad 50.000,00 75.000,00 100.000,00 125.000,00 150.000,00 175.000,00 200.000,00 225.000,00 250.000,00 275.000,00 300.000,00 325.000,00 350.000,00 375.000,00 400.000,00
-18 9,66 11,9 14,14 15,93 17,72 19,51 21,31 23,33 25,35 27,37 29,39 31,41 33,42 35,44 37,46
-19 9,6 11,81 14,02 15,79 17,56 19,32 21,09 23,1 25,12 27,13 29,15 31,16 33,17 35,19 37,2
-20 9,54 11,73 13,9 15,65 17,39 19,13 20,88 22,88 24,88 26,88 28,89 30,89 32,9 34,9 36,91
-21 9,47 11,64 13,78 15,51 17,23 18,95 20,67 22,66 24,65 26,64 28,63 30,61 32,6 34,59 36,58
-22 9,41 11,56 13,65 15,37 17,06 18,76 20,46 22,44 24,42 26,4 28,38 30,36 32,34 34,32 36,29
-23 9,34 11,47 13,53 15,24 16,9 18,58 20,24 22,21 24,19 26,17 28,14 30,12 32,09 34,07 36,05
-24 9,28 11,39 13,41 15,1 16,73 18,39 20,03 21,99 23,96 25,93 27,9 29,87 31,84 33,81 35,79
-25 9,21 11,3 13,38 15,04 16,69 18,35 20 21,85 23,71 25,56 27,42 29,28 31,13 32,99 34,88
-26 9,23 11,36 13,48 15,18 16,89 18,59 20,3 22,23 24,15 26,08 28,01 29,93 31,86 33,78 35,71
-27 9,26 11,42 13,58 15,32 17,08 18,81 20,61 22,6 24,6 26,6 28,59 30,59 32,59 34,58 36,58
-28 9,28 11,48 13,68 15,46 17,27 19,03 20,92 22,98 25,05 27,12 29,18 31,25 33,31 35,38 37,45
-29 9,3 11,55 13,78 15,61 17,46 19,25 21,23 23,35 25,49 27,63 29,76 31,99 34,23 36,46 38,7
-30 9,33 11,49 13,65 15,37 17,1 18,82 20,54 22,57 24,61 26,64 28,67 30,7 32,74 34,77 36,8
-31 9,56 11,88 14,19 16,05 17,9 19,75 21,61 23,73 25,85 27,98 30,1 32,41 34,73 37,04 39,36
-32 9,8 12,26 14,73 16,72 18,71 20,68 22,67 24,89 27,12 29,35 31,58 34,04 36,51 38,97 41,43
-33 10,03 12,65 15,26 17,39 19,51 21,61 23,74 26,05 28,37 30,68 32,99 35,61 38,22 40,83 43,45
-34 10,27 13,03 15,8 18,06 20,31 22,54 24,86 27,22 29,58 31,94 34,31 37,07 39,84 42,6 45,37
-35 10,5 13,24 15,97 18,16 20,34 22,53 24,71 27,22 29,73 32,24 34,75 37,16 39,58 41,99 44,4
-36 11,05 13,98 16,91 19,26 21,61 23,95 26,3 28,99 31,68 34,36 37,05 39,98 42,9 45,83 48,75
-37 11,6 14,73 17,85 20,37 22,88 25,38 27,9 30,75 33,59 36,44 39,29 42,4 45,52 48,63 51,75
-38 12,14 15,47 18,79 21,47 24,14 26,8 29,51 32,51 35,52 38,52 41,53 44,86 48,18 51,51 54,85
-39 12,69 16,21 19,73 22,58 25,41 28,23 31,12 34,28 37,44 40,6 43,76 47,32 50,88 54,44 58
-40 13,24 17,54 21,83 25,23 28,62 32,01 35,41 39,25 43,09 46,93 50,77 54,61 58,44 62,28 66,12
-41 14,46 19,45 24,44 28,4 32,35 36,31 40,26 44,73 49,2 53,67 58,14 63,12 68,11 73,09 78,07
-42 15,68 21,36 27,05 31,57 36,09 40,6 45,12 50,21 55,31 60,4 65,5 71,18 76,86 82,54 88,22
-43 16,9 23,27 29,67 34,74 39,82 44,9 49,97 55,7 61,42 67,15 72,88 79,24 85,61 91,97 98,34
-44 18,12 25,18 32,28 37,91 43,55 49,18 54,83 61,18 67,54 73,89 80,25 87,32 94,4 101,47 108,55
-45 19,34 26,56 33,77 39,44 45,11 50,78 56,45 62,89 69,33 75,76 82,2 89,42 96,65 103,88 107,95
-46 21,16 29,55 37,93 44,57 51,22 57,86 64,51 72,1 79,68 87,27 94,86 103,24 111,63 120,01 128,4
-47 22,98 32,54 42,09 49,7 57,32 64,93 72,55 81,3 90,04 98,78 107,53 117,09 126,64 136,2 145,76
-48 24,8 35,53 46,25 54,84 63,41 72,01 80,6 90,49 100,39 110,29 120,18 130,93 141,67 152,42 163,17
-49 26,62 38,53 50,4 59,97 69,52 79,08 88,64 99,69 110,74 121,79 132,84 144,78 156,72 168,66 180,6
-50 28,44 40,34 52,24 61,56 70,87 80,19 89,52 99,13 108,75 118,36 127,98 139,09 150,2 161,31 172,42
-51 31,36 44,9 58,45 69,13 79,8 90,48 101,15 113,29 125,43 137,57 149,71 163,25 176,79 190,33 203,87
-52 34,28 49,46 64,64 76,69 88,74 100,77 112,81 127,45 142,1 156,74 171,38 186,56 201,74 216,92 232,11
-53 37,2 54,02 70,85 84,25 97,67 111,06 124,46 141,62 158,78 175,93 193,09 209,66 226,23 242,8 259,37
-54 40,12 58,58 77,04 91,82 106,61 121,35 136,11 155,78 175,46 195,13 214,8 232,76 250,71 268,67 286,63
-55 43,04 61,62 80,2 95,7 111,2 126,69 138,18 154,73 171,28 187,84 204,39 220,94 237,49 254,04 270,59
-56 45,75 66,29 86,83 103,34 119,84 136,35 147,7 165,99 184,29 202,58 220,88 241,42 261,96 282,49 303,03
-57 48,47 70,95 93,46 110,97 128,48 145,99 157,21 177,25 197,29 217,33 237,37 261,91 286,45 310,99 335,53
-58 51,18 75,62 100,1 118,61 137,11 155,63 166,73 188,52 210,3 232,09 253,88 282,4 310,92 339,43 367,95
-59 53,89 77,81 101,73 121,99 142,25 162,5 176,25 197,54 218,82 240,11 261,39 282,81 304,24 325,39 346,54
-60 56,6 80 103,35 125,45 147,55 169,65 185,93 209,09 232,25 255,41 278,57 304,17 329,78 355,38 380,98
-"""
+def get_ing_df() -> pd.DataFrame:
+    """Tabla de primas del banco (ING), mapeada del fichero compilado la primera vez que se pide."""
+    return premium_table("ing")
 
-@st.cache_data(show_spinner=False)
 def get_nn_dfs():
-    nn_fallec = _build_df_from_table(TABLA_NN_FALLEC, CAPITALS_STD)
-    nn_fall_ia = _build_df_from_table(TABLA_NN_FALL_IA, CAPITALS_STD)
-    return nn_fallec, nn_fall_ia
+    """Tablas de la aseguradora (NN): fallecimiento y fallecimiento + invalidez absoluta."""
+    return premium_table("nn_fallecimiento"), premium_table("nn_fallecimiento_ia")
 
 # ============================
 # Helpers de sincronización: capital banco/aseguradora
@@ -4,7 +4,7 @@ import pandas as pd
 import streamlit as st
 
 from common import (
-    inject_css, euro_input, eur, amortization_schedule,
+    inject_css, euro_input, eur, fmt_table_es, amortization_schedule, annuity_payment,
     mixed_total_interest, solve_r2_for_equal_interest,
     render_footer
 )
@@ -94,18 +94,12 @@ st.divider()
 
 n2 = max(n_cmp - m1_months, 0)
 
-if r1_m == 0:
-    cuota_p1 = P_cmp / n_cmp
-else:
-    cuota_p1 = P_cmp * r1_m / (1 - (1 + r1_m) ** (-n_cmp))
+cuota_p1 = float(annuity_payment(P_cmp, r1_m, n_cmp))
 
 if n2 > 0:
     r2_for_calc = r2_m_solution if r2_m_solution is not None else 0.0
     _, _, _, saldo_p1_tmp = mixed_total_interest(P_cmp, n_cmp, r1_m, m1_months, r2_for_calc)
-    if r2_for_calc == 0:
-        cuota_p2 = saldo_p1_tmp / n2
-    else:
-        cuota_p2 = saldo_p1_tmp * r2_for_calc / (1 - (1 + r2_for_calc) ** (-n2))
+    cuota_p2 = float(annuity_payment(saldo_p1_tmp, r2_for_calc, n2))
 else:
     cuota_p2 = 0.0
 
@@ -172,7 +166,7 @@ fija_df = pd.DataFrame({
     "Concepto": ["Cuota mensual a pagar", "Valor Hipoteca", "Intereses Totales", "Suma Capital+Intereses"],
     "Valor": [monthly_payment_fixed, P_cmp, tgt_fixed, P_cmp + tgt_fixed]
 })
-st.dataframe(fija_df.style.format({"Valor": eur}), use_container_width=True)
+st.dataframe(fmt_table_es(fija_df, {"Valor": "eur"}), use_container_width=True)
 
 st.markdown("### 🧩 Resumen — Hipoteca Mixta")
 r2_for_table = r2_m_solution if r2_m_solution is not None else 0.0
@@ -194,7 +188,7 @@ mixta_df = pd.DataFrame({
     ]
 })
 st.dataframe(
-    mixta_df.style.format({"Valor": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else eur(x)}),
+    fmt_table_es(mixta_df, {"Valor": "eur"}),
     use_container_width=True
 )
 
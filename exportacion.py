@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# Exportación de cuadros de amortización completos a CSV/XLSX en formato ES, por bloques (sin Streamlit).
+import io
+
+import numpy as np
+
+from common import amortization_batch, fmt_date_es_array, fmt_number_es_array
+from metricas import timed
+
+CSV_SEP = ";"
+CHUNK_ROWS = 5000
+XLSX_NUMBER_FORMAT = "#,##0.00"  # Excel lo muestra como 1.234,56 con configuración regional española
+XLSX_DATE_FORMAT = "DD/MM/YYYY"
+
+def iter_schedule_chunks(cols: dict, chunk_rows: int = CHUNK_ROWS):
+    """Trocea un dict de columnas (arrays de igual longitud) en dicts de, como mucho, chunk_rows filas."""
+    n = len(next(iter(cols.values()))) if cols else 0
+    for i in range(0, n, chunk_rows):
+        yield {k: np.asarray(v)[i:i + chunk_rows] for k, v in cols.items()}
+
+def iter_batch_schedules(
+    P, r_m, n, ids=None, chunk_loans: int = 64, grace_months=0, grace_type: str = "interest_only", balloon=0.0
+):
+    """
+    Cuadros de muchos préstamos en formato largo (Préstamo, Mes, Cuota, Intereses, Amortización, Saldo final).
+    Se calculan de chunk_loans en chunk_loans con amortization_batch: en memoria solo hay un bloque
+    (chunk_loans x plazo máximo), sea cual sea el número de préstamos.
+    """
+    P = np.atleast_1d(np.asarray(P, dtype=float))
+    r = np.broadcast_to(np.asarray(r_m, dtype=float), P.shape)
+    n = np.broadcast_to(np.asarray(n, dtype=int), P.shape)
+    grace = np.broadcast_to(np.asarray(grace_months, dtype=int), P.shape)
+    balloon = np.broadcast_to(np.asarray(balloon, dtype=float), P.shape)
+    ids = np.arange(1, P.size + 1) if ids is None else np.asarray(ids)
+    for i in range(0, P.size, chunk_loans):
+        sl = slice(i, i + chunk_loans)
+        cols = amortization_batch(
+            P[sl], r[sl], n[sl], grace_months=grace[sl], grace_type=grace_type, balloon=balloon[sl]
+        )
+        months = np.arange(1, cols["Cuota"].shape[1] + 1)[None, :]
+        mask = (months <= n[sl][:, None]) & (P[sl][:, None] > 0)
+        yield {
+            "Préstamo": np.repeat(ids[sl], mask.sum(axis=1)),
+            "Mes": np.broadcast_to(months, mask.shape)[mask],
+            **{k: v[mask] for k, v in cols.items()},
+        }
+
+def _csv_text(values: np.ndarray) -> np.ndarray:
+    """Texto para CSV: entre comillas (y con comillas dobladas) si contiene separador, comillas o saltos."""
+    values = np.asarray(values).astype(str)
+    needs = (
+        (np.char.find(values, CSV_SEP) >= 0) | (np.char.find(values, '"') >= 0) | (np.char.find(values, "\n") >= 0)
+    )
+    quoted = np.char.add(np.char.add('"', np.char.replace(values, '"', '""')), '"')
+    return np.where(needs, quoted, values)
+
+def _csv_column(values, decimals: int) -> np.ndarray:
+    """Columna formateada: decimales en formato ES, enteros tal cual, texto escapado."""
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return fmt_number_es_array(values, decimals, nan="")
+    if values.dtype.kind in "iub":
+        return values.astype(np.int64).astype(str)
+    if values.dtype.kind == "M":
+        return fmt_date_es_array(values, nan="")
+    return _csv_text(values)
+
+def iter_csv(chunks, decimals: int = 2):
+    """
+    Genera el CSV (texto) bloque a bloque: la cabecera con el primer bloque y después solo filas.
+    Separador ';' y números en formato ES ("1.234,56"), como los CSV que lee la página de cartera.
+    """
+    header = True
+    for chunk in chunks:
+        if header:
+            yield CSV_SEP.join(_csv_text(np.array(list(chunk))).tolist()) + "\n"
+            header = False
+        cols = [_csv_column(v, decimals) for v in chunk.values()]
+        if not cols or len(cols[0]) == 0:
+            continue
+        rows = cols[0]
+        for col in cols[1:]:
+            rows = np.char.add(np.char.add(rows, CSV_SEP), col)
+        yield "\n".join(rows.tolist()) + "\n"
+
+def write_csv(chunks, fileobj, decimals: int = 2, encoding: str = "utf-8-sig"):
+    """Escribe el CSV en un fichero binario abierto (BOM UTF-8 para que Excel respete los acentos)."""
+    first = True
+    for text in iter_csv(chunks, decimals):
+        fileobj.write(text.encode(encoding if first else encoding.replace("-sig", "")))
+        first = False
+    return fileobj
+
+def write_xlsx(chunks, fileobj, sheet_title: str = "Cuadro"):
+    """
+    Escribe los bloques en un XLSX en modo solo escritura de openpyxl (las filas se vuelcan según llegan).
+    Importes y fechas se guardan como números/fechas con formato ('#,##0.00', 'DD/MM/YYYY'), no como texto.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    header = True
+    for chunk in chunks:
+        if header:
+            ws.append(list(chunk))
+            header = False
+        arrays = [np.asarray(v) for v in chunk.values()]
+        arrays = [a.astype("datetime64[D]") if a.dtype.kind == "M" else a for a in arrays]
+        formats = [
+            XLSX_NUMBER_FORMAT if a.dtype.kind == "f" else XLSX_DATE_FORMAT if a.dtype.kind == "M" else None
+            for a in arrays
+        ]
+        for row in zip(*(a.tolist() for a in arrays)):
+            cells = []
+            for value, number_format in zip(row, formats):
+                if number_format is None:
+                    cells.append(value)
+                    continue
+                cell = WriteOnlyCell(ws, value=value)
+                cell.number_format = number_format
+                cells.append(cell)
+            ws.append(cells)
+    wb.save(fileobj)
+    return fileobj
+
+@timed
+def export_bytes(chunks, fmt: str = "csv") -> bytes:
+    """CSV o XLSX completo en memoria (para st.download_button)."""
+    buffer = io.BytesIO()
+    if fmt == "xlsx":
+        write_xlsx(chunks, buffer)
+    else:
+        write_csv(chunks, buffer)
+    return buffer.getvalue()
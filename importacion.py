@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Importación del cuadro de amortización del banco (CSV/XLSX en formato ES) e inferencia de parámetros (sin Streamlit).
+import numpy as np
+import pandas as pd
+
+from common import annuity_factors, min_term, parse_number_es_array
+
+# Nombres de columna habituales en los cuadros de los bancos (primero coincidencia exacta, luego "contiene")
+BANK_COLUMNS = {
+    "Mes": ["Mes", "Nº cuota", "N.º cuota", "Número de cuota", "Cuota nº", "Nº", "Periodo"],
+    "Fecha": ["Fecha", "Fecha de pago", "Fecha vencimiento", "Vencimiento"],
+    "Saldo final": ["Saldo final", "Saldo pendiente", "Capital pendiente", "Capital vivo", "Saldo", "Pendiente"],
+    "Amortización": ["Amortización", "Amortizacion", "Capital amortizado", "Amortizado", "Principal"],
+    "Intereses": ["Intereses", "Interés", "Interes"],
+    "Cuota": ["Cuota", "Importe cuota", "Recibo", "Importe"],
+}
+# Cambio mínimo de tipo (en tanto por uno mensual) para considerar que hay dos periodos: 0,005 puntos anuales
+MIN_RATE_CHANGE = 0.005 / 1200
+# Mejora mínima del ajuste (suma de cuadrados en €² por fila) para aceptar el cambio de periodo
+MIN_SSE_GAIN_PER_ROW = 1e-4
+
+def read_bank_schedule(fileobj, name: str) -> pd.DataFrame:
+    """Lee el fichero tal cual (CSV con ';' y celdas como texto; en XLSX, números y fechas nativos)."""
+    if name.lower().endswith(".xlsx"):
+        return pd.read_excel(fileobj, dtype=object)
+    return pd.read_csv(fileobj, sep=";", dtype=str, keep_default_na=False)
+
+def _match_columns(columns) -> dict:
+    """Columna del fichero para cada columna estándar (o None). Cada columna del fichero se usa una sola vez."""
+    free = [c for c in columns]
+    found = {}
+    for std, candidates in BANK_COLUMNS.items():
+        found[std] = None
+        for exact in (True, False):
+            for cand in candidates:
+                cl = cand.lower()
+                hit = next(
+                    (c for c in free if (str(c).strip().lower() == cl if exact else cl in str(c).lower())), None
+                )
+                if hit is not None:
+                    found[std] = hit
+                    free.remove(hit)
+                    break
+            if found[std] is not None:
+                break
+    return found
+
+def _parse_dates(values) -> np.ndarray:
+    """Fechas DD/MM/AAAA (o fechas nativas de Excel) -> datetime64[ns] con NaT donde no se pudo leer."""
+    s = pd.Series(values, dtype=object)
+    fechas = pd.to_datetime(s, format="%d/%m/%Y", errors="coerce")
+    if fechas.isna().all():
+        fechas = pd.to_datetime(s, dayfirst=True, errors="coerce")
+    return fechas.to_numpy(dtype="datetime64[ns]")
+
+def normalize_bank_schedule(df: pd.DataFrame) -> dict:
+    """
+    Columnas estándar (Mes, [Fecha], Cuota, Intereses, Amortización, Saldo final y Saldo inicial) como arrays.
+    - Hace falta el saldo y dos de cuota / intereses / amortización: la tercera se deduce.
+    - Se descartan las filas sin saldo legible (totales, notas al pie, filas vacías).
+    Lanza ValueError si el fichero no tiene las columnas mínimas.
+    """
+    cols = _match_columns(df.columns)
+    if cols["Saldo final"] is None:
+        raise ValueError("No se encuentra la columna de saldo / capital pendiente.")
+    if sum(cols[k] is not None for k in ("Cuota", "Intereses", "Amortización")) < 2:
+        raise ValueError("Hacen falta al menos dos columnas de cuota, intereses y amortización.")
+
+    num = {}
+    for std in ("Saldo final", "Cuota", "Intereses", "Amortización", "Mes"):
+        if cols[std] is not None:
+            num[std], _ = parse_number_es_array(df[cols[std]].to_numpy())
+    if "Cuota" not in num:
+        num["Cuota"] = num["Intereses"] + num["Amortización"]
+    elif "Intereses" not in num:
+        num["Intereses"] = num["Cuota"] - num["Amortización"]
+    elif "Amortización" not in num:
+        num["Amortización"] = num["Cuota"] - num["Intereses"]
+
+    ok = np.isfinite(num["Saldo final"]) & np.isfinite(num["Cuota"]) & np.isfinite(num["Intereses"])
+    ok &= np.isfinite(num["Amortización"])
+    if "Mes" in num:
+        ok &= np.isfinite(num["Mes"])
+    if not ok.any():
+        raise ValueError("No hay filas con importes legibles.")
+
+    out = {}
+    if "Mes" in num:
+        out["Mes"] = num["Mes"][ok].astype(np.int64)
+    else:
+        out["Mes"] = np.arange(1, int(ok.sum()) + 1)
+    if cols["Fecha"] is not None:
+        out["Fecha"] = _parse_dates(df[cols["Fecha"]].to_numpy())[ok]
+    for std in ("Cuota", "Intereses", "Amortización", "Saldo final"):
+        out[std] = num[std][ok]
+    # Saldo antes de pagar cada cuota (base sobre la que se devengan los intereses)
+    out["Saldo inicial"] = out["Saldo final"] + out["Amortización"]
+    return out
+
+def _segment_fit(interest: np.ndarray, base: np.ndarray):
+    """
+    Regresión (sin término independiente) intereses = r · saldo inicial para cada posible corte en dos periodos,
+    con sumas acumuladas: O(n) para todos los cortes a la vez.
+    Devuelve (r de un solo tramo, sse de un solo tramo, mejor corte j, r1, r2, sse con corte).
+    """
+    s_ib = np.concatenate(([0.0], np.cumsum(interest * base)))
+    s_bb = np.concatenate(([0.0], np.cumsum(base * base)))
+    s_ii = np.concatenate(([0.0], np.cumsum(interest * interest)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_all = s_ib[-1] / s_bb[-1]
+        sse_all = s_ii[-1] - s_ib[-1] * r_all
+        if interest.size < 2:
+            return r_all, sse_all, None, r_all, r_all, sse_all
+        j = np.arange(1, interest.size)
+        r1 = s_ib[j] / s_bb[j]
+        r2 = (s_ib[-1] - s_ib[j]) / (s_bb[-1] - s_bb[j])
+        sse = (s_ii[j] - s_ib[j] * r1) + (s_ii[-1] - s_ii[j] - (s_ib[-1] - s_ib[j]) * r2)
+    sse = np.where(np.isfinite(sse), sse, np.inf)
+    best = int(np.argmin(sse))
+    return r_all, sse_all, int(j[best]), float(r1[best]), float(r2[best]), float(sse[best])
+
+def infer_loan_parameters(cols: dict, today=None) -> dict:
+    """
+    Parámetros del préstamo que explican el cuadro importado:
+    - tipo mensual por mínimos cuadrados de intereses frente al saldo inicial de cada fila;
+    - cambio de periodo (mixta) en el corte que más reduce el error, si el tipo cambia de verdad;
+    - importe inicial (llevado al mes 0 si el cuadro no empieza en la cuota 1), plazo total
+      (cuotas del cuadro + las que faltarían para saldar lo pendiente) y cuotas ya pagadas a 'today'
+      (solo si el cuadro trae fechas);
+    - redondeo al céntimo si todos los importes son céntimos exactos.
+    """
+    interest, base = cols["Intereses"], cols["Saldo inicial"]
+    r_all, sse_all, j, r1, r2, sse_split = _segment_fit(interest, base)
+    mixed = (
+        j is not None
+        and abs(r2 - r1) >= MIN_RATE_CHANGE
+        and sse_all - sse_split > MIN_SSE_GAIN_PER_ROW * interest.size
+    )
+    meses = cols["Mes"]
+    r_first = r1 if mixed else float(r_all)
+    r_last = r2 if mixed else float(r_all)
+
+    k0 = int(meses[0]) - 1
+    if k0 > 0:
+        growth, accum, _ = annuity_factors(r_first, k0)
+        principal = float((base[0] + cols["Cuota"][0] * accum) / growth)
+    else:
+        principal = float(base[0])
+    saldo_final = float(cols["Saldo final"][-1])
+    pendientes = min_term(saldo_final, r_last, float(cols["Cuota"][-1])) if saldo_final >= 0.01 else 0.0
+    plazo = int(meses[-1]) + (int(pendientes) if np.isfinite(pendientes) else 0)
+
+    meses_pagados = None
+    if "Fecha" in cols and (~np.isnat(cols["Fecha"])).any():
+        hoy = np.datetime64(pd.Timestamp.today().date() if today is None else today, "D")
+        pagadas = cols["Fecha"].astype("datetime64[D]") <= hoy
+        meses_pagados = int(meses[pagadas].max()) if pagadas.any() else 0
+
+    importes = np.concatenate([cols[k] for k in ("Cuota", "Intereses", "Amortización", "Saldo final")])
+    centimos = bool(np.all(np.abs(importes * 100 - np.rint(importes * 100)) < 1e-6))
+    return {
+        "principal": principal,
+        "plazo": plazo,
+        "meses_pagados": meses_pagados,
+        "tin": float(r_all) * 1200,
+        "mes_cambio": int(meses[j - 1]) if mixed else None,
+        "tin_1": r_first * 1200,
+        "tin_2": r_last * 1200,
+        "redondeo": "half_even" if centimos else None,
+        "filas": int(meses.size),
+    }
+
+def reconcile_schedule(cols: dict, engine: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cuadro importado frente al de nuestro motor, fila a fila por número de cuota:
+    banco, calculado y diferencia (calculado - banco) de cuota, intereses y saldo final.
+    """
+    calc = engine.set_index("Mes").reindex(cols["Mes"])
+    out = {"Mes": cols["Mes"]}
+    if "Fecha" in cols:
+        out["Fecha"] = cols["Fecha"]
+    for col in ("Cuota", "Intereses", "Saldo final"):
+        calculado = calc[col].to_numpy(dtype=float)
+        out[f"{col} (banco)"] = cols[col]
+        out[f"{col} (calculado)"] = calculado
+        out[f"Δ {col}"] = calculado - cols[col]
+    return pd.DataFrame(out)
@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 import numpy as np
 import pandas as pd
+import plotly.graph_objects as go
 import streamlit as st
 
-from common import inject_css, euro_input, eur, fmt_number_es, amortization_schedule, render_footer
+from common import (
+    inject_css, euro_input, eur, fmt_number_es, fmt_table_es, amortization_schedule, render_footer,
+    loan_cashflows, tae_from_cashflows, irr_batch, yearly_payments, GRACE_TYPES
+)
+from inversion_calc import (
+    get_comunidades, get_purchase_costs,
+    investment_projection, annual_rollup, scenario_sweep, SWEEP_VARS,
+    monte_carlo_stream, region_comparison
+)
+from metricas import timed
 
 inject_css()
 
@@ -12,51 +22,17 @@ st.title("💹 Analiza Inversión")
 # ============================
 # ✅ TIR (como Excel) — IRR anual con flujos [-aportación, cashflow...]
 # ============================
-def tir_excel(cashflows, tol=1e-10, max_iter=200):
+def tir_excel(cashflows):
     """
     TIR anual estilo Excel (IRR):
     - cashflows[0] suele ser la inversión inicial (negativa)
     - cashflows[1:] los flujos posteriores (anuales)
-    Devuelve la tasa r tal que NPV(r)=0.
+    Devuelve la tasa r tal que NPV(r)=0 con el mismo cálculo que irr_batch (Newton desde el 10 %, como Excel,
+    y bisección si no converge), para coincidir con el barrido y la comparativa por comunidades: con pago
+    final los flujos pueden cambiar de signo dos veces y tener dos TIR.
     Si no existe (p.ej. no hay cambio de signo), devuelve np.nan.
     """
-    cfs = [float(x) for x in cashflows if x is not None]
-
-    # Excel devuelve error si no hay cambio de signo (no hay TIR)
-    if not (any(x < 0 for x in cfs) and any(x > 0 for x in cfs)):
-        return np.nan
-
-    def npv(r):
-        return sum(cf / ((1.0 + r) ** i) for i, cf in enumerate(cfs))
-
-    # Búsqueda por bisección (robusta)
-    lo = -0.999999  # cercano a -100% (sin llegar)
-    hi = 0.10       # 10% inicial
-    f_lo = npv(lo)
-    f_hi = npv(hi)
-
-    # Expandimos hi hasta encontrar cambio de signo o límite
-    attempts = 0
-    while f_lo * f_hi > 0 and attempts < 60:
-        hi = hi * 2 + 0.05
-        f_hi = npv(hi)
-        attempts += 1
-
-    if f_lo * f_hi > 0:
-        return np.nan
-
-    for _ in range(max_iter):
-        mid = (lo + hi) / 2.0
-        f_mid = npv(mid)
-        if abs(f_mid) < tol:
-            return mid
-        if f_lo * f_mid <= 0:
-            hi = mid
-        else:
-            lo = mid
-            f_lo = f_mid
-
-    return (lo + hi) / 2.0
+    return irr_batch(np.array([float(x) for x in cashflows if x is not None]), guess=0.1)
 
 
 st.markdown(
@@ -96,16 +72,38 @@ with st.form("params_form_inversion", clear_on_submit=False):
             "Interés aplicado (% TIN anual)",
             min_value=0.0, max_value=30.0, value=2.7, step=0.05, format="%.2f", key="interes_inv"
         )
+
+    c5, c6, c7 = st.columns([1, 1, 1])
+    with c5:
+        carencia_inv = st.number_input(
+            "Meses de carencia", min_value=0, max_value=60, value=0, step=1, key="carencia_inv",
+            help="Periodo inicial sin amortizar capital (habitual en promociones o reformas)."
+        )
+    with c6:
+        tipo_carencia_inv = st.selectbox(
+            "Tipo de carencia", options=list(GRACE_TYPES), format_func=lambda k: GRACE_TYPES[k],
+            key="tipo_carencia_inv"
+        )
+    with c7:
+        pago_final_inv = euro_input(
+            "Pago final (balloon) (€)", key="pago_final_inv_eur", default=0.0, min_value=0.0,
+            help_text="Capital que queda pendiente y se paga de una vez con la última cuota."
+        )
     _ = st.form_submit_button("✅ Calcular cuota")
 
 importe_financiado = precio_vivienda * pct_financiacion / 100
 n_meses_inv = plazo_inv * 12
 r_mensual_inv = (interes_inv / 100.0) / 12.0
-df_inv = amortization_schedule(importe_financiado, r_mensual_inv, n_meses_inv)
+meses_carencia_inv = int(min(carencia_inv, max(n_meses_inv - 1, 0)))
+df_inv = amortization_schedule(
+    importe_financiado, r_mensual_inv, n_meses_inv,
+    grace_months=meses_carencia_inv, grace_type=tipo_carencia_inv, balloon=pago_final_inv
+)
 
 cuota_mensual_inv = 0.0
 if not df_inv.empty:
-    cuota_mensual_inv = float(df_inv["Cuota"].iloc[0])
+    # Cuota ordinaria: la del primer mes tras la carencia
+    cuota_mensual_inv = float(df_inv["Cuota"].iloc[meses_carencia_inv])
 
     st.markdown(
         f"""
@@ -122,6 +120,14 @@ if not df_inv.empty:
         """,
         unsafe_allow_html=True
     )
+    if meses_carencia_inv > 0:
+        st.caption(
+            f"Durante los {meses_carencia_inv} meses de carencia la cuota es "
+            f"{eur(float(df_inv['Cuota'].iloc[0]))}"
+            + (" (los intereses se suman al capital)." if tipo_carencia_inv == "full" else " (solo intereses).")
+        )
+    if pago_final_inv > 0:
+        st.caption(f"Última cuota con pago final: {eur(float(df_inv['Cuota'].iloc[-1]))}.")
 
 st.divider()
 
@@ -135,27 +141,8 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-comunidades = {
-    "IVA (Vivienda nueva)": (0.10, 0.012),
-    "Andalucía": (0.07, 0.015),
-    "Aragón": (0.085, 0.012),
-    "Asturias": (0.08, 0.015),
-    "Baleares": (0.08, 0.0075),
-    "Canarias": (0.065, 0.015),
-    "Cantabria": (0.08, 0.015),
-    "Castilla León": (0.08, 0.015),
-    "Castilla la Mancha": (0.09, 0.015),
-    "Cataluña": (0.10, 0.015),
-    "Comunidad Valenciana": (0.10, 0.015),
-    "Extremadura": (0.08, 0.015),
-    "Galicia": (0.10, 0.015),
-    "Comunidad de Madrid": (0.06, 0.0075),
-    "Murcia": (0.08, 0.015),
-    "Navarra": (0.06, 0.005),
-    "País Vasco": (0.07, 0.005),
-    "La Rioja": (0.07, 0.01)
-}
 
+comunidades = get_comunidades()
 comunidad = st.selectbox("Comunidad Autónoma", list(comunidades.keys()), key="comunidad_inv")
 itp, ajd = comunidades[comunidad]
 
@@ -170,10 +157,12 @@ def _fmt_pct(x: float) -> str:
 itp_text = _fmt_pct(itp * 100)
 ajd_text = _fmt_pct(ajd * 100)
 
-registro_notaria = 1500.0
-tasacion = 400.0
-gestoria = 400.0
-comision_apertura = importe_financiado * 0.02
+gastos_compra = get_purchase_costs()
+registro_notaria = gastos_compra["registro_notaria"]
+tasacion = gastos_compra["tasacion"]
+gestoria = gastos_compra["gestoria"]
+comision_apertura = importe_financiado * gastos_compra["comision_apertura_pct"]
+comision_text = _fmt_pct(gastos_compra["comision_apertura_pct"] * 100)
 
 aportacion_extra = euro_input(
     "Aportación extra (reforma / otro concepto) (€)",
@@ -204,7 +193,21 @@ with cB:
     )
 
 cC.metric("🧾 Gastos fijos (Reg.+Not.+Tas.+Gest.)", eur(gastos_fijos))
-st.metric("💸 Comisión de apertura (2%)", eur(comision_apertura))
+
+tae_inv = np.nan
+if importe_financiado > 0:
+    tae_inv = tae_from_cashflows(
+        loan_cashflows(
+            importe_financiado, r_mensual_inv, n_meses_inv, comision_apertura, tasacion,
+            cuotas=df_inv["Cuota"].to_numpy()
+        )
+    )
+cD, cE = st.columns(2)
+cD.metric(f"💸 Comisión de apertura ({comision_text}%)", eur(comision_apertura))
+cE.metric(
+    "📈 TAE de la hipoteca (comisión + tasación)",
+    "—" if np.isnan(tae_inv) else f"{fmt_number_es(tae_inv * 100, 2)} %"
+)
 
 st.markdown(
     f"""
@@ -229,7 +232,7 @@ resumen_df = pd.DataFrame({
         "Registro y Notaría",
         "Tasación inmueble",
         "Gestoría",
-        "Comisión apertura (2%)",
+        f"Comisión apertura ({comision_text}%)",
         "Aportación extra (reforma / otros)",
         "TOTAL APORTACIÓN INICIAL"
     ],
@@ -246,11 +249,11 @@ resumen_df = pd.DataFrame({
 })
 
 with st.expander("📘 Resumen — Aportación Inicial", expanded=False):
-    st.dataframe(resumen_df.style.format({"Importe": eur}), use_container_width=True)
+    st.dataframe(fmt_table_es(resumen_df, {"Importe": "eur"}), use_container_width=True)
 
 st.caption(
-    "Nota: Gastos fijos asumidos: Registro y Notaría = 1.500 €, Tasación = 400 €, Gestoría = 400 €. "
-    "La comisión de apertura es el 2% del importe financiado."
+    f"Nota: Gastos fijos asumidos: Registro y Notaría = {eur(registro_notaria)}, Tasación = {eur(tasacion)}, "
+    f"Gestoría = {eur(gestoria)}. La comisión de apertura es el {comision_text}% del importe financiado."
 )
 
 st.divider()
@@ -277,14 +280,18 @@ with st.form("params_form_alquiler", clear_on_submit=False):
     _ = st.form_submit_button("✅ Calcular cashflow")
 
 ingresos_anuales = alquiler_mensual * 12
-hipoteca_anual = float(cuota_mensual_inv) * 12
+# Cuotas del primer año según el cuadro (carencia, pago final y 0 tras el vencimiento), como en la rentabilidad
+hipoteca_anual = float(yearly_payments(
+    importe_financiado, r_mensual_inv, n_meses_inv, 1,
+    grace_months=meses_carencia_inv, grace_type=tipo_carencia_inv, balloon=pago_final_inv,
+)[0])
 otros_gastos_anuales = ibi_anual + comunidad_mensual * 12 + mantenimiento_anual + seguros_mensual * 12
 gastos_anuales_totales = otros_gastos_anuales + hipoteca_anual
 cashflow_anual = ingresos_anuales - gastos_anuales_totales
 
 cA, cB, cC = st.columns(3)
 cA.metric("📈 Ingresos anuales por alquiler", eur(ingresos_anuales))
-cB.metric("🏦 Gastos de hipoteca anuales", eur(hipoteca_anual))
+cB.metric("🏦 Gastos de hipoteca (año 1)", eur(hipoteca_anual))
 cC.metric("📉 Otros gastos anuales (IBI + comunidad + mantenimiento + seguros)", eur(otros_gastos_anuales))
 
 st.markdown(
@@ -296,7 +303,7 @@ st.markdown(
         padding:1rem 1.25rem;
         margin:.5rem 0 1rem 0;
     ">
-      <div class="value-title">💧 Cashflow anual</div>
+      <div class="value-title">💧 Cashflow anual (año 1)</div>
       <div class="value-big">{eur(cashflow_anual)}</div>
     </div>
     """,
@@ -304,136 +311,664 @@ st.markdown(
 )
 
 st.caption("El cashflow anual mostrado **incluye** hipoteca. No incluye vacancias, IRPF ni otros posibles ajustes.")
+if meses_carencia_inv > 0 or pago_final_inv > 0:
+    st.caption(
+        f"Con carencia o pago final el cashflow cambia de un año a otro: en un año con la cuota ordinaria es "
+        f"{eur(ingresos_anuales - otros_gastos_anuales - cuota_mensual_inv * 12)}. "
+        "La rentabilidad usa el cashflow de cada año."
+    )
 
 st.divider()
 
 # ==========================
-# Rentabilidad
+# Secciones que se recalculan por separado (st.fragment)
 # ==========================
-st.markdown("<h2 style='margin:0 0 .5rem 0'>📈 Rentabilidad</h2>", unsafe_allow_html=True)
-st.markdown(
-    """
-    <div class="param-subtle" style="margin-bottom:.5rem">
-      Ratios clave de la inversión. Valores destacados en verde y una breve descripción bajo cada uno.
-    </div>
-    """,
-    unsafe_allow_html=True
-)
-
-horizonte_anios = st.number_input(
-    "Horizonte (años) para comparar el interés compuesto / TIR",
-    min_value=1, max_value=40, value=int(plazo_inv), step=1, key="horizonte_comp"
-)
-
-r_simple = 0.0 if (aportacion_total <= 0) else (cashflow_anual / aportacion_total)
-r_comp = ((1 + horizonte_anios * r_simple) ** (1 / horizonte_anios)) - 1
+# Todo lo anterior (hipoteca, aportación y alquiler) alimenta a las secciones siguientes y se pasa
+# explícitamente en 'datos'. Las secciones son fragmentos hermanos (ninguno ejecuta a otro): el formulario
+# del barrido o del Monte Carlo solo vuelve a ejecutar su sección. El horizonte y los supuestos de la
+# proyección los usan varias secciones, así que están fuera de los fragmentos y cambiarlos ejecuta la página;
+# el barrido guarda su último resultado y solo se recalcula si cambian sus entradas.
+datos_inv = {
+    "plazo_inv": plazo_inv,
+    "precio_vivienda": precio_vivienda,
+    "pct_financiacion": pct_financiacion,
+    "interes_inv": interes_inv,
+    "alquiler_mensual": alquiler_mensual,
+    "otros_gastos_anuales": otros_gastos_anuales,
+    "aportacion_extra": aportacion_extra,
+    "aportacion_total": aportacion_total,
+    "comunidad": comunidad,
+    "importe_financiado": importe_financiado,
+    "r_mensual_inv": r_mensual_inv,
+    "n_meses_inv": n_meses_inv,
+    "meses_carencia_inv": meses_carencia_inv,
+    "tipo_carencia_inv": tipo_carencia_inv,
+    "pago_final_inv": pago_final_inv,
+    "itp": itp,
+    "ajd": ajd,
+}
 
 def fmt_pct(x: float) -> str:
     if x is None or (isinstance(x, float) and np.isnan(x)):
         return "—"
     return f"{fmt_number_es(x * 100, 2)} %"
 
-# --- TIR anual (como Excel) ---
-n_h = int(horizonte_anios)
-tir = np.nan
-if aportacion_total > 0:
-    tir = tir_excel([-float(aportacion_total)] + [float(cashflow_anual)] * n_h)
+def comp_equiv(r: float, n: int) -> float:
+    base = 1 + n * r
+    return (base ** (1 / n) - 1) if base > 0 else np.nan
 
-c1, c2, c3 = st.columns(3)
+@timed
+def _fan_chart(res: dict):
+    cfp = res["cashflow"]
+    years_fan = np.arange(1, len(cfp[50]) + 1)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=years_fan, y=cfp[95], line=dict(width=0), showlegend=False, hoverinfo="skip"))
+    fig.add_trace(go.Scatter(
+        x=years_fan, y=cfp[5], fill="tonexty", line=dict(width=0), name="P5–P95",
+        fillcolor="rgba(74,144,226,0.18)"
+    ))
+    fig.add_trace(go.Scatter(x=years_fan, y=cfp[75], line=dict(width=0), showlegend=False, hoverinfo="skip"))
+    fig.add_trace(go.Scatter(
+        x=years_fan, y=cfp[25], fill="tonexty", line=dict(width=0), name="P25–P75",
+        fillcolor="rgba(74,144,226,0.40)"
+    ))
+    fig.add_trace(go.Scatter(x=years_fan, y=cfp[50], name="Mediana", line=dict(color="#1f4e8c", width=2)))
+    fig.update_layout(
+        title=f"Cashflow anual simulado — {res['simulaciones']} simulaciones",
+        xaxis_title="Año",
+        yaxis_title="€",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+    )
+    return fig
+
+def _render_mc(res: dict, chart_key: str):
+    tp = res["tir"]
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("📉 TIR P5", fmt_pct(tp[5]))
+    k2.metric("📌 TIR mediana", fmt_pct(tp[50]))
+    k3.metric("📈 TIR P95", fmt_pct(tp[95]))
+    k4.metric("⚠️ Escenarios sin TIR", f"{fmt_number_es(res['tir_no_definida'] * 100, 1)} %")
+    st.plotly_chart(_fan_chart(res), use_container_width=True, key=chart_key)
+
+@st.fragment
+@timed
+def seccion_rentabilidad(datos: dict, n_h: int):
+    """Ratios de rentabilidad al horizonte n_h, comparativa por año y por comunidad."""
+    plazo_inv = datos["plazo_inv"]
+    precio_vivienda = datos["precio_vivienda"]
+    pct_financiacion = datos["pct_financiacion"]
+    interes_inv = datos["interes_inv"]
+    alquiler_mensual = datos["alquiler_mensual"]
+    otros_gastos_anuales = datos["otros_gastos_anuales"]
+    aportacion_extra = datos["aportacion_extra"]
+    aportacion_total = datos["aportacion_total"]
+    comunidad = datos["comunidad"]
+    importe_financiado = datos["importe_financiado"]
+    r_mensual_inv = datos["r_mensual_inv"]
+    n_meses_inv = datos["n_meses_inv"]
+    meses_carencia_inv = datos["meses_carencia_inv"]
+    tipo_carencia_inv = datos["tipo_carencia_inv"]
+    pago_final_inv = datos["pago_final_inv"]
+
+    # Cashflow de cada año con las cuotas reales del cuadro (carencia, pago final y 0 tras el vencimiento)
+    cuotas_anio = yearly_payments(
+        importe_financiado, r_mensual_inv, n_meses_inv, n_h,
+        grace_months=meses_carencia_inv, grace_type=tipo_carencia_inv, balloon=pago_final_inv,
+    )
+    cashflows_anio = alquiler_mensual * 12 - otros_gastos_anuales - cuotas_anio
+
+    r_simple = 0.0 if (aportacion_total <= 0) else float(cashflows_anio.mean() / aportacion_total)
+    r_comp = comp_equiv(r_simple, n_h)
+
+    # --- TIR anual (como Excel) ---
+    tir = np.nan
+    if aportacion_total > 0:
+        tir = tir_excel([-float(aportacion_total)] + cashflows_anio.tolist())
+
+    c1, c2, c3 = st.columns(3)
+
+    with c1:
+        st.markdown(
+            f"""
+            <div style="
+                background:#e8f5e9;
+                border:1px solid #4caf50;
+                border-radius:12px;
+                padding:1rem 1.25rem;
+                margin:.5rem 0 1rem 0;
+            ">
+              <div class="value-title">💶 Rentabilidad sobre aportación (Cash-on-Cash)</div>
+              <div class="value-big">{fmt_pct(r_simple)}</div>
+              <div style="font-size:0.9em;color:#5f6570;margin-top:.35rem">
+                <em>Cashflow anual medio del horizonte / Aportación inicial</em>. También llamado <strong>Cash-on-Cash Return (CoC)</strong>.
+              </div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
-with c1:
+    with c2:
+        st.markdown(
+            f"""
+            <div style="
+                background:#e8f5e9;
+                border:1px solid #4caf50;
+                border-radius:12px;
+                padding:1rem 1.25rem;
+                margin:.5rem 0 1rem 0;
+            ">
+              <div class="value-title">📈 Interés compuesto equivalente</div>
+              <div class="value-big">{fmt_pct(r_comp)}</div>
+              <div style="font-size:0.9em;color:#5f6570;margin-top:.35rem">
+                Tasa anual constante que, durante {n_h} año(s), genera el mismo beneficio que una
+                rentabilidad simple de {fmt_pct(r_simple)}. (Fórmula: <em>((1 + n·r)<sup>1/n</sup> − 1)</em>).<br/>
+                También conocida como <strong>Tasa Anual Equivalente (TAE) de la inversión</strong>.
+              </div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+    with c3:
+        st.markdown(
+            f"""
+            <div style="
+                background:#e8f5e9;
+                border:1px solid #4caf50;
+                border-radius:12px;
+                padding:1rem 1.25rem;
+                margin:.5rem 0 1rem 0;
+            ">
+              <div class="value-title">📌 TIR (como Excel)</div>
+              <div class="value-big">{fmt_pct(tir)}</div>
+              <div style="font-size:0.9em;color:#5f6570;margin-top:.35rem">
+                Calculada como <strong>TIR/IRR</strong> con flujos anuales:
+                <em>[-aportación inicial, cashflow año 1, cashflow año 2, ...]</em> durante {n_h} año(s),
+                con las cuotas del cuadro (carencia y pago final incluidos).
+                Si no hay cambio de signo (p.ej. cashflow negativo), la TIR no está definida.
+              </div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+    # ==========================
+    # Tabla comparativa por año
+    # ==========================
+    years_list = list(range(1, n_h + 1))
+
+    tir_por_anio = []
+    if aportacion_total > 0:
+        for n in years_list:
+            tir_por_anio.append(tir_excel([-float(aportacion_total)] + cashflows_anio[:n].tolist()))
+    else:
+        tir_por_anio = [np.nan] * n_h
+
+    # Cash-on-Cash hasta cada año: cashflow medio de los n primeros años / aportación
+    coc_por_anio = (
+        np.cumsum(cashflows_anio) / np.array(years_list) / aportacion_total
+        if aportacion_total > 0 else np.zeros(n_h)
+    )
+    df_ratios = pd.DataFrame({
+        "Año": years_list,
+        "Rentabilidad sobre aportación (Cash-on-Cash)": coc_por_anio,
+        "Interés compuesto equivalente": [comp_equiv(c, n) for c, n in zip(coc_por_anio, years_list)],
+        "TIR (como Excel)": tir_por_anio
+    })
+
+    df_display = df_ratios.copy()
+    df_display["Rentabilidad sobre aportación (Cash-on-Cash)"] = df_display["Rentabilidad sobre aportación (Cash-on-Cash)"].map(fmt_pct)
+    df_display["Interés compuesto equivalente"] = df_display["Interés compuesto equivalente"].map(fmt_pct)
+    df_display["TIR (como Excel)"] = df_display["TIR (como Excel)"].map(fmt_pct)
+
+    with st.expander("🔍 Comparativa por año (CoC vs compuesto vs TIR)", expanded=False):
+        st.dataframe(df_display, use_container_width=True, hide_index=True)
+
+    # ==========================
+    # ¿Dónde es más barato comprar? (todas las comunidades a la vez)
+    # ==========================
+    regiones_cmp = region_comparison(
+        precio=precio_vivienda,
+        pct_financiacion=pct_financiacion,
+        tin_pct=interes_inv,
+        alquiler_mensual=alquiler_mensual,
+        otros_gastos_anuales=otros_gastos_anuales,
+        plazo_anios=plazo_inv,
+        horizonte_anios=n_h,
+        aportacion_extra=aportacion_extra,
+        meses_carencia=meses_carencia_inv,
+        tipo_carencia=tipo_carencia_inv,
+        pago_final=pago_final_inv,
+    )
+    regiones_df = pd.DataFrame(regiones_cmp)
+    regiones_df["Diferencia vs seleccionada"] = regiones_df["Aportación total"] - aportacion_total
+
+    with st.expander("🗺️ ¿Dónde es más barato comprar? Comparativa de todas las comunidades", expanded=False):
+        st.dataframe(
+            fmt_table_es(regiones_df, {
+                "ITP/IVA": {"kind": "pct", "trim_zeros": True},
+                "AJD": {"kind": "pct", "trim_zeros": True},
+                "Impuestos": "eur",
+                "Aportación total": "eur",
+                "Cash-on-Cash": "pct",
+                "TIR": "pct",
+                "Diferencia vs seleccionada": "eur",
+            }).style.apply(
+                lambda row: ["font-weight:700;background:#e8f0fe" if row["Comunidad"] == comunidad else "" for _ in row],
+                axis=1
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+        st.caption(
+            "Ordenado de menor a mayor aportación inicial. Mismos precio, financiación, hipoteca y alquiler; "
+            f"solo cambian los impuestos. Resaltada la comunidad seleccionada ({comunidad})."
+        )
+
+
+def formulario_proyeccion() -> dict:
+    """Supuestos de la proyección (también los usa el Monte Carlo): subida de alquiler, inflación, revalorización y venta."""
+    # ==========================
+    # Proyección a horizonte (amortización, revalorización y venta)
+    # ==========================
     st.markdown(
-        f"""
-        <div style="
-            background:#e8f5e9;
-            border:1px solid #4caf50;
-            border-radius:12px;
-            padding:1rem 1.25rem;
-            margin:.5rem 0 1rem 0;
-        ">
-          <div class="value-title">💶 Rentabilidad sobre aportación (Cash-on-Cash)</div>
-          <div class="value-big">{fmt_pct(r_simple)}</div>
-          <div style="font-size:0.9em;color:#5f6570;margin-top:.35rem">
-            <em>Cashflow anual / Aportación inicial</em>. También llamado <strong>Cash-on-Cash Return (CoC)</strong>.
-          </div>
+        """
+        <div class="param-header">
+          <span class="param-chip">Proyección con venta</span>
+          <span class="param-subtle">
+            Mes a mes durante el horizonte: subida de alquiler, inflación de gastos, amortización de la hipoteca,
+            revalorización del inmueble y venta al final.
+          </span>
         </div>
         """,
         unsafe_allow_html=True
     )
 
-with c2:
+    with st.form("params_form_proyeccion", clear_on_submit=False):
+        p1, p2, p3, p4 = st.columns(4)
+        with p1:
+            subida_alquiler_pct = st.number_input(
+                "Subida anual del alquiler (%)",
+                min_value=-10.0, max_value=20.0, value=2.0, step=0.1, format="%.2f", key="subida_alq_inv"
+            )
+        with p2:
+            inflacion_gastos_pct = st.number_input(
+                "Inflación anual de gastos (%)",
+                min_value=-10.0, max_value=20.0, value=2.0, step=0.1, format="%.2f", key="infl_gastos_inv"
+            )
+        with p3:
+            revalorizacion_pct = st.number_input(
+                "Revalorización anual del inmueble (%)",
+                min_value=-20.0, max_value=20.0, value=2.0, step=0.1, format="%.2f", key="reval_inv"
+            )
+        with p4:
+            gastos_venta_pct = st.number_input(
+                "Gastos de venta (% sobre precio de venta)",
+                min_value=0.0, max_value=20.0, value=5.0, step=0.5, format="%.2f", key="gastos_venta_inv"
+            )
+        _ = st.form_submit_button("✅ Calcular proyección")
+
+    supuestos = dict(
+        subida_alquiler=subida_alquiler_pct / 100.0,
+        inflacion_gastos=inflacion_gastos_pct / 100.0,
+        revalorizacion=revalorizacion_pct / 100.0,
+        gastos_venta=gastos_venta_pct / 100.0,
+    )
+    return supuestos
+
+@st.fragment
+@timed
+def seccion_proyeccion(datos: dict, n_h: int, supuestos: dict):
+    """Proyección mes a mes con venta al horizonte."""
+    precio_vivienda = datos["precio_vivienda"]
+    importe_financiado = datos["importe_financiado"]
+    r_mensual_inv = datos["r_mensual_inv"]
+    n_meses_inv = datos["n_meses_inv"]
+    aportacion_total = datos["aportacion_total"]
+    alquiler_mensual = datos["alquiler_mensual"]
+    otros_gastos_anuales = datos["otros_gastos_anuales"]
+    meses_carencia_inv = datos["meses_carencia_inv"]
+    tipo_carencia_inv = datos["tipo_carencia_inv"]
+    pago_final_inv = datos["pago_final_inv"]
+
+    proy_cols, valor_salida_neto, tir_con_venta = investment_projection(
+        precio=precio_vivienda,
+        importe_financiado=importe_financiado,
+        r_m=r_mensual_inv,
+        n_meses=n_meses_inv,
+        aportacion=aportacion_total,
+        alquiler_mensual=alquiler_mensual,
+        gastos_mensuales=otros_gastos_anuales / 12.0,
+        horizonte_anios=n_h,
+        **supuestos,
+        meses_carencia=meses_carencia_inv,
+        tipo_carencia=tipo_carencia_inv,
+        pago_final=pago_final_inv,
+    )
+    proy_anual = pd.DataFrame(annual_rollup(proy_cols))
+
+    cashflow_acumulado = float(proy_anual["Cashflow acumulado"].iloc[-1])
+    patrimonio_final = float(proy_anual["Patrimonio neto"].iloc[-1])
+
+    q1, q2, q3, q4 = st.columns(4)
+    q1.metric("📌 TIR con venta (flujos mensuales)", fmt_pct(tir_con_venta))
+    q2.metric("🏠 Valor neto de venta (tras saldo y gastos)", eur(valor_salida_neto))
+    q3.metric("🧱 Patrimonio neto al final", eur(patrimonio_final))
+    q4.metric("💧 Cashflow acumulado", eur(cashflow_acumulado))
+
+    proy_fig = go.Figure()
+    proy_fig.add_trace(go.Bar(x=proy_anual["Año"], y=proy_anual["Cashflow"], name="Cashflow anual"))
+    proy_fig.add_trace(go.Scatter(x=proy_anual["Año"], y=proy_anual["Patrimonio neto"], name="Patrimonio neto (valor - saldo)"))
+    proy_fig.add_trace(go.Scatter(x=proy_anual["Año"], y=proy_anual["Saldo hipoteca"], name="Saldo hipoteca"))
+    proy_fig.update_layout(
+        title="Proyección anual: cashflow, patrimonio neto y saldo pendiente",
+        xaxis_title="Año",
+        yaxis_title="€",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+    )
+    st.plotly_chart(proy_fig, use_container_width=True)
+
+    with st.expander("🔍 Proyección por año (detalle)", expanded=False):
+        st.dataframe(
+            fmt_table_es(proy_anual, {c: "eur" for c in proy_anual.columns if c != "Año"}),
+            use_container_width=True,
+            hide_index=True
+        )
+
+    st.caption(
+        "La TIR con venta usa flujos mensuales: -aportación inicial, cashflow de cada mes y, en el último mes, "
+        "el valor de venta neto de gastos menos el saldo pendiente de la hipoteca. Resultado anualizado."
+    )
+
+
+@st.fragment
+@timed
+def seccion_barrido(datos: dict, n_h: int):
+    """Barrido de escenarios (mapa de calor) sobre la malla de variables elegida."""
+    precio_vivienda = datos["precio_vivienda"]
+    pct_financiacion = datos["pct_financiacion"]
+    interes_inv = datos["interes_inv"]
+    alquiler_mensual = datos["alquiler_mensual"]
+    otros_gastos_anuales = datos["otros_gastos_anuales"]
+    plazo_inv = datos["plazo_inv"]
+    itp = datos["itp"]
+    ajd = datos["ajd"]
+    aportacion_extra = datos["aportacion_extra"]
+    meses_carencia_inv = datos["meses_carencia_inv"]
+    tipo_carencia_inv = datos["tipo_carencia_inv"]
+    pago_final_inv = datos["pago_final_inv"]
+
+    # ==========================
+    # Barrido de escenarios (mapa de calor)
+    # ==========================
     st.markdown(
-        f"""
-        <div style="
-            background:#e8f5e9;
-            border:1px solid #4caf50;
-            border-radius:12px;
-            padding:1rem 1.25rem;
-            margin:.5rem 0 1rem 0;
-        ">
-          <div class="value-title">📈 Interés compuesto equivalente</div>
-          <div class="value-big">{fmt_pct(r_comp)}</div>
-          <div style="font-size:0.9em;color:#5f6570;margin-top:.35rem">
-            Tasa anual constante que, durante {int(horizonte_anios)} año(s), genera el mismo beneficio que una
-            rentabilidad simple de {fmt_pct(r_simple)}. (Fórmula: <em>((1 + n·r)<sup>1/n</sup> − 1)</em>).<br/>
-            También conocida como <strong>Tasa Anual Equivalente (TAE) de la inversión</strong>.
-          </div>
+        """
+        <div class="param-header">
+          <span class="param-chip">Barrido de escenarios</span>
+          <span class="param-subtle">
+            Elige 2 (o 3) variables y sus rangos: calculamos Cash-on-Cash, compuesto equivalente y TIR
+            para toda la malla de una vez (mismos impuestos de la comunidad y gastos fijos).
+          </span>
         </div>
         """,
         unsafe_allow_html=True
     )
 
-with c3:
+    sweep_defaults = {
+        "precio": (precio_vivienda * 0.5, precio_vivienda * 1.5),
+        "pct_financiacion": (50.0, 100.0),
+        "tin_pct": (max(interes_inv - 1.5, 0.0), interes_inv + 1.5),
+        "alquiler_mensual": (alquiler_mensual * 0.5, alquiler_mensual * 1.5),
+    }
+    sweep_metricas = {
+        "TIR": "TIR (como Excel)",
+        "Cash-on-Cash": "Rentabilidad sobre aportación (Cash-on-Cash)",
+        "Interés compuesto equivalente": "Interés compuesto equivalente",
+    }
+    sweep_keys = list(SWEEP_VARS.keys())
+
+    with st.form("params_form_barrido", clear_on_submit=False):
+        s1, s2, s3, s4 = st.columns(4)
+        with s1:
+            var_x = st.selectbox("Eje X", sweep_keys, index=0, format_func=SWEEP_VARS.get, key="sweep_x_inv")
+        with s2:
+            var_y = st.selectbox("Eje Y", sweep_keys, index=3, format_func=SWEEP_VARS.get, key="sweep_y_inv")
+        with s3:
+            var_z = st.selectbox(
+                "Tercera variable (opcional)", ["—"] + sweep_keys, index=0,
+                format_func=lambda k: SWEEP_VARS.get(k, "—"), key="sweep_z_inv"
+            )
+        with s4:
+            metrica_sweep = st.selectbox(
+                "Métrica del mapa", list(sweep_metricas.keys()),
+                format_func=sweep_metricas.get, key="sweep_metric_inv"
+            )
+
+        r1, r2, r3 = st.columns(3)
+        with r1:
+            n_x = st.slider("Puntos eje X", min_value=5, max_value=100, value=40, step=5, key="sweep_nx_inv")
+        with r2:
+            n_y = st.slider("Puntos eje Y", min_value=5, max_value=100, value=40, step=5, key="sweep_ny_inv")
+        with r3:
+            n_z = st.slider("Valores tercera variable", min_value=2, max_value=6, value=3, step=1, key="sweep_nz_inv")
+
+        st.caption("Rangos (mínimo y máximo) de cada variable. Solo se usan los de las variables elegidas.")
+        rango_cols = st.columns(len(sweep_keys))
+        sweep_rangos = {}
+        for col, var in zip(rango_cols, sweep_keys):
+            lo_def, hi_def = sweep_defaults[var]
+            with col:
+                lo = st.number_input(f"{SWEEP_VARS[var]} — mín.", value=float(round(lo_def, 2)), key=f"sweep_lo_{var}")
+                hi = st.number_input(f"{SWEEP_VARS[var]} — máx.", value=float(round(hi_def, 2)), key=f"sweep_hi_{var}")
+            sweep_rangos[var] = (min(lo, hi), max(lo, hi))
+
+        _ = st.form_submit_button("🧪 Calcular barrido")
+
+    ejes_sweep = [var_x, var_y] + ([var_z] if var_z != "—" else [])
+    if len(set(ejes_sweep)) < len(ejes_sweep):
+        st.warning("Elige variables distintas para cada eje del barrido.")
+    else:
+        n_puntos = {var_x: n_x, var_y: n_y, var_z: n_z}
+        axes_sweep = {v: np.linspace(*sweep_rangos[v], n_puntos[v]) for v in ejes_sweep}
+        base_sweep = dict(
+            precio=precio_vivienda,
+            pct_financiacion=pct_financiacion,
+            tin_pct=interes_inv,
+            alquiler_mensual=alquiler_mensual,
+            otros_gastos_anuales=otros_gastos_anuales,
+            plazo_anios=plazo_inv,
+            horizonte_anios=n_h,
+            itp=itp,
+            ajd=ajd,
+            aportacion_extra=aportacion_extra,
+            meses_carencia=meses_carencia_inv,
+            tipo_carencia=tipo_carencia_inv,
+            pago_final=pago_final_inv,
+        )
+        # Se recalcula solo si cambian sus entradas (las ejecuciones de página completas reutilizan el último)
+        firma_sweep = (
+            tuple(base_sweep.items()), tuple((v, tuple(a)) for v, a in axes_sweep.items()), metrica_sweep
+        )
+        guardado = st.session_state.get("sweep_inv_resultado")
+        if guardado is None or guardado[0] != firma_sweep:
+            guardado = (firma_sweep, scenario_sweep(base_sweep, axes_sweep)[metrica_sweep] * 100.0)
+            st.session_state["sweep_inv_resultado"] = guardado
+        z_all = guardado[1]
+
+        @timed(nombre="inversion._heatmap")
+        def _heatmap(z2d, titulo):
+            fig = go.Figure(data=go.Heatmap(
+                x=axes_sweep[var_x],
+                y=axes_sweep[var_y],
+                z=z2d.T,
+                colorscale="RdYlGn",
+                zmid=0,
+                colorbar=dict(title="%"),
+                hovertemplate=f"{SWEEP_VARS[var_x]}: %{{x:,.2f}}<br>{SWEEP_VARS[var_y]}: %{{y:,.2f}}<br>%{{z:.2f}} %<extra></extra>",
+            ))
+            fig.update_layout(title=titulo, xaxis_title=SWEEP_VARS[var_x], yaxis_title=SWEEP_VARS[var_y])
+            return fig
+
+        titulo_base = f"{sweep_metricas[metrica_sweep]} (%) — horizonte {n_h} año(s)"
+        if var_z == "—":
+            st.plotly_chart(_heatmap(z_all, titulo_base), use_container_width=True)
+        else:
+            tabs_z = st.tabs([f"{SWEEP_VARS[var_z]} = {fmt_number_es(v, 2)}" for v in axes_sweep[var_z]])
+            for iz, tab in enumerate(tabs_z):
+                with tab:
+                    st.plotly_chart(_heatmap(z_all[:, :, iz], titulo_base), use_container_width=True)
+
+        st.caption(
+            "Celdas en blanco: TIR no definida (sin cambio de signo en los flujos, p.ej. cashflow negativo). "
+            "El resto de parámetros se toman de los bloques anteriores."
+        )
+
+@st.fragment
+@timed
+def seccion_riesgo(datos: dict, n_h: int, supuestos: dict):
+    """Monte Carlo con los supuestos de la proyección (subida de alquiler, inflación, revalorización, venta)."""
+    precio_vivienda = datos["precio_vivienda"]
+    importe_financiado = datos["importe_financiado"]
+    r_mensual_inv = datos["r_mensual_inv"]
+    n_meses_inv = datos["n_meses_inv"]
+    aportacion_total = datos["aportacion_total"]
+    alquiler_mensual = datos["alquiler_mensual"]
+    otros_gastos_anuales = datos["otros_gastos_anuales"]
+    meses_carencia_inv = datos["meses_carencia_inv"]
+    tipo_carencia_inv = datos["tipo_carencia_inv"]
+    pago_final_inv = datos["pago_final_inv"]
+
+    # ==========================
+    # Riesgo (Monte Carlo)
+    # ==========================
     st.markdown(
-        f"""
-        <div style="
-            background:#e8f5e9;
-            border:1px solid #4caf50;
-            border-radius:12px;
-            padding:1rem 1.25rem;
-            margin:.5rem 0 1rem 0;
-        ">
-          <div class="value-title">📌 TIR (como Excel)</div>
-          <div class="value-big">{fmt_pct(tir)}</div>
-          <div style="font-size:0.9em;color:#5f6570;margin-top:.35rem">
-            Calculada como <strong>TIR/IRR</strong> con flujos anuales:
-            <em>[-aportación inicial, cashflow, cashflow, ...]</em> durante {int(horizonte_anios)} año(s).
-            Si no hay cambio de signo (p.ej. cashflow negativo), la TIR no está definida.
-          </div>
+        """
+        <div class="param-header">
+          <span class="param-chip">Riesgo (Monte Carlo)</span>
+          <span class="param-subtle">
+            Miles de escenarios con meses vacíos, subida de alquiler incierta, derramas/averías y, opcionalmente,
+            Euríbor variable. Usa la proyección anterior (revalorización, inflación y gastos de venta).
+          </span>
         </div>
         """,
         unsafe_allow_html=True
     )
 
-# ==========================
-# Tabla comparativa por año
-# ==========================
-years_list = list(range(1, n_h + 1))
-
-def comp_equiv(r: float, n: int) -> float:
-    base = 1 + n * r
-    return (base ** (1 / n) - 1) if base > 0 else np.nan
+    with st.form("params_form_montecarlo", clear_on_submit=False):
+        mc1, mc2, mc3, mc4 = st.columns(4)
+        with mc1:
+            n_sims_mc = st.number_input(
+                "Nº de simulaciones", min_value=500, max_value=100000, value=10000, step=500, key="mc_sims_inv"
+            )
+            meses_vacios_mc = st.number_input(
+                "Meses vacíos esperados al año", min_value=0.0, max_value=12.0, value=0.5, step=0.25, format="%.2f",
+                key="mc_vacios_inv"
+            )
+        with mc2:
+            vol_alquiler_mc = st.number_input(
+                "Volatilidad subida alquiler (% anual)", min_value=0.0, max_value=20.0, value=2.0, step=0.25,
+                format="%.2f", key="mc_vol_alq_inv"
+            )
+            prob_derrama_mc = st.number_input(
+                "Probabilidad anual de derrama/avería (%)", min_value=0.0, max_value=100.0, value=20.0, step=5.0,
+                format="%.1f", key="mc_prob_derrama_inv"
+            )
+        with mc3:
+            coste_derrama_mc = euro_input(
+                "Coste medio derrama/avería (€)", key="mc_coste_derrama_eur", default=1500.0, decimals=2, min_value=0.0
+            )
+            workers_mc = st.number_input(
+                "Procesos en paralelo (0 = sin pool)", min_value=0, max_value=16, value=0, step=1, key="mc_workers_inv"
+            )
+        with mc4:
+            variable_mc = st.checkbox("Hipoteca variable (Euríbor + diferencial)", value=False, key="mc_variable_inv")
+            euribor_mc = st.number_input(
+                "Euríbor actual (%)", min_value=-2.0, max_value=10.0, value=2.5, step=0.05, format="%.2f", key="mc_euribor_inv"
+            )
+            diferencial_mc = st.number_input(
+                "Diferencial (% puntos)", min_value=-2.0, max_value=10.0, value=0.8, step=0.05, format="%.2f",
+                key="mc_diferencial_inv"
+            )
+            vol_euribor_mc = st.number_input(
+                "Volatilidad Euríbor (% anual)", min_value=0.0, max_value=5.0, value=0.5, step=0.05, format="%.2f",
+                key="mc_vol_euribor_inv"
+            )
+        run_mc = st.form_submit_button("🎲 Lanzar simulación")
+
+    mc_params = dict(
+        precio=precio_vivienda,
+        importe_financiado=importe_financiado,
+        r_m=r_mensual_inv,
+        n_meses=n_meses_inv,
+        aportacion=aportacion_total,
+        alquiler_mensual=alquiler_mensual,
+        gastos_mensuales=otros_gastos_anuales / 12.0,
+        horizonte_anios=n_h,
+        meses_carencia=meses_carencia_inv,
+        tipo_carencia=tipo_carencia_inv,
+        pago_final=pago_final_inv,
+        **supuestos,
+        vol_subida_alquiler=vol_alquiler_mc / 100.0,
+        meses_vacios_anio=meses_vacios_mc,
+        prob_derrama_anual=prob_derrama_mc / 100.0,
+        coste_derrama_medio=coste_derrama_mc,
+        variable=variable_mc,
+        euribor_inicial=euribor_mc / 100.0,
+        diferencial=diferencial_mc / 100.0,
+        vol_euribor=vol_euribor_mc / 100.0,
+        euribor_largo_plazo=euribor_mc / 100.0,
+    )
+    # Entradas de las que depende el resultado: si cambian, el guardado ya no describe esta inversión
+    firma_mc = (tuple(mc_params.items()), int(n_sims_mc))
+    mc_placeholder = st.empty()
+    guardado = st.session_state.get("mc_inv_resultado")
+    if run_mc:
+        res_mc = None
+        for res_mc in monte_carlo_stream(mc_params, int(n_sims_mc), batch_size=2000, workers=int(workers_mc)):
+            with mc_placeholder.container():
+                _render_mc(res_mc, chart_key=f"mc_fan_{res_mc['simulaciones']}")
+        if res_mc is not None:
+            res_mc.pop("muestras_cashflow", None)
+            res_mc.pop("muestras_tir", None)
+            st.session_state["mc_inv_resultado"] = (firma_mc, res_mc)
+    elif guardado is not None and guardado[0] == firma_mc:
+        with mc_placeholder.container():
+            _render_mc(guardado[1], chart_key="mc_fan_last")
+    elif guardado is not None:
+        mc_placeholder.info(
+            "Los datos de la inversión o los supuestos han cambiado desde la última simulación: "
+            "pulsa «Lanzar simulación» para recalcular la distribución."
+        )
+    else:
+        mc_placeholder.info("Configura los supuestos y pulsa «Lanzar simulación» para ver la distribución.")
 
-tir_por_anio = []
-if aportacion_total > 0:
-    for n in years_list:
-        tir_por_anio.append(tir_excel([-float(aportacion_total)] + [float(cashflow_anual)] * n))
-else:
-    tir_por_anio = [np.nan] * n_h
-
-df_ratios = pd.DataFrame({
-    "Año": years_list,
-    "Rentabilidad sobre aportación (Cash-on-Cash)": [r_simple] * n_h,
-    "Interés compuesto equivalente": [comp_equiv(r_simple, n) for n in years_list],
-    "TIR (como Excel)": tir_por_anio
-})
+    st.caption(
+        "La mediana y las bandas se actualizan mientras avanza la simulación. La TIR de cada escenario usa flujos "
+        "mensuales con venta al final del horizonte; los escenarios sin cambio de signo no tienen TIR."
+    )
 
-df_display = df_ratios.copy()
-df_display["Rentabilidad sobre aportación (Cash-on-Cash)"] = df_display["Rentabilidad sobre aportación (Cash-on-Cash)"].map(fmt_pct)
-df_display["Interés compuesto equivalente"] = df_display["Interés compuesto equivalente"].map(fmt_pct)
-df_display["TIR (como Excel)"] = df_display["TIR (como Excel)"].map(fmt_pct)
+st.markdown("<h2 style='margin:0 0 .5rem 0'>📈 Rentabilidad</h2>", unsafe_allow_html=True)
+st.markdown(
+    """
+    <div class="param-subtle" style="margin-bottom:.5rem">
+      Ratios clave de la inversión. Valores destacados en verde y una breve descripción bajo cada uno.
+    </div>
+    """,
+    unsafe_allow_html=True
+)
+horizonte_anios = st.number_input(
+    "Horizonte (años) para comparar el interés compuesto / TIR",
+    min_value=1, max_value=40, value=int(plazo_inv), step=1, key="horizonte_comp"
+)
+n_h = int(horizonte_anios)
 
-with st.expander("🔍 Comparativa por año (CoC vs compuesto vs TIR)", expanded=False):
-    st.dataframe(df_display, use_container_width=True, hide_index=True)
+seccion_rentabilidad(datos_inv, n_h)
+st.divider()
+supuestos_inv = formulario_proyeccion()
+seccion_proyeccion(datos_inv, n_h, supuestos_inv)
+st.divider()
+seccion_barrido(datos_inv, n_h)
+st.divider()
+seccion_riesgo(datos_inv, n_h, supuestos_inv)
 
 render_footer()
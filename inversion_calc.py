@@ -0,0 +1,630 @@
+# -*- coding: utf-8 -*-
+# Motor de cálculo de "Analiza Inversión": funciones puras sobre arrays NumPy (sin Streamlit).
+import atexit
+import csv
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+import registro_datos
+from metricas import timed
+from common import (
+    GRACE_TYPES, amortization_arrays, amortization_batch, annuity_factors, annuity_payment, irr_batch,
+    monthly_to_annual, yearly_payments,
+)
+
+# ============================
+# Supuestos de compra (tabla ITP/AJD por comunidad + gastos fijos)
+# ============================
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+def load_regions(path=DATA_DIR / "comunidades.csv") -> dict:
+    """
+    Tabla de impuestos por comunidad como arrays indexados por región (mismo orden que el fichero):
+    {'nombre': array de str, 'itp': array float, 'ajd': array float}.
+    """
+    with open(path, encoding="utf-8", newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    return {
+        "nombre": np.array([r["comunidad"] for r in rows]),
+        "itp": np.array([float(r["itp"]) for r in rows]),
+        "ajd": np.array([float(r["ajd"]) for r in rows]),
+    }
+
+PURCHASE_COST_KEYS = ("registro_notaria", "tasacion", "gestoria", "comision_apertura_pct")
+
+def load_purchase_costs(path=DATA_DIR / "gastos_compra.csv") -> dict:
+    """
+    Gastos fijos de la compra: {'registro_notaria', 'tasacion', 'gestoria'} en € y
+    {'comision_apertura_pct'} en tanto por uno sobre el importe financiado.
+    Lanza ValueError si falta alguno de los conceptos.
+    """
+    with open(path, encoding="utf-8", newline="") as fh:
+        gastos = {r["concepto"]: float(r["valor"]) for r in csv.DictReader(fh)}
+    faltan = [k for k in PURCHASE_COST_KEYS if k not in gastos]
+    if faltan:
+        raise ValueError(f"{Path(path).name}: faltan los conceptos {', '.join(faltan)}")
+    return gastos
+
+def _build_regions() -> dict:
+    regiones = load_regions(DATA_DIR / "comunidades.csv")
+    return {
+        "regiones": regiones,
+        "comunidades": {n: (float(i), float(a)) for n, i, a in zip(regiones["nombre"], regiones["itp"], regiones["ajd"])},
+        "posicion": {n: k for k, n in enumerate(regiones["nombre"])},
+    }
+
+# Se recargan al cambiar los ficheros (ver registro_datos): actualizar impuestos o gastos no requiere redesplegar
+registro_datos.register("comunidades", lambda: [DATA_DIR / "comunidades.csv"], _build_regions)
+registro_datos.register(
+    "gastos_compra", lambda: [DATA_DIR / "gastos_compra.csv"], lambda: load_purchase_costs(DATA_DIR / "gastos_compra.csv")
+)
+
+def get_regions() -> dict:
+    """Tabla vigente de impuestos por comunidad (formato de load_regions)."""
+    return registro_datos.get("comunidades")["regiones"]
+
+def get_comunidades() -> dict:
+    """{comunidad: (itp, ajd)} vigente, en el orden del fichero."""
+    return registro_datos.get("comunidades")["comunidades"]
+
+def get_purchase_costs() -> dict:
+    """Gastos fijos vigentes (formato de load_purchase_costs)."""
+    return registro_datos.get("gastos_compra")
+
+def region_index(nombres, regiones: dict | None = None) -> np.ndarray:
+    """
+    Índices en regiones (por defecto, get_regions()) de una lista/array de nombres de comunidad (-1 si no existe).
+    Pasa la misma tabla con la que vas a indexar para no mezclar versiones si se recarga entre medias.
+    """
+    if regiones is None:
+        pos = registro_datos.get("comunidades")["posicion"]
+    else:
+        pos = {n: k for k, n in enumerate(regiones["nombre"])}
+    return np.array([pos.get(n, -1) for n in nombres], dtype=int)
+
+# ============================
+# Proyección mensual a horizonte (alquiler, gastos, hipoteca, revalorización y venta)
+# ============================
+@timed
+def investment_projection(
+    precio: float,
+    importe_financiado: float,
+    r_m: float,
+    n_meses: int,
+    aportacion: float,
+    alquiler_mensual: float,
+    gastos_mensuales: float,
+    horizonte_anios: int,
+    subida_alquiler: float = 0.0,
+    inflacion_gastos: float = 0.0,
+    revalorizacion: float = 0.0,
+    gastos_venta: float = 0.0,
+    meses_carencia: int = 0,
+    tipo_carencia: str = "interest_only",
+    pago_final: float = 0.0,
+):
+    """
+    Proyecta la inversión mes a mes durante horizonte_anios:
+    - Alquiler y gastos suben una vez al año (subida_alquiler / inflacion_gastos, tasas anuales).
+    - Cuota y saldo salen del cuadro de amortización (0 una vez liquidada la hipoteca), con la carencia
+      inicial y el pago final indicados (ver GRACE_TYPES en common).
+    - El valor de la vivienda se revaloriza con capitalización mensual de la tasa anual.
+    - Al final del horizonte se vende: valor * (1 - gastos_venta) - saldo pendiente.
+    Devuelve (columnas: dict de arrays, valor_salida_neto, tir_anual).
+    La TIR se calcula sobre flujos mensuales [-aportación, cashflow_1, ..., cashflow_H + salida].
+    """
+    H = int(horizonte_anios) * 12
+    if H <= 0:
+        return {}, 0.0, np.nan
+
+    mes = np.arange(1, H + 1)
+    anio_idx = (mes - 1) // 12
+
+    alquiler = alquiler_mensual * (1.0 + subida_alquiler) ** anio_idx
+    gastos = gastos_mensuales * (1.0 + inflacion_gastos) ** anio_idx
+
+    cuota = np.zeros(H)
+    saldo = np.zeros(H)
+    amort = amortization_arrays(
+        importe_financiado, r_m, int(n_meses),
+        grace_months=int(meses_carencia), grace_type=tipo_carencia, balloon=pago_final
+    )
+    if amort:
+        m = min(H, len(amort["Cuota"]))
+        cuota[:m] = amort["Cuota"][:m]
+        saldo[:m] = amort["Saldo final"][:m]
+
+    valor = precio * (1.0 + revalorizacion) ** (mes / 12.0)
+    cashflow = alquiler - gastos - cuota
+
+    valor_salida_neto = float(valor[-1] * (1.0 - gastos_venta) - saldo[-1])
+
+    flujos = np.concatenate(([-float(aportacion)], cashflow))
+    flujos[-1] += valor_salida_neto
+    tir_m = irr_batch(flujos, guess=0.01)
+    tir_anual = float(monthly_to_annual(tir_m)) if np.isfinite(tir_m) else np.nan
+
+    cols = {
+        "Mes": mes,
+        "Año": anio_idx + 1,
+        "Alquiler": alquiler,
+        "Gastos": gastos,
+        "Cuota hipoteca": cuota,
+        "Cashflow": cashflow,
+        "Saldo hipoteca": saldo,
+        "Valor vivienda": valor,
+        "Patrimonio neto": valor - saldo,
+    }
+    return cols, valor_salida_neto, tir_anual
+
+def annual_rollup(cols: dict) -> dict:
+    """Agrega la proyección mensual por año (sumas de flujos, valores de cierre de stocks)."""
+    if not cols:
+        return {}
+    n_years = len(cols["Mes"]) // 12
+    def _sum(key):
+        return cols[key].reshape(n_years, 12).sum(axis=1)
+    def _end(key):
+        return cols[key].reshape(n_years, 12)[:, -1]
+    return {
+        "Año": np.arange(1, n_years + 1),
+        "Alquiler": _sum("Alquiler"),
+        "Gastos": _sum("Gastos"),
+        "Cuota hipoteca": _sum("Cuota hipoteca"),
+        "Cashflow": _sum("Cashflow"),
+        "Cashflow acumulado": np.cumsum(_sum("Cashflow")),
+        "Saldo hipoteca": _end("Saldo hipoteca"),
+        "Valor vivienda": _end("Valor vivienda"),
+        "Patrimonio neto": _end("Patrimonio neto"),
+    }
+
+# ============================
+# Métricas vectorizadas (barridos de escenarios)
+# ============================
+def acquisition_costs(precio, pct_financiacion, itp, ajd, aportacion_extra=0.0) -> dict:
+    """
+    Aportación inicial desglosada (mismos supuestos que la página), para escalares o arrays.
+    pct_financiacion en %; itp/ajd en tanto por uno.
+    """
+    precio = np.asarray(precio, dtype=float)
+    pct = np.asarray(pct_financiacion, dtype=float)
+    importe_financiado = precio * pct / 100.0
+    entrada = precio * (100.0 - pct) / 100.0
+    impuestos = precio * (np.asarray(itp, dtype=float) + np.asarray(ajd, dtype=float))
+    gastos = get_purchase_costs()
+    gastos_fijos = gastos["registro_notaria"] + gastos["tasacion"] + gastos["gestoria"]
+    comision = importe_financiado * gastos["comision_apertura_pct"]
+    total = entrada + impuestos + gastos_fijos + comision + aportacion_extra
+    return {
+        "Importe financiado": importe_financiado,
+        "Entrada": entrada,
+        "Impuestos": impuestos,
+        "Gastos fijos": np.broadcast_to(gastos_fijos, np.shape(total)),
+        "Comisión apertura": comision,
+        "Aportación total": total,
+    }
+
+def comp_equiv_array(r_simple, n):
+    """Interés compuesto equivalente ((1 + n·r)^(1/n) - 1); nan si la base no es positiva."""
+    base = 1.0 + np.asarray(n, dtype=float) * np.asarray(r_simple, dtype=float)
+    with np.errstate(invalid="ignore"):
+        return np.where(base > 0, np.abs(base) ** (1.0 / n) - 1.0, np.nan)
+
+@timed
+def investment_metrics(
+    precio,
+    pct_financiacion,
+    tin_pct,
+    alquiler_mensual,
+    otros_gastos_anuales,
+    plazo_anios: int,
+    horizonte_anios: int,
+    itp,
+    ajd,
+    aportacion_extra=0.0,
+    meses_carencia: int = 0,
+    tipo_carencia: str = "interest_only",
+    pago_final: float = 0.0,
+) -> dict:
+    """
+    Cash-on-Cash, interés compuesto equivalente y TIR (flujos anuales [-aportación, cashflow_1, ...])
+    para cualquier combinación de arrays de entrada. Las TIR de todas las celdas se resuelven juntas.
+    La hipoteca de cada año es la suma de las cuotas del cuadro (con carencia y pago final, 0 tras el
+    vencimiento); el Cash-on-Cash usa el cashflow anual medio del horizonte.
+    """
+    costes = acquisition_costs(precio, pct_financiacion, itp, ajd, aportacion_extra)
+    r_m = np.asarray(tin_pct, dtype=float) / 100.0 / 12.0
+    n_h = int(horizonte_anios)
+    cuotas = yearly_payments(
+        costes["Importe financiado"], r_m, int(plazo_anios) * 12, n_h,
+        grace_months=int(meses_carencia), grace_type=tipo_carencia, balloon=pago_final,
+    )
+    ingresos = np.asarray(alquiler_mensual, dtype=float) * 12 - otros_gastos_anuales
+    cashflows = ingresos[..., None] - cuotas
+
+    aportacion = costes["Aportación total"]
+    cashflows, aportacion = np.broadcast_arrays(cashflows, aportacion[..., None])
+    aportacion = aportacion[..., 0]
+    cashflow = cashflows.mean(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coc = np.where(aportacion > 0, cashflow / aportacion, 0.0)
+
+    flujos = np.concatenate([-aportacion[..., None], cashflows], axis=-1)
+    tir = irr_batch(flujos.reshape(-1, n_h + 1)).reshape(cashflow.shape)
+    tir = np.where(aportacion > 0, tir, np.nan)
+
+    return {
+        "Cuotas por año": cuotas,
+        "Aportación total": aportacion,
+        "Cashflow por año": cashflows,
+        "Cashflow anual": cashflow,
+        "Cash-on-Cash": coc,
+        "Interés compuesto equivalente": comp_equiv_array(coc, n_h),
+        "TIR": tir,
+    }
+
+SWEEP_VARS = {
+    "precio": "Precio de la vivienda (€)",
+    "pct_financiacion": "Financiación (%)",
+    "tin_pct": "Interés (% TIN)",
+    "alquiler_mensual": "Alquiler mensual (€)",
+}
+
+@timed
+def scenario_sweep(base: dict, axes: dict) -> dict:
+    """
+    Evalúa investment_metrics en la malla formada por los ejes (2 o 3 variables de SWEEP_VARS).
+    base: argumentos de investment_metrics; axes: {variable: valores 1D}.
+    Cada métrica devuelta tiene forma (len(eje_1), len(eje_2)[, len(eje_3)]).
+    """
+    grids = np.meshgrid(*[np.asarray(v, dtype=float) for v in axes.values()], indexing="ij")
+    params = dict(base)
+    params.update(zip(axes.keys(), grids))
+    return investment_metrics(**params)
+
+# ============================
+# Monte Carlo (vacancia, subida de alquiler, derramas y Euríbor)
+# ============================
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+
+MC_DEFAULTS = {
+    "subida_alquiler": 0.02,
+    "vol_subida_alquiler": 0.02,
+    "inflacion_gastos": 0.02,
+    "revalorizacion": 0.02,
+    "gastos_venta": 0.05,
+    "meses_vacios_anio": 0.5,
+    "prob_derrama_anual": 0.2,
+    "coste_derrama_medio": 1500.0,
+    "variable": False,
+    "euribor_inicial": 0.025,
+    "diferencial": 0.008,
+    "vol_euribor": 0.005,
+    "reversion_euribor": 0.2,
+    "euribor_largo_plazo": 0.025,
+    "meses_carencia": 0,
+    "tipo_carencia": "interest_only",
+    "pago_final": 0.0,
+}
+
+def _variable_loan_paths(P, n_meses, euribor, diferencial, H, n_sims, meses_carencia=0, tipo_carencia="interest_only",
+                         pago_final=0.0):
+    """
+    Cuota y saldo mensuales (n_sims x H) de un préstamo variable con revisión anual:
+    cada año se recalcula la cuota con el saldo vivo, el plazo restante y el tipo Euríbor + diferencial.
+    euribor: (n_sims x años) con el índice aplicado en cada año.
+    Carencia y pago final como en amortization_arrays: durante la carencia se pagan solo intereses
+    (o nada, con los intereses sumados al saldo, en la total); la cuota se fija al acabar la carencia
+    y en cada revisión posterior, dejando pago_final para la última cuota.
+    """
+    cuota = np.zeros((n_sims, H))
+    saldo = np.zeros((n_sims, H))
+    if P <= 0 or n_meses <= 0:
+        return cuota, saldo
+    if tipo_carencia not in GRACE_TYPES:
+        raise ValueError(f"Tipo de carencia desconocido: {tipo_carencia!r}")
+    g = int(min(max(meses_carencia, 0), int(n_meses) - 1))
+    bal = np.full(n_sims, float(P))
+    j = np.arange(1, 13)
+    n_years = min(H, int(n_meses)) // 12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for y in range(n_years):
+            r = (euribor[:, y] + diferencial) / 12.0
+            k = min(max(g - 12 * y, 0), 12)
+            if k:
+                if tipo_carencia == "full":
+                    growth_g, _, _ = annuity_factors(r[:, None], j[:k])
+                    b_g = bal[:, None] * growth_g
+                    c_g = np.zeros_like(b_g)
+                else:
+                    b_g = np.repeat(bal[:, None], k, axis=1)
+                    c_g = b_g * r[:, None]
+                cuota[:, 12 * y:12 * y + k] = c_g
+                saldo[:, 12 * y:12 * y + k] = b_g
+                bal = b_g[:, -1]
+            if k == 12:
+                continue
+            n_rem = int(n_meses) - 12 * y - k
+            pay = annuity_payment(bal, r, n_rem, pago_final)
+            growth, accum, _ = annuity_factors(r[:, None], j[:12 - k])
+            b = bal[:, None] * growth - pay[:, None] * accum
+            c = np.repeat(pay[:, None], 12 - k, axis=1)
+            if n_rem == 12 - k:
+                b[:, -1] = 0.0
+                c[:, -1] += pago_final
+            cuota[:, 12 * y + k:12 * (y + 1)] = c
+            saldo[:, 12 * y + k:12 * (y + 1)] = np.maximum(b, 0.0)
+            bal = b[:, -1]
+    return cuota, saldo
+
+@timed
+def simulate_investment(params: dict, n_sims: int, seed=None):
+    """
+    Simula n_sims trayectorias mensuales de la inversión de una vez (arrays n_sims x meses).
+    params: argumentos de investment_projection (precio, importe_financiado, r_m, n_meses, aportacion,
+    alquiler_mensual, gastos_mensuales, horizonte_anios, ...) más las claves de MC_DEFAULTS.
+    Devuelve (cashflow_anual: n_sims x años, tir_anual: n_sims).
+    """
+    p = {**MC_DEFAULTS, **params}
+    rng = np.random.default_rng(seed)
+    n_years = int(p["horizonte_anios"])
+    H = n_years * 12
+    S = int(n_sims)
+
+    # Alquiler: subida anual aleatoria acumulada (el año 1 parte del alquiler actual)
+    subidas = rng.normal(p["subida_alquiler"], p["vol_subida_alquiler"], size=(S, n_years))
+    factor = np.cumprod(np.concatenate([np.ones((S, 1)), 1.0 + subidas[:, :-1]], axis=1), axis=1)
+    alquiler = p["alquiler_mensual"] * np.repeat(factor, 12, axis=1)
+    ocupado = rng.random((S, H)) >= p["meses_vacios_anio"] / 12.0
+    ingresos = alquiler * ocupado
+
+    # Gastos: inflación determinista + derramas/averías aleatorias
+    anio_idx = np.arange(H) // 12
+    gastos = p["gastos_mensuales"] * (1.0 + p["inflacion_gastos"]) ** anio_idx
+    derramas = (rng.random((S, H)) < p["prob_derrama_anual"] / 12.0) * rng.exponential(
+        p["coste_derrama_medio"], size=(S, H)
+    )
+
+    # Hipoteca: fija (cuadro único) o variable con Euríbor simulado (reversión a la media)
+    if p["variable"]:
+        euribor = np.empty((S, n_years))
+        euribor[:, 0] = p["euribor_inicial"]
+        shocks = rng.normal(0.0, p["vol_euribor"], size=(S, n_years))
+        for y in range(1, n_years):
+            prev = euribor[:, y - 1]
+            euribor[:, y] = prev + p["reversion_euribor"] * (p["euribor_largo_plazo"] - prev) + shocks[:, y]
+        cuota, saldo = _variable_loan_paths(
+            p["importe_financiado"], p["n_meses"], euribor, p["diferencial"], H, S,
+            int(p["meses_carencia"]), p["tipo_carencia"], p["pago_final"],
+        )
+    else:
+        cuota_1 = np.zeros(H)
+        saldo_1 = np.zeros(H)
+        amort = amortization_arrays(
+            p["importe_financiado"], p["r_m"], int(p["n_meses"]),
+            grace_months=int(p["meses_carencia"]), grace_type=p["tipo_carencia"], balloon=p["pago_final"]
+        )
+        if amort:
+            m = min(H, len(amort["Cuota"]))
+            cuota_1[:m] = amort["Cuota"][:m]
+            saldo_1[:m] = amort["Saldo final"][:m]
+        cuota = np.broadcast_to(cuota_1, (S, H))
+        saldo = np.broadcast_to(saldo_1, (S, H))
+
+    cashflow = ingresos - gastos - derramas - cuota
+
+    valor_final = p["precio"] * (1.0 + p["revalorizacion"]) ** n_years
+    salida = valor_final * (1.0 - p["gastos_venta"]) - saldo[:, -1]
+    flujos = np.concatenate([np.full((S, 1), -float(p["aportacion"])), cashflow], axis=1)
+    flujos[:, -1] += salida
+
+    tir_m = irr_batch(flujos, guess=0.01)
+    with np.errstate(invalid="ignore"):
+        tir_anual = monthly_to_annual(tir_m)
+    return cashflow.reshape(S, n_years, 12).sum(axis=2), tir_anual
+
+def running_percentiles(cashflow_anual: np.ndarray, tir_anual: np.ndarray, q=FAN_PERCENTILES) -> dict:
+    """Percentiles por año del cashflow y percentiles de la TIR (ignorando TIR no definidas)."""
+    tir_ok = tir_anual[np.isfinite(tir_anual)]
+    return {
+        "simulaciones": int(cashflow_anual.shape[0]),
+        "cashflow": dict(zip(q, np.percentile(cashflow_anual, q, axis=0))),
+        "tir": dict(zip(q, np.percentile(tir_ok, q))) if tir_ok.size else {p: np.nan for p in q},
+        "tir_no_definida": float(1.0 - tir_ok.size / max(tir_anual.size, 1)),
+    }
+
+# Pools de procesos reutilizados entre llamadas (uno por nº de procesos): arrancar un pool en cada ejecución de la
+# página cuesta más que la simulación. Se crean con "forkserver" (donde existe) para no hacer fork del servidor
+# de Streamlit, que tiene varios hilos.
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            metodo = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context(metodo))
+        return pool
+
+@atexit.register
+def _shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+def monte_carlo_stream(params: dict, n_sims: int, batch_size: int = 2000, seed=None, workers: int = 0):
+    """
+    Generador: simula por lotes y, tras cada lote, produce los percentiles acumulados (running_percentiles)
+    más las muestras acumuladas ('muestras_cashflow', 'muestras_tir').
+    Con workers > 0 y más de un lote, reparte los lotes en un pool de procesos compartido entre llamadas
+    (cada lote con su propia semilla); con un solo lote se simula en el propio proceso.
+    """
+    n_batches = max(1, int(np.ceil(n_sims / batch_size)))
+    sizes = [batch_size] * (n_batches - 1) + [int(n_sims) - batch_size * (n_batches - 1)]
+    seeds = np.random.SeedSequence(seed).spawn(n_batches)
+
+    cf_parts, tir_parts = [], []
+
+    def _emit():
+        cf_all = np.concatenate(cf_parts, axis=0)
+        tir_all = np.concatenate(tir_parts)
+        out = running_percentiles(cf_all, tir_all)
+        out["muestras_cashflow"] = cf_all
+        out["muestras_tir"] = tir_all
+        return out
+
+    if workers and workers > 0 and n_batches > 1:
+        pool = _process_pool(int(workers))
+        futures = [pool.submit(simulate_investment, params, n, ss) for n, ss in zip(sizes, seeds)]
+        try:
+            for fut in as_completed(futures):
+                cf, tir = fut.result()
+                cf_parts.append(cf)
+                tir_parts.append(tir)
+                yield _emit()
+        finally:
+            # Generador abandonado (la página se volvió a ejecutar): no dejar lotes encolados en el pool
+            for fut in futures:
+                fut.cancel()
+    else:
+        for n, ss in zip(sizes, seeds):
+            cf, tir = simulate_investment(params, n, ss)
+            cf_parts.append(cf)
+            tir_parts.append(tir)
+            yield _emit()
+
+# ============================
+# Cartera de inmuebles (cálculo batch, sin un DataFrame por inmueble)
+# ============================
+PORTFOLIO_COLUMNS = [
+    "Inmueble",
+    "Comunidad",
+    "Precio",
+    "Financiación (%)",
+    "TIN (%)",
+    "Plazo (años)",
+    "Alquiler mensual",
+    "Gastos anuales",
+    "Aportación extra",
+]
+
+@timed
+def portfolio_projection(
+    precio,
+    pct_financiacion,
+    tin_pct,
+    plazo_anios,
+    alquiler_mensual,
+    gastos_anuales,
+    itp,
+    ajd,
+    aportacion_extra,
+    horizonte_anios: int,
+    subida_alquiler: float = 0.0,
+    inflacion_gastos: float = 0.0,
+    revalorizacion: float = 0.0,
+    gastos_venta: float = 0.0,
+) -> dict:
+    """
+    Proyección mensual de N inmuebles a la vez (arrays 1D de longitud N) y agregado de cartera.
+    Todos los inmuebles se compran en el mes 0 y se venden al final del horizonte.
+    Devuelve un dict con:
+    - por inmueble: 'Aportación total', 'Cuota', 'Cashflow anual (año 1)', 'TIR' (N,) y matrices N x H
+      'cashflow', 'saldo', 'valor';
+    - cartera (H,): 'cartera_cashflow', 'cartera_deuda', 'cartera_valor', 'cartera_patrimonio',
+      'cartera_apalancamiento'; escalares 'cartera_aportacion', 'cartera_salida', 'cartera_tir'.
+    """
+    precio = np.asarray(precio, dtype=float)
+    n_meses = np.asarray(plazo_anios, dtype=int) * 12
+    H = int(horizonte_anios) * 12
+    mes = np.arange(1, H + 1)
+    anio_idx = (mes - 1) // 12
+
+    costes = acquisition_costs(precio, pct_financiacion, itp, ajd, np.asarray(aportacion_extra, dtype=float))
+    r_m = np.asarray(tin_pct, dtype=float) / 100.0 / 12.0
+    amort = amortization_batch(costes["Importe financiado"], r_m, n_meses, horizon=H)
+
+    alquiler = np.asarray(alquiler_mensual, dtype=float)[:, None] * (1.0 + subida_alquiler) ** anio_idx
+    gastos = (np.asarray(gastos_anuales, dtype=float)[:, None] / 12.0) * (1.0 + inflacion_gastos) ** anio_idx
+    cashflow = alquiler - gastos - amort["Cuota"]
+    saldo = amort["Saldo final"]
+    valor = precio[:, None] * (1.0 + revalorizacion) ** (mes / 12.0)
+
+    aportacion = costes["Aportación total"]
+    salida = valor[:, -1] * (1.0 - gastos_venta) - saldo[:, -1]
+    flujos = np.concatenate([-aportacion[:, None], cashflow], axis=1)
+    flujos[:, -1] += salida
+    with np.errstate(invalid="ignore"):
+        tir = monthly_to_annual(irr_batch(flujos, guess=0.01))
+
+    cartera_flujos = flujos.sum(axis=0)
+    tir_cartera_m = irr_batch(cartera_flujos, guess=0.01)
+    deuda = saldo.sum(axis=0)
+    valor_total = valor.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        apalancamiento = np.where(valor_total > 0, deuda / valor_total, np.nan)
+
+    return {
+        "Aportación total": aportacion,
+        "Cuota": amort["Cuota"][:, 0],
+        "Cashflow anual (año 1)": cashflow[:, :12].sum(axis=1),
+        "TIR": tir,
+        "cashflow": cashflow,
+        "saldo": saldo,
+        "valor": valor,
+        "cartera_cashflow": cashflow.sum(axis=0),
+        "cartera_deuda": deuda,
+        "cartera_valor": valor_total,
+        "cartera_patrimonio": valor_total - deuda,
+        "cartera_apalancamiento": apalancamiento,
+        "cartera_aportacion": float(aportacion.sum()),
+        "cartera_salida": float(salida.sum()),
+        "cartera_tir": float(monthly_to_annual(tir_cartera_m)) if np.isfinite(tir_cartera_m) else np.nan,
+    }
+
+# ============================
+# Comparativa de todas las comunidades en una pasada
+# ============================
+@timed
+def region_comparison(
+    precio: float,
+    pct_financiacion: float,
+    tin_pct: float,
+    alquiler_mensual: float,
+    otros_gastos_anuales: float,
+    plazo_anios: int,
+    horizonte_anios: int,
+    aportacion_extra: float = 0.0,
+    regiones: dict | None = None,
+    meses_carencia: int = 0,
+    tipo_carencia: str = "interest_only",
+    pago_final: float = 0.0,
+) -> dict:
+    """
+    Impuestos, aportación inicial, Cash-on-Cash y TIR para todas las comunidades a la vez
+    (arrays indexados por región, ordenados de menor a mayor aportación inicial).
+    Carencia y pago final como en investment_metrics.
+    """
+    reg = regiones if regiones is not None else get_regions()
+    costes = acquisition_costs(precio, pct_financiacion, reg["itp"], reg["ajd"], aportacion_extra)
+    met = investment_metrics(
+        precio, pct_financiacion, tin_pct, alquiler_mensual, otros_gastos_anuales,
+        plazo_anios, horizonte_anios, reg["itp"], reg["ajd"], aportacion_extra,
+        meses_carencia, tipo_carencia, pago_final,
+    )
+    orden = np.argsort(met["Aportación total"], kind="stable")
+    return {
+        "Comunidad": reg["nombre"][orden],
+        "ITP/IVA": reg["itp"][orden],
+        "AJD": reg["ajd"][orden],
+        "Impuestos": costes["Impuestos"][orden],
+        "Aportación total": met["Aportación total"][orden],
+        "Cash-on-Cash": met["Cash-on-Cash"][orden],
+        "TIR": met["TIR"][orden],
+    }
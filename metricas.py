@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# Métricas de latencia por página, sección y cálculo: contadores e histogramas en memoria (sin Streamlit).
+# Todas las llamadas se cuentan; la duración se mide en una fracción configurable (muestreo), así que el coste
+# fijo es un contador. Salidas (opcionales, por proceso): endpoint local en formato texto de Prometheus y/o
+# volcado periódico a fichero (JSON con p50/p95/p99, o texto Prometheus si el fichero acaba en .prom).
+import atexit
+import bisect
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Configuración por variables de entorno (todas opcionales):
+# - SIMULADOR_METRICAS: "0" desactiva la instrumentación (los decoradores devuelven la función tal cual).
+# - SIMULADOR_METRICAS_MUESTREO: fracción de llamadas cronometradas (0-1).
+# - SIMULADOR_METRICAS_PUERTO: puerto del endpoint /metrics en 127.0.0.1; si está ocupado (varios procesos)
+#   se prueba el siguiente, hasta PORT_ATTEMPTS puertos.
+# - SIMULADOR_METRICAS_FICHERO: ruta del volcado; "{pid}" se sustituye por el proceso.
+# - SIMULADOR_METRICAS_INTERVALO_S: segundos entre volcados al fichero.
+METRICS_ENABLED = os.environ.get("SIMULADOR_METRICAS", "1") != "0"
+SAMPLE_RATE = min(max(float(os.environ.get("SIMULADOR_METRICAS_MUESTREO", "0.1")), 0.0), 1.0)
+METRICS_PORT = os.environ.get("SIMULADOR_METRICAS_PUERTO", "")
+METRICS_FILE = os.environ.get("SIMULADOR_METRICAS_FICHERO", "")
+DUMP_INTERVAL_S = float(os.environ.get("SIMULADOR_METRICAS_INTERVALO_S", "60"))
+PORT_ATTEMPTS = 16
+# Límites superiores (s) de los tramos del histograma; el último tramo (+Inf) recoge el resto
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("metricas")
+
+# nombre -> [llamadas, suma de segundos medidos, cuentas por tramo (len(BUCKETS) + 1)]
+_series = {}
+_lock = threading.Lock()
+
+def _serie(nombre: str) -> list:
+    s = _series.get(nombre)
+    if s is None:
+        s = _series.setdefault(nombre, [0, 0.0, [0] * (len(BUCKETS) + 1)])
+    return s
+
+def count(nombre: str):
+    """Cuenta una llamada sin cronometrarla."""
+    with _lock:
+        _serie(nombre)[0] += 1
+
+def observe(nombre: str, segundos: float):
+    """Cuenta una llamada y registra su duración."""
+    i = bisect.bisect_left(BUCKETS, segundos)
+    with _lock:
+        s = _serie(nombre)
+        s[0] += 1
+        s[1] += segundos
+        s[2][i] += 1
+
+def _sampled() -> bool:
+    return SAMPLE_RATE >= 1.0 or random.random() < SAMPLE_RATE
+
+@contextmanager
+def timer(nombre: str):
+    """Cronometra un bloque (sección de página, construcción de una figura...) con el muestreo configurado."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    if not _sampled():
+        count(nombre)
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(nombre, time.perf_counter() - t0)
+
+def timed(fn=None, *, nombre: str | None = None):
+    """
+    Decorador: cuenta y (con el muestreo configurado) cronometra cada llamada a fn.
+    Nombre por defecto: <fichero sin .py>.<función>, también en páginas (que Streamlit ejecuta como __main__).
+    Admite @timed y @timed(nombre="...").
+    """
+    if fn is None:
+        return functools.partial(timed, nombre=nombre)
+    if not METRICS_ENABLED:
+        return fn
+    if nombre is None:
+        original = inspect.unwrap(fn)
+        nombre = f"{Path(original.__code__.co_filename).stem}.{original.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _sampled():
+            count(nombre)
+            return fn(*args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            observe(nombre, time.perf_counter() - t0)
+
+    return wrapper
+
+# ============================
+# Lectura: percentiles, texto Prometheus y volcado
+# ============================
+def _quantile(q: float, cuentas: list) -> float:
+    """Percentil estimado por interpolación lineal dentro del tramo (como histogram_quantile de Prometheus)."""
+    total = sum(cuentas)
+    if total == 0:
+        return float("nan")
+    objetivo = q * total
+    acumulado = 0
+    for i, c in enumerate(cuentas):
+        if c and acumulado + c >= objetivo:
+            if i == len(BUCKETS):
+                return BUCKETS[-1]
+            lo = BUCKETS[i - 1] if i > 0 else 0.0
+            return lo + (BUCKETS[i] - lo) * (objetivo - acumulado) / c
+        acumulado += c
+    return BUCKETS[-1]
+
+def snapshot() -> dict:
+    """{nombre: {'llamadas', 'muestras', 'media_ms', 'p50_ms', 'p95_ms', 'p99_ms'}}, de más a menos tiempo total."""
+    with _lock:
+        series = {n: (s[0], s[1], list(s[2])) for n, s in _series.items()}
+    out = {}
+    for n, (llamadas, suma, cuentas) in series.items():
+        muestras = sum(cuentas)
+        if not muestras:
+            out[n] = {"llamadas": llamadas, "muestras": 0, "media_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+            continue
+        out[n] = {
+            "llamadas": llamadas,
+            "muestras": muestras,
+            "media_ms": round(suma / muestras * 1000, 3),
+            "p50_ms": round(_quantile(0.50, cuentas) * 1000, 3),
+            "p95_ms": round(_quantile(0.95, cuentas) * 1000, 3),
+            "p99_ms": round(_quantile(0.99, cuentas) * 1000, 3),
+        }
+    return dict(sorted(out.items(), key=lambda kv: -(kv[1]["media_ms"] or 0) * kv[1]["llamadas"]))
+
+def _label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus() -> str:
+    """Métricas en formato de exposición de texto de Prometheus (histograma por nombre + contador de llamadas)."""
+    with _lock:
+        series = sorted((n, s[0], s[1], list(s[2])) for n, s in _series.items())
+    lines = [
+        "# HELP simulador_llamadas_total Llamadas por página, sección o cálculo (todas, no solo las muestreadas).",
+        "# TYPE simulador_llamadas_total counter",
+    ]
+    lines += [f'simulador_llamadas_total{{nombre="{_label(n)}"}} {llamadas}' for n, llamadas, _, _ in series]
+    lines += [
+        "# HELP simulador_duracion_segundos Duración de las llamadas muestreadas.",
+        "# TYPE simulador_duracion_segundos histogram",
+    ]
+    for n, _, suma, cuentas in series:
+        nombre = _label(n)
+        acumulado = 0
+        for le, c in zip([*map(repr, BUCKETS), "+Inf"], cuentas):
+            acumulado += c
+            lines.append(f'simulador_duracion_segundos_bucket{{nombre="{nombre}",le="{le}"}} {acumulado}')
+        lines.append(f'simulador_duracion_segundos_sum{{nombre="{nombre}"}} {suma!r}')
+        lines.append(f'simulador_duracion_segundos_count{{nombre="{nombre}"}} {acumulado}')
+    lines += [
+        "# HELP simulador_muestreo Fracción de llamadas cronometradas.",
+        "# TYPE simulador_muestreo gauge",
+        f"simulador_muestreo {SAMPLE_RATE!r}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def dump(path: str = None):
+    """Escribe las métricas (atómicamente) en path: texto Prometheus si acaba en .prom, si no JSON."""
+    path = (path or METRICS_FILE).replace("{pid}", str(os.getpid()))
+    if path.endswith(".prom"):
+        contenido = render_prometheus()
+    else:
+        contenido = json.dumps(
+            {"pid": os.getpid(), "instante": time.time(), "muestreo": SAMPLE_RATE, "series": snapshot()},
+            ensure_ascii=False, indent=1,
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(contenido)
+    os.replace(tmp, path)
+
+def reset():
+    with _lock:
+        _series.clear()
+
+# ============================
+# Exportadores (una vez por proceso)
+# ============================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server(port: int) -> int | None:
+    """Sirve /metrics en 127.0.0.1 en el primer puerto libre desde port; devuelve el puerto (o None)."""
+    for p in range(port, port + PORT_ATTEMPTS):
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", p), _MetricsHandler)
+        except OSError:
+            continue
+        threading.Thread(target=server.serve_forever, name="metricas-http", daemon=True).start()
+        logger.info("Métricas en http://127.0.0.1:%d/metrics (pid %d)", p, os.getpid())
+        return p
+    logger.warning("Sin puerto libre para las métricas entre %d y %d", port, port + PORT_ATTEMPTS - 1)
+    return None
+
+def start_dumper(path: str, interval_s: float = DUMP_INTERVAL_S):
+    """Vuelca las métricas a path cada interval_s segundos y al salir del proceso."""
+    def _loop():
+        while True:
+            time.sleep(interval_s)
+            try:
+                dump(path)
+            except OSError:
+                logger.exception("No se pudo volcar las métricas a %s", path)
+
+    threading.Thread(target=_loop, name="metricas-volcado", daemon=True).start()
+    atexit.register(dump, path)
+
+def start_exporters() -> dict:
+    """Arranca lo configurado por variables de entorno; devuelve {'puerto', 'fichero'}."""
+    out = {"puerto": None, "fichero": None}
+    if not METRICS_ENABLED:
+        return out
+    if METRICS_PORT:
+        out["puerto"] = start_server(int(METRICS_PORT))
+    if METRICS_FILE:
+        start_dumper(METRICS_FILE)
+        out["fichero"] = METRICS_FILE.replace("{pid}", str(os.getpid()))
+    return out
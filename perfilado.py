@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# Perfilado opcional de las ejecuciones lentas de una página, con sus entradas para reproducirlas (sin Streamlit).
+# Con el perfilado activo, cada ejecución completa de la página corre bajo cProfile y, si tarda más del umbral, se
+# guardan en PROFILE_DIR el perfil (.prof, para pstats / snakeviz) y un .json con la página, la duración, las
+# funciones más costosas y las entradas de la sesión (st.session_state saneado). Reproducción sin navegador:
+#     python perfilado.py <fichero.json>
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+# Configuración por variables de entorno (todas opcionales):
+# - SIMULADOR_PERFIL: "1" perfila todas las sesiones; "query" solo las que abran la página con ?perfil=1;
+#   sin definir o "0", desactivado (el parámetro de la URL se ignora: nadie puede activarlo desde fuera).
+# - SIMULADOR_PERFIL_UMBRAL_S: duración mínima (s, medida con el perfilador puesto) para guardar el perfil.
+# - SIMULADOR_PERFIL_DIR: directorio de los perfiles.
+# - SIMULADOR_PERFIL_MAX: nº máximo de perfiles guardados (se borran los más antiguos).
+PROFILE_MODE = os.environ.get("SIMULADOR_PERFIL", "0")
+PROFILE_THRESHOLD_S = float(os.environ.get("SIMULADOR_PERFIL_UMBRAL_S", "1.0"))
+PROFILE_DIR = Path(os.environ.get(
+    "SIMULADOR_PERFIL_DIR", os.path.join(os.path.expanduser("~"), ".cache", "simulador_hipoteca", "perfiles")
+))
+PROFILE_MAX_FILES = int(os.environ.get("SIMULADOR_PERFIL_MAX", "100"))
+# Funciones más costosas (tiempo acumulado) que se copian al .json
+TOP_FUNCTIONS = 25
+# Textos más largos que esto no son entradas de un formulario (p. ej. un fichero pegado): se descartan
+MAX_TEXT_LEN = 200
+
+APP_DIR = Path(__file__).resolve().parent
+logger = logging.getLogger("perfilado")
+
+# cProfile admite un solo perfilador activo a la vez: las ejecuciones concurrentes se quedan sin perfilar
+_profiler_lock = threading.Lock()
+
+def profiling_enabled(query_value=None) -> bool:
+    """¿Perfilar esta ejecución? query_value: valor del parámetro ?perfil= de la URL (o None)."""
+    if PROFILE_MODE == "1":
+        return True
+    return PROFILE_MODE == "query" and query_value in ("1", "true", "si", "sí")
+
+def _sanitize_value(v):
+    """Valor apto para JSON y para volver a asignarlo en session_state, o None si hay que descartarlo."""
+    if isinstance(v, bool) or v is None or isinstance(v, (int, float)):
+        return {"valor": v}
+    if isinstance(v, str):
+        return {"valor": v} if len(v) <= MAX_TEXT_LEN else None
+    if isinstance(v, datetime):
+        return {"valor": v.isoformat(), "tipo": "datetime"}
+    if isinstance(v, date):
+        return {"valor": v.isoformat(), "tipo": "date"}
+    if isinstance(v, (list, tuple)) and all(
+        isinstance(x, (bool, int, float, str)) or x is None for x in v
+    ):
+        return {"valor": list(v), "tipo": "tuple" if isinstance(v, tuple) else "list"}
+    return None
+
+def sanitize_inputs(state: dict) -> dict:
+    """
+    Entradas de la sesión reproducibles: escalares, fechas y listas/tuplas de escalares.
+    Se descartan ficheros subidos, DataFrames, objetos internos y textos largos.
+    """
+    out = {}
+    for k, v in state.items():
+        if not isinstance(k, str) or k.startswith(("$$", "FormSubmitter:")):
+            continue
+        s = _sanitize_value(v)
+        if s is not None:
+            out[k] = s
+    return dict(sorted(out.items()))
+
+def restore_inputs(entradas: dict) -> dict:
+    """Inverso de sanitize_inputs: {clave: valor} con fechas y tuplas recuperadas."""
+    out = {}
+    for k, s in entradas.items():
+        tipo, v = s.get("tipo"), s["valor"]
+        if tipo == "date":
+            v = date.fromisoformat(v)
+        elif tipo == "datetime":
+            v = datetime.fromisoformat(v)
+        elif tipo == "tuple":
+            v = tuple(v)
+        out[k] = v
+    return out
+
+def _top_functions(profiler: cProfile.Profile, n: int = TOP_FUNCTIONS) -> list:
+    """[(función, llamadas, tiempo propio s, tiempo acumulado s)] de más a menos tiempo acumulado."""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    filas = []
+    for (fichero, linea, funcion), (_, llamadas, propio, acumulado, _) in stats.stats.items():
+        filas.append((f"{Path(fichero).name}:{linea}({funcion})", llamadas, round(propio, 6), round(acumulado, 6)))
+    filas.sort(key=lambda f: -f[3])
+    return filas[:n]
+
+def _prune(directory: Path, keep: int):
+    perfiles = sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+    for p in perfiles[:max(len(perfiles) - keep, 0)]:
+        p.unlink(missing_ok=True)
+        p.with_suffix(".json").unlink(missing_ok=True)
+
+def save_profile(profiler: cProfile.Profile, pagina: str, segundos: float, entradas: dict, directory: Path = None) -> Path:
+    """Guarda <fecha>_<página>_<ms>ms.prof y .json en directory; devuelve la ruta del .json."""
+    directory = Path(directory or PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    base = directory / f"{datetime.now():%Y%m%d-%H%M%S-%f}_{pagina}_{segundos * 1000:.0f}ms"
+    profiler.dump_stats(str(base.with_suffix(".prof")))
+    info = {
+        "pagina": pagina,
+        "script": f"{pagina}.py",
+        "segundos": round(segundos, 4),
+        "instante": datetime.now().isoformat(timespec="seconds"),
+        "pid": os.getpid(),
+        "funciones": _top_functions(profiler),
+        "entradas": entradas,
+    }
+    base.with_suffix(".json").write_text(json.dumps(info, ensure_ascii=False, indent=1), encoding="utf-8")
+    _prune(directory, PROFILE_MAX_FILES)
+    return base.with_suffix(".json")
+
+@contextmanager
+def profile_rerun(pagina: str, enabled: bool, inputs=None, threshold_s: float = None):
+    """
+    Envuelve una ejecución de la página: si enabled, la perfila y guarda el perfil si dura >= threshold_s.
+    inputs: función sin argumentos que devuelve st.session_state como dict (se lee al empezar, antes de
+    que la propia página lo modifique). Las excepciones de control de Streamlit (st.stop, reruns) se propagan
+    tal cual; la ejecución se mide igual.
+    """
+    if not enabled or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+    threshold_s = PROFILE_THRESHOLD_S if threshold_s is None else threshold_s
+    entradas = sanitize_inputs(inputs()) if inputs is not None else {}
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Otra herramienta de perfilado activa en el proceso (p. ej. un depurador): se ejecuta sin perfilar
+        _profiler_lock.release()
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        segundos = time.perf_counter() - t0
+        _profiler_lock.release()
+        if segundos >= threshold_s:
+            try:
+                ruta = save_profile(profiler, pagina, segundos, entradas)
+                logger.warning("%s: ejecución lenta (%.2f s), perfil en %s", pagina, segundos, ruta)
+            except OSError:
+                logger.exception("%s: no se pudo guardar el perfil", pagina)
+
+# ============================
+# Reproducción sin navegador
+# ============================
+def _is_read_only_error(mensaje: str, key: str) -> bool:
+    """¿Es el error de Streamlit al asignar en session_state la clave de un widget de solo lectura?"""
+    nombrada = f"session_state[{key!r}]" in mensaje or re.search(rf"session_state\.{re.escape(key)}\b", mensaje)
+    return bool(nombrada) and ("read-only" in mensaje or "cannot be set" in mensaje)
+
+def replay(path, timeout: float = 300) -> dict:
+    """
+    Ejecuta la página del perfil con sus entradas (streamlit.testing) bajo cProfile.
+    Las claves que Streamlit no deja asignar (botones, subidas de ficheros, data_editor) se descartan.
+    Devuelve {'segundos', 'original_s', 'descartadas', 'excepciones', 'perfil' (cProfile.Profile)}.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    info = json.loads(Path(path).read_text(encoding="utf-8"))
+    entradas = restore_inputs(info["entradas"])
+    descartadas = []
+    while True:
+        at = AppTest.from_file(str(APP_DIR / info["script"]), default_timeout=timeout)
+        for k, v in entradas.items():
+            at.session_state[k] = v
+        profiler = cProfile.Profile()
+        t0 = time.perf_counter()
+        profiler.enable()
+        try:
+            at.run()
+        finally:
+            profiler.disable()
+        segundos = time.perf_counter() - t0
+        msgs = [e.message for e in at.exception]
+        solo_lectura = [k for k in entradas for m in msgs if _is_read_only_error(m, k)]
+        if not solo_lectura:
+            break
+        descartadas.append(solo_lectura[0])
+        entradas.pop(solo_lectura[0])
+    return {
+        "segundos": segundos,
+        "original_s": info["segundos"],
+        "descartadas": descartadas,
+        "excepciones": msgs,
+        "perfil": profiler,
+    }
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        sys.exit("Uso: python perfilado.py <perfil.json>")
+    res = replay(sys.argv[1])
+    print(f"Reproducción: {res['segundos']:.2f} s (original {res['original_s']:.2f} s)")
+    if res["descartadas"]:
+        print("Claves no asignables descartadas:", ", ".join(res["descartadas"]))
+    for msg in res["excepciones"]:
+        print("Excepción en la página:", msg)
+    pstats.Stats(res["perfil"]).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
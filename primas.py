@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# Tablas de primas de seguro de vida (edad x capital) desde ficheros de datos versionados (sin Streamlit).
+# Fuente: data/primas/<tabla>.csv (edad + una columna por capital) y data/primas/tarifas.csv (aseguradora,
+# cobertura y fecha de referencia de cada tabla). Cada CSV se compila una sola vez a un .npy con el hash del
+# fichero en el nombre y después se mapea en memoria (solo lectura, compartido entre procesos por el sistema).
+# Nada se lee al importar: las páginas que no tarifican seguros no pagan por las tablas. Los ficheros se vigilan
+# con registro_datos: al editar una tabla se recompila y se vuelve a mapear solo esa (y se reapila el índice).
+import csv
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import registro_datos
+
+PRIMAS_DIR = Path(__file__).resolve().parent / "data" / "primas"
+COMPILED_DIR = PRIMAS_DIR / "compiladas"
+
+def load_manifest(path=PRIMAS_DIR / "tarifas.csv") -> dict:
+    """
+    {tabla: {'aseguradora', 'cobertura', 'fecha', 'edad_maxima'}} en el orden del fichero.
+    edad_maxima: última edad de contratación admitida (vacía si la aseguradora no pone límite).
+    """
+    with open(path, encoding="utf-8", newline="") as fh:
+        return {r["tabla"]: {k: v for k, v in r.items() if k != "tabla"} for r in csv.DictReader(fh)}
+
+def get_manifest() -> dict:
+    """Manifiesto vigente (se recarga si cambia tarifas.csv)."""
+    if not registro_datos.is_registered("primas/tarifas"):
+        registro_datos.register("primas/tarifas", lambda: [PRIMAS_DIR / "tarifas.csv"], load_manifest)
+    return registro_datos.get("primas/tarifas")
+
+def _source_path(tabla: str) -> Path:
+    return PRIMAS_DIR / f"{tabla}.csv"
+
+def _parse_csv(path: Path) -> np.ndarray:
+    """
+    CSV 'edad,<capital>,<capital>,...' -> matriz float64 con los ejes dentro:
+    fila 0 = capitales (celda [0, 0] sin uso), columna 0 = edades, resto = primas mensuales.
+    Lanza ValueError si las edades o los capitales no son crecientes o falta algún valor.
+    """
+    with open(path, encoding="utf-8", newline="") as fh:
+        header = next(csv.reader(fh))
+        body = np.loadtxt(fh, delimiter=",", dtype=float, ndmin=2)
+    caps = np.array(header[1:], dtype=float)
+    if body.shape[1] != caps.size + 1 or not np.isfinite(body).all():
+        raise ValueError(f"{path.name}: se esperaban {caps.size} primas por edad, sin huecos")
+    if np.any(np.diff(caps) <= 0) or np.any(np.diff(body[:, 0]) <= 0):
+        raise ValueError(f"{path.name}: edades y capitales deben ser crecientes")
+    return np.vstack([np.concatenate(([np.nan], caps)), body])
+
+def _compiled_path(tabla: str) -> Path:
+    """Nombre del compilado: tabla + hash del CSV (al cambiar la tabla cambia el fichero)."""
+    digest = hashlib.sha256(_source_path(tabla).read_bytes()).hexdigest()[:16]
+    return COMPILED_DIR / f"{tabla}.{digest}.npy"
+
+def compile_table(tabla: str) -> Path:
+    """
+    Compila el CSV de la tabla a .npy si no existe ya el compilado de esta versión.
+    - Escritura atómica (fichero temporal + rename): varios procesos pueden compilar a la vez.
+    - Se borran los compilados de versiones anteriores de la misma tabla.
+    """
+    target = _compiled_path(tabla)
+    if target.exists():
+        return target
+    data = _parse_csv(_source_path(tabla))
+    COMPILED_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=COMPILED_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            np.save(fh, data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    for old in COMPILED_DIR.glob(f"{tabla}.*.npy"):
+        if old != target:
+            old.unlink(missing_ok=True)
+    return target
+
+def compile_all() -> list[Path]:
+    """Compila todas las tablas del manifiesto (para el despliegue o el calentamiento)."""
+    return [compile_table(tabla) for tabla in load_manifest()]
+
+def premium_table(tabla: str) -> pd.DataFrame:
+    """
+    Tabla de primas mensuales (índice 'Edad', columnas = capitales) sobre el .npy mapeado en memoria.
+    Si no se puede escribir el compilado (directorio de solo lectura), se usa el CSV leído en memoria.
+    """
+    if tabla not in get_manifest():
+        raise KeyError(f"Tabla de primas desconocida: {tabla!r}")
+    nombre = f"primas/{tabla}"
+    if not registro_datos.is_registered(nombre):
+        registro_datos.register(nombre, lambda: [_source_path(tabla)], lambda: _load_table(tabla))
+    return registro_datos.get(nombre)
+
+def _load_table(tabla: str) -> pd.DataFrame:
+    try:
+        data = np.load(compile_table(tabla), mmap_mode="r")
+    except OSError:
+        data = _parse_csv(_source_path(tabla))
+    return pd.DataFrame(
+        data[1:, 1:],
+        index=pd.Index(data[1:, 0].astype(int), name="Edad"),
+        columns=data[0, 1:].astype(int).tolist(),
+        copy=False,
+    )
+
+# ============================
+# Índice de todas las tablas: cotización de todas las aseguradoras en una sola llamada
+# ============================
+def premium_index(tablas: tuple | None = None) -> dict:
+    """
+    Todas las tablas (por defecto, las del manifiesto) apiladas con sus propios ejes, rellenando hasta el
+    tamaño de la mayor: edades/capitales con +inf (no cuentan al buscar el tramo) y primas con NaN.
+    - 'tabla', 'aseguradora', 'cobertura', 'fecha': arrays (T,)
+    - 'edades' (T, A), 'capitales' (T, C), 'primas' (T, A, C), 'n_edades' y 'n_capitales' (T,)
+    - 'edad_maxima' (T,): +inf si no hay límite de contratación
+    El índice de todo el manifiesto se guarda en el registro y se reapila si cambia cualquiera de sus ficheros.
+    """
+    if tablas is not None:
+        return _stack_tables(tuple(tablas))
+    if not registro_datos.is_registered("primas/indice"):
+        registro_datos.register(
+            "primas/indice",
+            lambda: [PRIMAS_DIR / "tarifas.csv"] + [_source_path(t) for t in get_manifest()],
+            lambda: _stack_tables(tuple(get_manifest())),
+        )
+    return registro_datos.get("primas/indice")
+
+def _stack_tables(tablas: tuple) -> dict:
+    manifest = get_manifest()
+    dfs = [premium_table(t) for t in tablas]
+    n_a = np.array([df.shape[0] for df in dfs])
+    n_c = np.array([df.shape[1] for df in dfs])
+    T, A, C = len(dfs), int(n_a.max(initial=0)), int(n_c.max(initial=0))
+    edades = np.full((T, A), np.inf)
+    capitales = np.full((T, C), np.inf)
+    primas = np.full((T, A, C), np.nan)
+    for i, df in enumerate(dfs):
+        edades[i, :n_a[i]] = df.index.to_numpy(dtype=float)
+        capitales[i, :n_c[i]] = np.array(df.columns, dtype=float)
+        primas[i, :n_a[i], :n_c[i]] = df.to_numpy(dtype=float)
+    meta = [manifest[t] for t in tablas]
+    return {
+        "tabla": np.array(tablas),
+        "aseguradora": np.array([m["aseguradora"] for m in meta]),
+        "cobertura": np.array([m["cobertura"] for m in meta]),
+        "fecha": np.array([m["fecha"] for m in meta]),
+        "edad_maxima": np.array([float(m.get("edad_maxima") or np.inf) for m in meta]),
+        "edades": edades,
+        "capitales": capitales,
+        "primas": primas,
+        "n_edades": n_a,
+        "n_capitales": n_c,
+    }
+
+def quote_index(index: dict, edad, capital) -> np.ndarray:
+    """
+    Prima mensual de cada tabla del índice para cada par (edad, capital): array (T, N).
+    Misma interpolación bilineal que common.prima_bilineal_array (extrapola por el primer/último tramo),
+    pero el tramo se busca a la vez en todas las tablas contando los nodos <= valor (searchsorted por filas).
+    """
+    edad = np.atleast_1d(np.asarray(edad, dtype=float))
+    capital = np.atleast_1d(np.asarray(capital, dtype=float))
+    edad, capital = np.broadcast_arrays(edad, capital)
+    ages, caps, vals = index["edades"], index["capitales"], index["primas"]
+    t = np.arange(ages.shape[0])[:, None]
+
+    ia = (ages[:, None, :] <= edad[None, :, None]).sum(axis=2) - 1
+    ic = (caps[:, None, :] <= capital[None, :, None]).sum(axis=2) - 1
+    n_a, n_c = index["n_edades"][:, None], index["n_capitales"][:, None]
+    ia = np.clip(ia, 0, np.maximum(n_a - 2, 0))
+    ic = np.clip(ic, 0, np.maximum(n_c - 2, 0))
+    ia1, ic1 = np.minimum(ia + 1, n_a - 1), np.minimum(ic + 1, n_c - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ta = (edad - ages[t, ia]) / (ages[t, ia1] - ages[t, ia])
+        tc = (capital - caps[t, ic]) / (caps[t, ic1] - caps[t, ic])
+
+        v0 = vals[t, ia, ic] + (vals[t, ia, ic1] - vals[t, ia, ic]) * tc
+        v1 = vals[t, ia1, ic] + (vals[t, ia1, ic1] - vals[t, ia1, ic]) * tc
+        out = v0 + (v1 - v0) * ta
+    # Tablas de una sola edad o un solo capital: prima fija (como prima_bilineal_array)
+    return np.where((n_a < 2) | (n_c < 2), vals[:, :1, 0], out)
+
+def rank_quotes(edad: float, capital: float, index: dict | None = None) -> pd.DataFrame:
+    """
+    Cotización de todas las aseguradoras y coberturas para (edad, capital), de más barata a más cara.
+    Índice = nombre de tabla; columnas: aseguradora, cobertura, fecha, prima (mensual), prima_anual,
+    extrapolada (edad o capital fuera de los ejes de la tabla) y admitida (edad dentro del límite de contratación).
+    Las no admitidas van al final.
+    """
+    index = premium_index() if index is None else index
+    prima = quote_index(index, edad, capital)[:, 0]
+    n_a, n_c = index["n_edades"], index["n_capitales"]
+    t = np.arange(n_a.size)
+    extrapolada = (
+        (edad < index["edades"][:, 0]) | (edad > index["edades"][t, n_a - 1])
+        | (capital < index["capitales"][:, 0]) | (capital > index["capitales"][t, n_c - 1])
+    )
+    admitida = edad <= index["edad_maxima"]
+    order = np.lexsort((prima, ~admitida))
+    return pd.DataFrame(
+        {
+            "aseguradora": index["aseguradora"][order],
+            "cobertura": index["cobertura"][order],
+            "fecha": index["fecha"][order],
+            "prima": prima[order],
+            "prima_anual": prima[order] * 12,
+            "extrapolada": extrapolada[order],
+            "admitida": admitida[order],
+        },
+        index=pd.Index(index["tabla"][order], name="tabla"),
+    )
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Registro de datos de tarifas e impuestos recargables en caliente (sin Streamlit).
+# Cada conjunto de datos declara sus ficheros y cómo construir sus arrays derivados; get() comprueba la fecha de
+# modificación de esos ficheros (como mucho una vez cada CHECK_INTERVAL_S) y reconstruye solo el conjunto que ha
+# cambiado. Así una actualización de tarifas entra en servicio sin redesplegar ni vaciar las cachés.
+# Ningún resultado cacheado lee estos ficheros por su cuenta: las funciones con cache_disco reciben las tablas
+# como argumentos (van en la clave), así que una recarga no deja entradas que invalidar.
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+# Segundos entre comprobaciones de los ficheros de un mismo conjunto (0: en cada get)
+CHECK_INTERVAL_S = float(os.environ.get("SIMULADOR_DATOS_CHECK_S", "2"))
+
+logger = logging.getLogger("registro_datos")
+
+_datasets = {}
+_lock = threading.RLock()
+# Construcciones en curso en este hilo: dentro de una, los conjuntos de los que depende se comprueban siempre
+_building = threading.local()
+
+def register(nombre: str, files, build):
+    """
+    Declara un conjunto de datos (sustituye al anterior si ya existía):
+    - files: función sin argumentos que devuelve las rutas de las que depende (puede usar otros conjuntos);
+    - build: función sin argumentos que lee esos ficheros y devuelve el valor derivado.
+    No lee nada hasta el primer get().
+    """
+    with _lock:
+        _datasets[nombre] = {
+            "files": files, "build": build, "value": None, "firma": None, "version": 0, "comprobado": 0.0,
+        }
+
+def is_registered(nombre: str) -> bool:
+    return nombre in _datasets
+
+def _signature(paths) -> tuple:
+    """(ruta, mtime_ns, tamaño) de cada fichero; None en los que no existen."""
+    firma = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            firma.append((str(p), st.st_mtime_ns, st.st_size))
+        except OSError:
+            firma.append((str(p), None, None))
+    return tuple(firma)
+
+def get(nombre: str):
+    """
+    Valor actual del conjunto; lo (re)construye la primera vez y cuando cambia alguno de sus ficheros.
+    Si la reconstrucción falla (p. ej. un fichero a medio escribir), se sigue sirviendo el valor anterior
+    y se vuelve a intentar en la siguiente comprobación; sin valor anterior, el error se propaga.
+    """
+    ds = _datasets[nombre]
+    ahora = time.monotonic()
+    anidado = getattr(_building, "depth", 0) > 0
+    if ds["firma"] is not None and not anidado and ahora - ds["comprobado"] < CHECK_INTERVAL_S:
+        return ds["value"]
+    with _lock:
+        firma = _signature(Path(p) for p in ds["files"]())
+        ds["comprobado"] = ahora
+        if firma == ds["firma"]:
+            return ds["value"]
+        _building.depth = getattr(_building, "depth", 0) + 1
+        try:
+            value = ds["build"]()
+        except Exception:
+            if ds["firma"] is None:
+                raise
+            logger.exception("%s: no se pudo recargar; se mantienen los datos anteriores", nombre)
+            return ds["value"]
+        finally:
+            _building.depth -= 1
+        recarga = ds["firma"] is not None
+        ds["value"], ds["firma"] = value, firma
+        ds["version"] += 1
+        if recarga:
+            logger.info("%s: recargado (versión %d)", nombre, ds["version"])
+        return value
+
+def version(nombre: str) -> int:
+    """Nº de veces que se ha construido el conjunto en este proceso (0 si aún no se ha usado)."""
+    return _datasets[nombre]["version"]
+
+def status() -> dict:
+    """{conjunto: {'version', 'ficheros'}} para diagnóstico."""
+    return {n: {"version": d["version"], "ficheros": [f[0] for f in d["firma"] or ()]} for n, d in _datasets.items()}
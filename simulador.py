@@ -1,16 +1,26 @@
 # -*- coding: utf-8 -*-
+from datetime import date
+
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 
-from common import inject_css, euro_input, eur, amortization_schedule, render_footer
+from common import (
+    inject_css, euro_input, eur, fmt_number_es, dated_amortization_schedule, yearly_rollup, render_footer,
+    loan_cashflows, tae_from_cashflows, insurance_premium_schedule, get_ing_df,
+    max_payment_from_dti, max_principal, min_term, affordability_table, ROUNDING_MODES, DAY_COUNTS,
+    fmt_table_es, SCHEDULE_FORMATS, download_on_demand
+)
+from exportacion import export_bytes, iter_schedule_chunks
+from metricas import timer
 
 inject_css()
 
 st.title("🏠 Simulador de Hipoteca Fija")
 st.caption(
     "Introduce el importe, el plazo y el interés anual. "
-    "El cálculo asume capitalización mensual (interés nominal anual / 12)."
+    "La cuota se calcula con el interés nominal anual / 12; los intereses de cada mes, con la base de cálculo elegida."
 )
 
 st.markdown(
@@ -41,15 +51,34 @@ with st.form("params_form_sim", clear_on_submit=False):
             min_value=0.0, max_value=30.0, value=3.0, step=0.05, format="%.2f", key="r_sim"
         )
     with c4:
-        start_month = st.selectbox(
-            "Mes de inicio (agrupación anual)",
-            options=list(range(1, 13)), index=0, format_func=lambda m: f"{m:02d}", key="m_sim"
+        fecha_inicio = st.date_input(
+            "Fecha de firma", value=date.today().replace(day=1), format="DD/MM/YYYY", key="f_sim",
+            help="La primera cuota vence un mes después; los años del gráfico son años naturales."
+        )
+    b1, b2 = st.columns(2)
+    with b1:
+        base_sim = st.selectbox(
+            "Cálculo de intereses",
+            options=list(DAY_COUNTS),
+            format_func=lambda k: DAY_COUNTS[k],
+            key="base_sim",
+            help="Algunos bancos devengan intereses por días reales entre fechas de pago (Real/360)."
+        )
+    with b2:
+        redondeo_sim = st.selectbox(
+            "Redondeo al céntimo",
+            options=[None, *ROUNDING_MODES],
+            format_func=lambda k: "Sin redondeo (cálculo exacto)" if k is None else ROUNDING_MODES[k],
+            key="redondeo_sim",
+            help="Con redondeo, cuota e intereses de cada mes se redondean al céntimo como en el cuadro del banco."
         )
     _ = st.form_submit_button("✅ Aplicar parámetros")
 
 n_months = years * 12
 r_monthly = (annual_rate_pct / 100.0) / 12.0
-df = amortization_schedule(principal, r_monthly, n_months)
+df = dated_amortization_schedule(
+    principal, annual_rate_pct / 100.0, n_months, fecha_inicio, base_sim, rounding=redondeo_sim
+)
 
 if df.empty:
     st.warning("Introduce un importe y un plazo válidos.")
@@ -63,40 +92,163 @@ m1c.metric("💳 Cuota mensual", eur(monthly_payment))
 m2c.metric("💡 Intereses totales a pagar", eur(total_interest))
 m3c.metric("🗓️ Nº de cuotas (meses)", f"{n_months}")
 
-st.divider()
-
-pie_fig = go.Figure(data=[go.Pie(labels=["Principal", "Intereses"], values=[principal, total_interest], hole=0.35)])
-pie_fig.update_layout(
-    title="Distribución total: principal vs intereses",
-    legend=dict(orientation="h", yanchor="bottom", y=-0.05, xanchor="center", x=0.5),
+st.markdown(
+    """
+    <div class="param-header">
+      <span class="param-chip">TAE</span>
+      <span class="param-subtle">Añade comisiones, gastos y seguros vinculados para ver el coste efectivo (TAE).</span>
+    </div>
+    """,
+    unsafe_allow_html=True
 )
 
-df["Mes calendario"] = ((df["Mes"] - 1 + (start_month - 1)) % 12) + 1
-df["Año"] = ((df["Mes"] - 1 + (start_month - 1)) // 12) + 1
-annual = df.groupby("Año", as_index=False)[["Intereses", "Amortización"]].sum().round(2)
-
-bar_fig = go.Figure()
-bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Intereses"], name="Intereses"))
-bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Amortización"], name="Amortización"))
-bar_fig.update_layout(
-    barmode="stack",
-    title="Pago anual desglosado (apilado): amortización vs intereses",
-    xaxis_title="Año",
-    yaxis_title="€",
+with st.form("params_form_sim_tae", clear_on_submit=False):
+    t1, t2, t3, t4 = st.columns(4)
+    with t1:
+        comision_pct = st.number_input(
+            "Comisión de apertura (%)", min_value=0.0, max_value=5.0, value=0.0, step=0.05, format="%.2f",
+            key="com_sim_tae"
+        )
+    with t2:
+        tasacion_sim = euro_input("Tasación y otros gastos iniciales (€)", key="tas_sim_eur", default=400.0, min_value=0.0)
+    with t3:
+        seguro_sim = st.selectbox(
+            "Seguro de vida vinculado",
+            ["Ninguno", "Tabla banco (ING) según edad y capital pendiente", "Prima mensual fija"],
+            key="seguro_sim_tae"
+        )
+    with t4:
+        edad_sim = st.number_input("Edad del tomador", min_value=18, max_value=99, value=30, step=1, key="edad_sim_tae")
+        prima_fija_sim = euro_input("Prima mensual fija (€)", key="prima_sim_eur", default=20.0, min_value=0.0)
+    _ = st.form_submit_button("🧮 Calcular TAE")
+
+if seguro_sim.startswith("Tabla"):
+    primas_sim = insurance_premium_schedule(df["Saldo final"].to_numpy(), principal, edad_sim, get_ing_df())
+elif seguro_sim == "Prima mensual fija":
+    primas_sim = prima_fija_sim
+else:
+    primas_sim = None
+
+tae_sim = tae_from_cashflows(
+    loan_cashflows(
+        principal, r_monthly, n_months, principal * comision_pct / 100.0, tasacion_sim, primas_sim,
+        cuotas=df["Cuota"].to_numpy()
+    )
 )
+k1, k2 = st.columns(2)
+k1.metric("📌 TIN", f"{fmt_number_es(annual_rate_pct, 2)} %")
+k2.metric("📈 TAE (con comisiones, gastos y seguros)", f"{fmt_number_es(tae_sim * 100, 2)} %")
+st.caption(
+    "TAE calculada sobre los flujos mensuales: importe recibido menos comisión y gastos, y cada cuota del cuadro "
+    "(con la base de cálculo y el redondeo elegidos) más la prima del seguro vinculado. "
+    "Con la tabla del banco la prima se recalcula cada año con la edad y el capital pendiente."
+)
+
+st.divider()
+
+with timer("simulador.graficos"):
+    pie_fig = go.Figure(data=[go.Pie(labels=["Principal", "Intereses"], values=[principal, total_interest], hole=0.35)])
+    pie_fig.update_layout(
+        title="Distribución total: principal vs intereses",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.05, xanchor="center", x=0.5),
+    )
+
+    annual = pd.DataFrame(yearly_rollup(
+        df["Fecha"].to_numpy(), {"Intereses": df["Intereses"].to_numpy(), "Amortización": df["Amortización"].to_numpy()}
+    )).round(2)
+
+    bar_fig = go.Figure()
+    bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Intereses"], name="Intereses"))
+    bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Amortización"], name="Amortización"))
+    bar_fig.update_layout(
+        barmode="stack",
+        title="Pago anual desglosado (apilado): amortización vs intereses",
+        xaxis_title="Año",
+        yaxis_title="€",
+    )
 
-c1g, c2g = st.columns([1, 1])
-with c1g:
-    st.plotly_chart(pie_fig, use_container_width=True)
-with c2g:
-    st.plotly_chart(bar_fig, use_container_width=True)
+    c1g, c2g = st.columns([1, 1])
+    with c1g:
+        st.plotly_chart(pie_fig, use_container_width=True)
+    with c2g:
+        st.plotly_chart(bar_fig, use_container_width=True)
 
 with st.expander("Ver detalle de las primeras 12 cuotas"):
     st.dataframe(
-        df.head(12).style.format(
-            {"Cuota": eur, "Intereses": eur, "Amortización": eur, "Saldo final": eur}
-        )
+        fmt_table_es(df.head(12), SCHEDULE_FORMATS)
     )
 
-st.caption("Notas: Este simulador no contempla comisiones, seguros ni variaciones de tipo de interés.")
+download_on_demand(
+    "Cuadro completo",
+    lambda fmt: export_bytes(iter_schedule_chunks({c: df[c].to_numpy() for c in df.columns}), fmt),
+    "cuadro_amortizacion_fija",
+    key="exp_sim",
+    firma=(principal, years, annual_rate_pct, fecha_inicio, base_sim, redondeo_sim),
+)
+
+st.divider()
+
+# ============================
+# ¿Cuánto me pueden prestar?
+# ============================
+st.markdown(
+    """
+    <div class="param-header">
+      <span class="param-chip">¿Cuánto me pueden prestar?</span>
+      <span class="param-subtle">A partir de tus ingresos (ratio de endeudamiento) o de una cuota máxima.</span>
+    </div>
+    """,
+    unsafe_allow_html=True
+)
+
+with st.form("params_form_sim_capacidad", clear_on_submit=False):
+    a1, a2, a3, a4 = st.columns(4)
+    with a1:
+        modo_cap = st.radio(
+            "Límite de cuota", ["Ratio de endeudamiento", "Cuota máxima"], key="modo_cap_sim"
+        )
+    with a2:
+        ingresos_cap = euro_input("Ingresos netos mensuales (€)", key="ingresos_cap_eur", default=3000.0, min_value=0.0)
+        otras_deudas_cap = euro_input("Otras deudas mensuales (€)", key="deudas_cap_eur", default=0.0, min_value=0.0)
+    with a3:
+        dti_cap = st.number_input(
+            "Ratio de endeudamiento máx. (%)", min_value=1.0, max_value=60.0, value=35.0, step=1.0,
+            format="%.0f", key="dti_cap_sim"
+        )
+    with a4:
+        cuota_max_in = euro_input("Cuota máxima (€)", key="cuota_max_eur", default=900.0, min_value=0.0)
+    _ = st.form_submit_button("🧮 Calcular capacidad")
+
+if modo_cap == "Ratio de endeudamiento":
+    cuota_max = float(max_payment_from_dti(ingresos_cap, dti_cap / 100.0, otras_deudas_cap))
+else:
+    cuota_max = float(cuota_max_in)
+
+importe_max = max_principal(cuota_max, r_monthly, n_months)
+plazo_min = min_term(principal, r_monthly, cuota_max)
+
+b1, b2, b3 = st.columns(3)
+b1.metric("💳 Cuota máxima asumible", eur(cuota_max))
+b2.metric(f"🏦 Importe máximo ({years} años, {fmt_number_es(annual_rate_pct, 2)} %)", eur(importe_max))
+b3.metric(
+    f"⏱️ Plazo mínimo para {eur(principal)}",
+    "—" if np.isnan(plazo_min) else f"{int(plazo_min)} meses ({fmt_number_es(plazo_min / 12, 1)} años)"
+)
+if np.isnan(plazo_min):
+    st.caption("Con esa cuota no se cubren ni los intereses: el importe no se puede amortizar a este tipo.")
+elif plazo_min > 480:
+    st.caption("El plazo mínimo supera los 40 años habituales.")
+
+tipos_tabla = np.round(np.arange(annual_rate_pct - 1.0, annual_rate_pct + 1.01, 0.5), 2)
+tipos_tabla = tipos_tabla[tipos_tabla >= 0]
+anios_tabla = np.arange(1, 41)
+tabla_cap = pd.DataFrame(
+    affordability_table(cuota_max, tipos_tabla, anios_tabla),
+    index=pd.Index(anios_tabla, name="Plazo (años)"),
+    columns=[f"{fmt_number_es(t, 2)} %" for t in tipos_tabla],
+)
+with st.expander("Ver tabla de importe máximo por plazo y tipo"):
+    st.dataframe(fmt_table_es(tabla_cap, {c: "eur" for c in tabla_cap.columns}), use_container_width=True)
+
+st.caption("Notas: Las cuotas y gráficas no contemplan comisiones ni seguros (solo la TAE). Tampoco variaciones de tipo de interés.")
 render_footer()
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
+from datetime import date
+
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 
-from common import inject_css, euro_input, eur, amortization_schedule, render_footer
+from common import (
+    inject_css, euro_input, eur, dated_amortization_schedule, yearly_rollup, render_footer, DAY_COUNTS,
+    fmt_table_es, SCHEDULE_FORMATS, download_on_demand
+)
+from exportacion import export_bytes, iter_schedule_chunks
+from metricas import timer
 
 inject_css()
 
@@ -11,7 +18,7 @@ st.title("🏠 Simulador de Hipoteca Mixta")
 st.caption(
     "Introduce el importe, el plazo y el interés del periodo fijo. "
     "Añade el año de cambio y el tipo estimado del periodo variable (Euríbor + diferencial). "
-    "El cálculo asume capitalización mensual (TIN anual / 12)."
+    "La cuota se calcula con el TIN anual / 12; los intereses de cada mes, con la base de cálculo elegida."
 )
 
 st.markdown(
@@ -42,9 +49,9 @@ with st.form("params_form_mixta", clear_on_submit=False):
             min_value=0.0, max_value=30.0, value=3.0, step=0.05, format="%.2f", key="r1_mix"
         )
     with r1c4:
-        start_month = st.selectbox(
-            "Mes de inicio (agrupación anual)",
-            options=list(range(1, 13)), index=0, format_func=lambda m: f"{m:02d}", key="m_mix"
+        fecha_inicio = st.date_input(
+            "Fecha de firma", value=date.today().replace(day=1), format="DD/MM/YYYY", key="f_mix",
+            help="La primera cuota vence un mes después; los años del gráfico son años naturales."
         )
 
     r2c1, r2c2, r2c3 = st.columns([1, 1, 1.2])
@@ -60,6 +67,13 @@ with st.form("params_form_mixta", clear_on_submit=False):
         )
         st.caption("Periodo 2: **estimación de Euríbor + diferencial** (puedes ajustar el valor).")
     with r2c3:
+        base_mix = st.selectbox(
+            "Cálculo de intereses",
+            options=list(DAY_COUNTS),
+            format_func=lambda k: DAY_COUNTS[k],
+            key="base_mix",
+            help="Algunos bancos devengan intereses por días reales entre fechas de pago (Real/360)."
+        )
         _ = st.form_submit_button("✅ Aplicar parámetros")
 
 n_months = int(years * 12)
@@ -67,11 +81,9 @@ m1_months = int(change_year * 12)
 m1_months = max(0, min(m1_months, n_months))
 n2_months = int(max(n_months - m1_months, 0))
 
-r1_monthly = (annual_rate_pct_1 / 100.0) / 12.0
-r2_monthly = (annual_rate_pct_2 / 100.0) / 12.0
 
 # --- Periodo 1 (fijo): cuota calculada sobre el plazo total ---
-df_full_r1 = amortization_schedule(principal, r1_monthly, n_months)
+df_full_r1 = dated_amortization_schedule(principal, annual_rate_pct_1 / 100.0, n_months, fecha_inicio, base_mix)
 if df_full_r1.empty:
     st.warning("Introduce un importe y un plazo válidos.")
     st.stop()
@@ -90,7 +102,10 @@ else:
 
 # --- Periodo 2 (variable): se recalcula cuota con saldo y plazo restante ---
 if n2_months > 0:
-    df_p2 = amortization_schedule(balance_after_p1, r2_monthly, n2_months).copy()
+    inicio_p2 = df_full_r1["Fecha"].iloc[m1_months - 1] if m1_months > 0 else fecha_inicio
+    df_p2 = dated_amortization_schedule(
+        balance_after_p1, annual_rate_pct_2 / 100.0, n2_months, inicio_p2, base_mix
+    ).copy()
     if df_p2.empty:
         df_p2 = df_full_r1.iloc[0:0].copy()
         monthly_payment_p2 = 0.0
@@ -125,40 +140,40 @@ st.caption(
 
 st.divider()
 
-# Gráficas (igual estilo que la fija)
-pie_fig = go.Figure(
-    data=[go.Pie(labels=["Principal", "Intereses"], values=[principal, total_interest], hole=0.35)]
-)
-pie_fig.update_layout(
-    title="Distribución total: principal vs intereses (mixta)",
-    legend=dict(orientation="h", yanchor="bottom", y=-0.05, xanchor="center", x=0.5),
-)
+with timer("simulador_mixta.graficos"):
+    # Gráficas (igual estilo que la fija)
+    pie_fig = go.Figure(
+        data=[go.Pie(labels=["Principal", "Intereses"], values=[principal, total_interest], hole=0.35)]
+    )
+    pie_fig.update_layout(
+        title="Distribución total: principal vs intereses (mixta)",
+        legend=dict(orientation="h", yanchor="bottom", y=-0.05, xanchor="center", x=0.5),
+    )
 
-df_mix["Mes calendario"] = ((df_mix["Mes"] - 1 + (start_month - 1)) % 12) + 1
-df_mix["Año"] = ((df_mix["Mes"] - 1 + (start_month - 1)) // 12) + 1
-annual = df_mix.groupby("Año", as_index=False)[["Intereses", "Amortización"]].sum().round(2)
-
-bar_fig = go.Figure()
-bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Intereses"], name="Intereses"))
-bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Amortización"], name="Amortización"))
-bar_fig.update_layout(
-    barmode="stack",
-    title="Pago anual desglosado (apilado): amortización vs intereses (mixta)",
-    xaxis_title="Año",
-    yaxis_title="€",
-)
+    annual = pd.DataFrame(yearly_rollup(
+        df_mix["Fecha"].to_numpy(),
+        {"Intereses": df_mix["Intereses"].to_numpy(), "Amortización": df_mix["Amortización"].to_numpy()}
+    )).round(2)
+
+    bar_fig = go.Figure()
+    bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Intereses"], name="Intereses"))
+    bar_fig.add_trace(go.Bar(x=annual["Año"], y=annual["Amortización"], name="Amortización"))
+    bar_fig.update_layout(
+        barmode="stack",
+        title="Pago anual desglosado (apilado): amortización vs intereses (mixta)",
+        xaxis_title="Año",
+        yaxis_title="€",
+    )
 
-c1g, c2g = st.columns([1, 1])
-with c1g:
-    st.plotly_chart(pie_fig, use_container_width=True)
-with c2g:
-    st.plotly_chart(bar_fig, use_container_width=True)
+    c1g, c2g = st.columns([1, 1])
+    with c1g:
+        st.plotly_chart(pie_fig, use_container_width=True)
+    with c2g:
+        st.plotly_chart(bar_fig, use_container_width=True)
 
 with st.expander("Ver detalle de las primeras 12 cuotas"):
     st.dataframe(
-        df_mix.head(12).style.format(
-            {"Cuota": eur, "Intereses": eur, "Amortización": eur, "Saldo final": eur}
-        ),
+        fmt_table_es(df_mix.head(12), SCHEDULE_FORMATS),
         use_container_width=True
     )
 
@@ -166,29 +181,31 @@ with st.expander("Ver detalle alrededor del cambio (últimas 6 antes y primeras
     if m1_months == 0:
         st.info("No hay periodo 1 (cambio en año 0).")
         st.dataframe(
-            df_mix.head(12).style.format(
-                {"Cuota": eur, "Intereses": eur, "Amortización": eur, "Saldo final": eur}
-            ),
+            fmt_table_es(df_mix.head(12), SCHEDULE_FORMATS),
             use_container_width=True
         )
     elif n2_months == 0:
         st.info("No hay periodo 2 (cambio al final del plazo).")
         st.dataframe(
-            df_mix.tail(12).style.format(
-                {"Cuota": eur, "Intereses": eur, "Amortización": eur, "Saldo final": eur}
-            ),
+            fmt_table_es(df_mix.tail(12), SCHEDULE_FORMATS),
             use_container_width=True
         )
     else:
         i0 = max(m1_months - 6, 0)
         i1 = min(m1_months + 6, len(df_mix))
         st.dataframe(
-            df_mix.iloc[i0:i1].style.format(
-                {"Cuota": eur, "Intereses": eur, "Amortización": eur, "Saldo final": eur}
-            ),
+            fmt_table_es(df_mix.iloc[i0:i1], SCHEDULE_FORMATS),
             use_container_width=True
         )
 
+download_on_demand(
+    "Cuadro completo",
+    lambda fmt: export_bytes(iter_schedule_chunks({c: df_mix[c].to_numpy() for c in df_mix.columns}), fmt),
+    "cuadro_amortizacion_mixta",
+    key="exp_mix",
+    firma=(principal, years, annual_rate_pct_1, fecha_inicio, change_year, annual_rate_pct_2, base_mix),
+)
+
 st.caption(
     "Notas: Este simulador no contempla comisiones, seguros ni variaciones del tipo real en el periodo variable. "
     "El tipo del periodo 2 es una estimación (Euríbor + diferencial) que puedes ajustar."
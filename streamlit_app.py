@@ -2,8 +2,18 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 
+from calentamiento import start_warm_process
+from metricas import start_exporters, timer
+from perfilado import profile_rerun, profiling_enabled
+
 st.set_page_config(page_title="Simulador de Hipoteca", layout="wide")
 
+# Una vez por proceso, en segundo plano: imports pesados y tablas de primas. Con `python calentamiento.py`
+# (calienta también el escenario por defecto de cada página y arranca el servidor) ya está hecho y no cuesta nada.
+st.cache_resource(show_spinner=False)(start_warm_process)()
+# Endpoint /metrics y/o volcado a fichero según SIMULADOR_METRICAS_PUERTO / SIMULADOR_METRICAS_FICHERO
+st.cache_resource(show_spinner=False)(start_exporters)()
+
 pages = [
     st.Page("simulador.py", title="Simulador Hipoteca Fija", icon="📊", url_path="simulador"),
     st.Page("trae_tu_fija.py", title="Trae tu hipoteca fija", icon="🔁", url_path="trae_tu_fija"),
@@ -12,8 +22,15 @@ pages = [
     st.Page("bonificaciones.py", title="Estudio Bonificaciones", icon="🎁", url_path="bonificaciones"),
     st.Page("comparador.py", title="Comparador: Fija vs Mixta", icon="📐", url_path="comparador"),
     st.Page("inversion.py", title="Analiza Inversión", icon="💹", url_path="inversion"),
+    st.Page("cartera.py", title="Cartera de Inversión", icon="🏘️", url_path="cartera"),
     st.Page("publicidad.py", title="Quienes Somos", icon="🖼️", url_path="publicidad"),
 ]
 
 pg = st.navigation(pages, position="sidebar")
-pg.run()
+# Tiempo de cada ejecución completa de la página (las de fragmentos se miden en cada sección).
+# La página por defecto (la primera) tiene url_path "" porque se sirve en la raíz.
+pagina = pg.url_path or "simulador"
+# Con SIMULADOR_PERFIL activo, las ejecuciones lentas se guardan perfiladas junto con las entradas de la sesión
+perfilar = profiling_enabled(st.query_params.get("perfil"))
+with timer(f"pagina.{pagina}"), profile_rerun(pagina, perfilar, st.session_state.to_dict):
+    pg.run()
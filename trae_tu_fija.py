@@ -5,8 +5,10 @@ import pandas as pd
 import streamlit as st
 
 from common import (
-    inject_css, euro_input, eur, amortization_schedule, render_footer
+    inject_css, euro_input, eur, fmt_number_es, amortization_schedule, implied_rate, render_footer,
+    ROUNDING_MODES, fmt_table_es, loan_cashflows, tae_from_cashflows
 )
+from importacion import infer_loan_parameters, normalize_bank_schedule, read_bank_schedule, reconcile_schedule
 
 inject_css()
 
@@ -57,8 +59,61 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Importar el cuadro del banco: deduce los datos y rellena el formulario
+importado = None
+with st.expander("📥 Importar el cuadro de amortización de tu banco (CSV/XLSX)"):
+    fichero_banco = st.file_uploader(
+        "Cuadro del banco (CSV con ';' y decimales con coma, o XLSX)",
+        type=["csv", "xlsx"],
+        key="ttf_import_file",
+        help="Columnas habituales: Nº cuota, Fecha, Cuota, Intereses, Amortización/Capital amortizado, Saldo/Capital pendiente."
+    )
+    if fichero_banco is not None:
+        try:
+            importado = normalize_bank_schedule(read_bank_schedule(fichero_banco, fichero_banco.name))
+        except ValueError as e:
+            st.error(f"No se pudo leer el cuadro: {e}")
+    if importado is not None:
+        deducido = infer_loan_parameters(importado)
+        anios_deducidos = min(max(int(math.ceil(deducido["plazo"] / 12)), 1), 40)
+
+        def _prefill_from_import():
+            # euro_input -> st.text_input -> guardar STRING
+            st.session_state["ttf_p_old_eur"] = f"{deducido['principal']:.2f}"
+            st.session_state["ttf_y_old"] = anios_deducidos
+            st.session_state["ttf_modo_tin"] = "Conozco el tipo (TIN)"
+            st.session_state["ttf_r_old"] = round(deducido["tin"], 3)
+            st.session_state["ttf_redondeo"] = deducido["redondeo"]
+            if deducido["meses_pagados"] is not None:
+                st.session_state["ttf_months_paid"] = min(deducido["meses_pagados"], anios_deducidos * 12)
+
+        st.markdown(
+            f"**{deducido['filas']} cuotas leídas.** Importe inicial: **{eur(deducido['principal'])}** · "
+            f"Plazo: **{deducido['plazo']} meses** · TIN: **{fmt_number_es(deducido['tin'], 3)} %** · "
+            f"Meses pagados: **{'—' if deducido['meses_pagados'] is None else deducido['meses_pagados']}**"
+        )
+        if deducido["mes_cambio"] is not None:
+            st.warning(
+                f"El tipo cambia en la cuota {deducido['mes_cambio']} "
+                f"({fmt_number_es(deducido['tin_1'], 3)} % → {fmt_number_es(deducido['tin_2'], 3)} %): "
+                "parece una hipoteca mixta; usa «Trae tu hipoteca mixta»."
+            )
+        if deducido["plazo"] % 12:
+            st.caption(f"El plazo no es un número entero de años: se redondea a {anios_deducidos} años.")
+        st.button("✨ Rellenar con los datos del cuadro", on_click=_prefill_from_import, key="ttf_btn_import")
+
 # Sanitiza por si en alguna sesión anterior quedó como número
 _ensure_text_state("ttf_p_old_eur")
+_ensure_text_state("ttf_cuota_old_eur")
+_ensure_text_state("ttf_saldo_old_eur")
+
+modo_tin = st.radio(
+    "¿Cómo quieres introducir tu hipoteca actual?",
+    options=["Conozco el tipo (TIN)", "Conozco la cuota (calcular el TIN)"],
+    horizontal=True,
+    key="ttf_modo_tin"
+)
+desde_cuota = modo_tin.startswith("Conozco la cuota")
 
 with st.form("form_old_fixed", clear_on_submit=False):
     c1, c2, c3, c4 = st.columns([1.2, 1, 1, 1])
@@ -73,10 +128,20 @@ with st.form("form_old_fixed", clear_on_submit=False):
     with c2:
         Y_old = st.slider("Plazo original (años)", 1, 40, 30, 1, key="ttf_y_old")
     with c3:
-        R_old = st.number_input(
-            "Tipo fijo actual (% TIN anual)",
-            min_value=0.0, max_value=30.0, value=3.00, step=0.05, format="%.2f", key="ttf_r_old"
-        )
+        if desde_cuota:
+            cuota_in = euro_input(
+                "Cuota mensual actual (€)",
+                key="ttf_cuota_old_eur",
+                default=843.21,
+                decimals=2,
+                min_value=0.0,
+                help_text="La cuota que te cobra el banco. Calculamos el TIN que la explica."
+            )
+        else:
+            R_old = st.number_input(
+                "Tipo fijo actual (% TIN anual)",
+                min_value=0.0, max_value=30.0, value=3.00, step=0.05, format="%.2f", key="ttf_r_old"
+            )
     with c4:
         n_old_tmp = safe_int(Y_old) * 12
         months_paid_in = st.number_input(
@@ -88,6 +153,22 @@ with st.form("form_old_fixed", clear_on_submit=False):
             key="ttf_months_paid",
             help="Ojo: al estar en un formulario, este valor solo se aplica al pulsar 'Calcular hipoteca actual'."
         )
+    if desde_cuota:
+        saldo_in = euro_input(
+            "Saldo pendiente según el banco (€) — opcional (0 = no lo sé)",
+            key="ttf_saldo_old_eur",
+            default=0.0,
+            decimals=2,
+            min_value=0.0,
+            help_text="Si lo conoces (y llevas meses pagados), el TIN se ajusta con el saldo: es más preciso."
+        )
+    redondeo_old = st.selectbox(
+        "Redondeo al céntimo del banco",
+        options=[None, *ROUNDING_MODES],
+        format_func=lambda k: "Sin redondeo (cálculo exacto)" if k is None else ROUNDING_MODES[k],
+        key="ttf_redondeo",
+        help="Elige el redondeo de tu banco para que cuotas y saldos cuadren al céntimo con su cuadro."
+    )
 
     _ = st.form_submit_button("✅ Calcular hipoteca actual")
 
@@ -99,8 +180,30 @@ if P_old <= 0 or n_old <= 0:
     st.warning("Introduce un importe y plazo válidos.")
     st.stop()
 
+if desde_cuota:
+    con_saldo = saldo_in > 0 and months_paid > 0
+    r_impl = implied_rate(
+        P_old, n_old, cuota_in,
+        months_paid=months_paid if con_saldo else None,
+        saldo=saldo_in if con_saldo else None
+    )
+    if np.isnan(r_impl):
+        if not con_saldo and cuota_in * n_old < P_old:
+            st.error(
+                f"Con esa cuota, en {n_old} meses solo se devuelven {eur(cuota_in * n_old)} de {eur(P_old)}: "
+                "haría falta un TIN negativo. Revisa la cuota, el importe y el plazo."
+            )
+        else:
+            st.error("No hay un TIN razonable que explique esa cuota con ese importe y plazo. Revisa los datos.")
+        st.stop()
+    R_old = r_impl * 12 * 100.0
+    st.info(
+        f"TIN deducido: **{fmt_number_es(R_old, 3)} %** "
+        + ("(ajustado con el saldo pendiente y los meses pagados)." if con_saldo else "(a partir de la cuota, importe y plazo).")
+    )
+
 r_old_m = (R_old / 100.0) / 12.0
-df_old = amortization_schedule(P_old, r_old_m, n_old)
+df_old = amortization_schedule(P_old, r_old_m, n_old, rounding=redondeo_old)
 
 col_cuota = _pick_col(df_old, ["Cuota", "cuota", "Payment"])
 col_int   = _pick_col(df_old, ["Interés", "Interes", "Interest"])
@@ -160,10 +263,27 @@ with st.expander("Ver resumen de tu hipoteca actual (detalle)"):
         ]
     })
     st.dataframe(
-        old_summary.style.format({"Valor": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else eur(x)}),
+        fmt_table_es(old_summary, {"Valor": "eur"}),
         use_container_width=True
     )
 
+if importado is not None:
+    with st.expander("🧮 Conciliación: cuadro del banco frente a nuestro cálculo"):
+        conciliacion = reconcile_schedule(importado, df_old)
+        diferencias = conciliacion[["Δ Cuota", "Δ Intereses", "Δ Saldo final"]].abs()
+        descuadres = int((diferencias.max(axis=1) >= 0.01).sum())
+        k1, k2, k3 = st.columns(3)
+        k1.metric("Cuotas comparadas", f"{len(conciliacion)}")
+        k2.metric("Cuotas con diferencias (≥ 1 céntimo)", f"{descuadres}")
+        k3.metric("Diferencia máxima de saldo", eur(float(diferencias["Δ Saldo final"].max())))
+        formatos = {c: "eur" for c in conciliacion.columns if c not in ("Mes", "Fecha")}
+        st.dataframe(
+            fmt_table_es(conciliacion, {**formatos, "Fecha": "fecha"}),
+            use_container_width=True,
+            hide_index=True
+        )
+        st.caption("Δ = nuestro cálculo − banco. Si hay descuadres, revisa el redondeo y los datos del formulario.")
+
 st.divider()
 
 # -----------------------------
@@ -234,12 +354,27 @@ with st.form("form_new_offer", clear_on_submit=False):
             min_value=0.0, max_value=30.0, value=2.50, step=0.05, format="%.2f", key="ttf_r_new"
         )
 
+    e1n, e2n = st.columns(2)
+    with e1n:
+        comision_new = st.number_input(
+            "Comisión de apertura de la oferta (%)",
+            min_value=0.0, max_value=5.0, value=0.0, step=0.05, format="%.2f", key="ttf_com_new"
+        )
+    with e2n:
+        gastos_new = euro_input(
+            "Gastos iniciales de la oferta (tasación, notaría, gestoría...) (€)",
+            key="ttf_gastos_new_eur",
+            default=0.0,
+            decimals=2,
+            min_value=0.0
+        )
+
     _ = st.form_submit_button("🧮 Calcular nueva oferta")
 
 n_new = safe_int(Y_new) * 12
 r_new_m = (R_new / 100.0) / 12.0
 
-df_new = amortization_schedule(P_new, r_new_m, n_new)
+df_new = amortization_schedule(P_new, r_new_m, n_new, rounding=redondeo_old)
 col_cuota_n = _pick_col(df_new, ["Cuota", "cuota", "Payment"])
 col_int_n   = _pick_col(df_new, ["Interés", "Interes", "Interest"])
 
@@ -255,6 +390,25 @@ m1.metric("💳 Cuota mensual nueva", eur(cuota_new))
 m2.metric("🧾 Intereses totales nueva", eur(interes_total_new))
 m3.metric("⏱️ Meses totales nueva", f"{n_new}")
 
+# TAE: la de la oferta incluye su comisión y gastos; la de tu hipoteca actual se calcula sobre lo que te queda
+# (saldo pendiente frente a las cuotas restantes), sin gastos porque ya están pagados.
+tae_new = tae_from_cashflows(loan_cashflows(
+    P_new, r_new_m, n_new, P_new * comision_new / 100.0, gastos_new, cuotas=df_new[col_cuota_n].to_numpy()
+))
+tae_old = np.nan
+if not _is_nan(saldo_pendiente_old) and saldo_pendiente_old > 0 and months_paid < n_old:
+    tae_old = tae_from_cashflows(loan_cashflows(
+        saldo_pendiente_old, r_old_m, meses_restantes_old, cuotas=df_old[col_cuota].iloc[months_paid:].to_numpy()
+    ))
+t1, t2 = st.columns(2)
+t1.metric("📈 TAE de lo que te queda (actual)", "—" if np.isnan(tae_old) else f"{fmt_number_es(tae_old * 100, 2)} %")
+t2.metric(
+    "📈 TAE nueva oferta (con comisión y gastos)",
+    "—" if np.isnan(tae_new) else f"{fmt_number_es(tae_new * 100, 2)} %",
+    delta=None if np.isnan(tae_new) or np.isnan(tae_old) else f"{fmt_number_es((tae_new - tae_old) * 100, 2)} p.p.",
+    delta_color="inverse"
+)
+
 st.divider()
 
 # -----------------------------
@@ -321,10 +475,10 @@ cmp_df = pd.DataFrame({
 })
 
 st.dataframe(
-    cmp_df.style.format({
-        "Hipoteca actual (desde hoy)": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else (eur(x) if isinstance(x, (int, float, np.number)) else x),
-        "Nueva oferta": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else (eur(x) if isinstance(x, (int, float, np.number)) else x),
-        "Diferencia (nueva - actual)": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else (eur(x) if isinstance(x, (int, float, np.number)) else x),
+    fmt_table_es(cmp_df, {
+        "Hipoteca actual (desde hoy)": "eur",
+        "Nueva oferta": "eur",
+        "Diferencia (nueva - actual)": "eur",
     }),
     use_container_width=True
 )
@@ -6,8 +6,10 @@ import pandas as pd
 import streamlit as st
 
 from common import (
-    inject_css, euro_input, eur, amortization_schedule, render_footer
+    inject_css, euro_input, eur, fmt_number_es, amortization_schedule, render_footer, fmt_table_es, SCHEDULE_FORMATS,
+    loan_cashflows, tae_from_cashflows
 )
+from importacion import infer_loan_parameters, normalize_bank_schedule, read_bank_schedule, reconcile_schedule
 
 inject_css()
 
@@ -175,6 +177,61 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Importar el cuadro del banco: deduce los datos (incluido el cambio a variable) y rellena el formulario
+importado = None
+with st.expander("📥 Importar el cuadro de amortización de tu banco (CSV/XLSX)"):
+    fichero_banco = st.file_uploader(
+        "Cuadro del banco (CSV con ';' y decimales con coma, o XLSX)",
+        type=["csv", "xlsx"],
+        key="ttm_import_file",
+        help="Columnas habituales: Nº cuota, Fecha, Cuota, Intereses, Amortización/Capital amortizado, Saldo/Capital pendiente."
+    )
+    if fichero_banco is not None:
+        try:
+            importado = normalize_bank_schedule(read_bank_schedule(fichero_banco, fichero_banco.name))
+        except ValueError as e:
+            st.error(f"No se pudo leer el cuadro: {e}")
+    if importado is not None:
+        deducido = infer_loan_parameters(importado)
+        anios_deducidos = min(max(int(math.ceil(deducido["plazo"] / 12)), 1), 40)
+        mes_cambio = deducido["mes_cambio"]
+        # El Euríbor implícito en el periodo variable del cuadro, manteniendo el diferencial del formulario
+        diff_form = float(st.session_state.get("ttm_diff_old", 1.00))
+        euribor_deducido = min(max(round(deducido["tin_2"] - diff_form, 3), -2.0), 10.0)
+
+        def _prefill_from_import():
+            # euro_input -> st.text_input -> guardar STRING
+            st.session_state["ttm_p_old_eur"] = f"{deducido['principal']:.2f}"
+            st.session_state["ttm_y_old"] = anios_deducidos
+            st.session_state["ttm_r1_old"] = round(deducido["tin_1"], 3)
+            if mes_cambio is not None:
+                st.session_state["ttm_change_year_old"] = min(int(round(mes_cambio / 12)), anios_deducidos)
+                st.session_state["ttm_euribor_old"] = euribor_deducido
+            if deducido["meses_pagados"] is not None:
+                st.session_state["ttm_months_paid"] = min(deducido["meses_pagados"], anios_deducidos * 12)
+
+        st.markdown(
+            f"**{deducido['filas']} cuotas leídas.** Importe inicial: **{eur(deducido['principal'])}** · "
+            f"Plazo: **{deducido['plazo']} meses** · "
+            f"Meses pagados: **{'—' if deducido['meses_pagados'] is None else deducido['meses_pagados']}**"
+        )
+        if mes_cambio is not None:
+            st.markdown(
+                f"Periodo 1: **{fmt_number_es(deducido['tin_1'], 3)} %** hasta la cuota {mes_cambio} · "
+                f"Periodo 2: **{fmt_number_es(deducido['tin_2'], 3)} %** "
+                f"(= Euríbor {fmt_number_es(euribor_deducido, 3)} % + diferencial {fmt_number_es(diff_form, 2)} %)."
+            )
+            if mes_cambio % 12:
+                st.caption(f"El cambio no cae en un aniversario: se redondea al año {int(round(mes_cambio / 12))}.")
+        else:
+            st.info(
+                f"El cuadro tiene un único tipo ({fmt_number_es(deducido['tin'], 3)} %): solo se rellena el periodo 1. "
+                "Indica tú el año de cambio y el Euríbor estimado."
+            )
+        if deducido["plazo"] % 12:
+            st.caption(f"El plazo no es un número entero de años: se redondea a {anios_deducidos} años.")
+        st.button("✨ Rellenar con los datos del cuadro", on_click=_prefill_from_import, key="ttm_btn_import")
+
 _ensure_text_state("ttm_p_old_eur")
 
 with st.form("form_old_mixed", clear_on_submit=False):
@@ -324,10 +381,30 @@ with st.expander("Ver resumen de tu hipoteca actual (detalle)"):
         ]
     })
     st.dataframe(
-        old_summary.style.format({"Valor": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else eur(x)}),
+        fmt_table_es(old_summary, {"Valor": "eur"}),
         use_container_width=True
     )
 
+if importado is not None:
+    with st.expander("🧮 Conciliación: cuadro del banco frente a nuestro cálculo"):
+        conciliacion = reconcile_schedule(importado, df_old)
+        diferencias = conciliacion[["Δ Cuota", "Δ Intereses", "Δ Saldo final"]].abs()
+        descuadres = int((diferencias.max(axis=1) >= 0.01).sum())
+        k1, k2, k3 = st.columns(3)
+        k1.metric("Cuotas comparadas", f"{len(conciliacion)}")
+        k2.metric("Cuotas con diferencias (≥ 1 céntimo)", f"{descuadres}")
+        k3.metric("Diferencia máxima de saldo", eur(float(diferencias["Δ Saldo final"].max())))
+        formatos = {c: "eur" for c in conciliacion.columns if c not in ("Mes", "Fecha")}
+        st.dataframe(
+            fmt_table_es(conciliacion, {**formatos, "Fecha": "fecha"}),
+            use_container_width=True,
+            hide_index=True
+        )
+        st.caption(
+            "Δ = nuestro cálculo − banco. Nuestro cálculo no redondea al céntimo: son normales diferencias de "
+            "unos céntimos; descuadres mayores indican datos distintos en el formulario."
+        )
+
 st.divider()
 
 # ============================================================
@@ -402,6 +479,21 @@ with st.form("form_new_mixed", clear_on_submit=False):
             min_value=0.0, max_value=30.0, value=2.75, step=0.05, format="%.2f", key="ttm_r1_new"
         )
 
+    e1n, e2n = st.columns(2)
+    with e1n:
+        comision_new = st.number_input(
+            "Comisión de apertura de la oferta (%)",
+            min_value=0.0, max_value=5.0, value=0.0, step=0.05, format="%.2f", key="ttm_com_new"
+        )
+    with e2n:
+        gastos_new = euro_input(
+            "Gastos iniciales de la oferta (tasación, notaría, gestoría...) (€)",
+            key="ttm_gastos_new_eur",
+            default=0.0,
+            decimals=2,
+            min_value=0.0
+        )
+
     d1n, d2n, d3n = st.columns([1, 1, 1])
     with d1n:
         diff_new = st.number_input(
@@ -442,6 +534,26 @@ m3c.metric("💡 Intereses periodo 1 (nueva)", eur(ip1_new))
 m4c.metric("💡 Intereses periodo 2 (nueva)", eur(ip2_new))
 m5c.metric("📌 Intereses totales (nueva)", eur(interes_total_new))
 
+# TAE con el Euríbor estimado constante (como la TAE variable que publican los bancos con el índice actual).
+# La de la oferta incluye su comisión y gastos; la de tu hipoteca actual se calcula sobre lo que te queda
+# (saldo pendiente frente a las cuotas restantes), sin gastos porque ya están pagados.
+tae_new = tae_from_cashflows(loan_cashflows(
+    P_new, r1_new_m, n_new, P_new * comision_new / 100.0, gastos_new, cuotas=df_new["Cuota"].to_numpy()
+))
+tae_old = np.nan
+if not _is_nan(saldo_pendiente_old) and saldo_pendiente_old > 0 and months_paid < len(df_old):
+    tae_old = tae_from_cashflows(loan_cashflows(
+        saldo_pendiente_old, r1_old_m, meses_restantes_old, cuotas=df_old["Cuota"].iloc[months_paid:].to_numpy()
+    ))
+t1, t2 = st.columns(2)
+t1.metric("📈 TAE de lo que te queda (actual)", "—" if np.isnan(tae_old) else f"{fmt_number_es(tae_old * 100, 2)} %")
+t2.metric(
+    "📈 TAE nueva oferta (con comisión y gastos)",
+    "—" if np.isnan(tae_new) else f"{fmt_number_es(tae_new * 100, 2)} %",
+    delta=None if np.isnan(tae_new) or np.isnan(tae_old) else f"{fmt_number_es((tae_new - tae_old) * 100, 2)} p.p.",
+    delta_color="inverse"
+)
+
 st.caption(
     f"Nueva oferta: Periodo 1: {m1_new} meses a {r1_new:.2f}% · "
     f"Periodo 2: {max(n_new-m1_new,0)} meses a (Euríbor {euribor_new:.2f}% + dif {diff_new:.2f}%) = {r2_new_pct:.2f}% (estimado)."
@@ -543,10 +655,10 @@ cmp_df = pd.DataFrame({
 })
 
 st.dataframe(
-    cmp_df.style.format({
-        "Hipoteca actual (desde hoy)": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else (eur(x) if isinstance(x, (int, float, np.number)) else x),
-        "Nueva oferta": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else (eur(x) if isinstance(x, (int, float, np.number)) else x),
-        "Diferencia (nueva - actual)": lambda x: "—" if (isinstance(x, float) and np.isnan(x)) else (eur(x) if isinstance(x, (int, float, np.number)) else x),
+    fmt_table_es(cmp_df, {
+        "Hipoteca actual (desde hoy)": "eur",
+        "Nueva oferta": "eur",
+        "Diferencia (nueva - actual)": "eur",
     }),
     use_container_width=True
 )
@@ -558,7 +670,7 @@ with st.expander("Ver detalle alrededor del cambio (actual)"):
         i0 = max(m1_old - 6, 0)
         i1 = min(m1_old + 6, len(df_old))
         st.dataframe(
-            df_old.iloc[i0:i1].style.format({"Cuota": eur, "Intereses": eur, "Amortización": eur, "Saldo final": eur}),
+            fmt_table_es(df_old.iloc[i0:i1], SCHEDULE_FORMATS),
             use_container_width=True
         )
 
@@ -569,7 +681,7 @@ with st.expander("Ver detalle alrededor del cambio (nueva)"):
         i0 = max(m1_new - 6, 0)
         i1 = min(m1_new + 6, len(df_new))
         st.dataframe(
-            df_new.iloc[i0:i1].style.format({"Cuota": eur, "Intereses": eur, "Amortización": eur, "Saldo final": eur}),
+            fmt_table_es(df_new.iloc[i0:i1], SCHEDULE_FORMATS),
             use_container_width=True
         )
 